@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Load test / latency benchmark for the Handbook Chatbot API
+Drives POST /api/chatbot/chat/ and GET /api/chatbot/courses/ with many
+concurrent clients and reports throughput and p50/p95/p99 latency per endpoint,
+plus per-stage percentiles from the chat endpoint's Server-Timing header.
+
+Two load models:
+- closed loop (default): --concurrency clients each send the next request as
+  soon as the previous one finishes
+- open loop (--rate R): requests arrive as a Poisson process at R/s, at most
+  --concurrency in flight (queueing delay counts toward latency)
+
+With --spawn it starts everything it needs locally and offline: the fake
+Ollama (src/bench/fake_ollama.py), the fake Qdrant (src/bench/fake_qdrant.py)
+and the API server pointed at them (only the embedding model is real). Queries
+and arrivals are seeded, so results are comparable between commits.
+
+Usage:
+    python bench_api.py --spawn --requests 200 --concurrency 16
+    python bench_api.py --spawn --rate 5 --duration 60 --mix chat=3,courses=1
+    python bench_api.py --base_url http://localhost:8000 --concurrency 4   # against a running server
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).parent.resolve()
+
+DEFAULT_QUERIES = [
+    {"message": "What are the admission requirements for C10302?"},
+    {"message": "What career options does C10302 lead to?"},
+    {"message": "How many credit points is the Bachelor of Accounting?"},
+    {"message": "Which majors are available in the Bachelor of Science?"},
+    {"message": "What are the learning outcomes of C04379?"},
+    {"message": "Is there an honours year in engineering?"},
+    {"message": "What is the course structure of the Bachelor of Laws?"},
+    {"message": "Can I study the Master of Data Science part time?"},
+    {"message": "What are the inherent requirements for nursing?"},
+    {"message": "Where is the Bachelor of Design in Architecture taught?"},
+    {"message": "What does the course overview say about C10352?", "course_code": "C10352"},
+    {"message": "What professional recognition does the accounting degree have?"},
+]
+
+
+# ---------- Spawned services ----------
+
+def _wait_ready(url: str, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def spawn_services(args) -> List[subprocess.Popen]:
+    """Start fake Ollama, fake Qdrant and the API server; returns the processes"""
+    log_dir = Path(tempfile.mkdtemp(prefix="handbook-bench-"))
+    print(f"📝 Service logs: {log_dir}")
+    procs = []
+    
+    def start(name, cmd, env=None):
+        log = open(log_dir / f"{name}.log", "w")
+        procs.append(subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT))
+    
+    ollama_ports = [args.ollama_port + i for i in range(args.ollama_instances)]
+    for i, port in enumerate(ollama_ports):
+        start(f"fake_ollama_{port}" if i else "fake_ollama",
+              [sys.executable, "src/bench/fake_ollama.py",
+               "--port", str(port),
+               "--tokens_per_s", str(args.tokens_per_s),
+               "--ttft_ms", str(args.ttft_ms),
+               "--n_tokens", str(args.n_tokens),
+               "--cold_load_ms", str(args.cold_load_ms),
+               "--tail_rate", str(args.tail_rate),
+               "--tail_ms", str(args.tail_ms),
+               "--seed", str(i)])
+    start("fake_qdrant", [sys.executable, "src/bench/fake_qdrant.py",
+                          "--port", str(args.qdrant_port),
+                          "--latency_ms", str(args.qdrant_latency_ms)])
+    
+    env = dict(os.environ,
+               HANDBOOK_QDRANT_HOST="127.0.0.1", HANDBOOK_QDRANT_PORT=str(args.qdrant_port),
+               HANDBOOK_OLLAMA_HOST="127.0.0.1", HANDBOOK_OLLAMA_PORT=str(args.ollama_port),
+               HANDBOOK_OLLAMA_HOSTS=",".join(f"127.0.0.1:{port}" for port in ollama_ports),
+               HANDBOOK_READY_RETRY_S="0.5")
+    if not args.answer_cache:
+        # Otherwise repeated benchmark queries only measure the cache
+        env["HANDBOOK_ANSWER_CACHE_SIZE"] = "0"
+    if not args.fact_answers:
+        # Fact questions would skip the pipeline being measured
+        env["HANDBOOK_FACT_ANSWERS"] = "0"
+    start("api_server", [sys.executable, "-m", "uvicorn", "api_server:app",
+                         "--app-dir", "src", "--host", "127.0.0.1",
+                         "--port", str(args.api_port), "--log-level", "warning"], env=env)
+    
+    if not _wait_ready(f"{args.base_url}/ready", args.ready_timeout):
+        stop_services(procs)
+        raise SystemExit(f"❌ API server not ready after {args.ready_timeout}s (see logs in {log_dir})")
+    print("✅ Services ready")
+    return procs
+
+
+def stop_services(procs: List[subprocess.Popen]):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# ---------- Requests ----------
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """'embed;dur=12.3, search;dur=8.1' -> {'embed': 12.3, 'search': 8.1}"""
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    stages[name] = float(value)
+                except ValueError:
+                    pass
+    return stages
+
+
+class Bench:
+    """Sends requests and records one result per request"""
+    
+    def __init__(self, http: httpx.AsyncClient, base_url: str, queries: List[Dict],
+                 conditional: bool, seed: int):
+        self.http = http
+        self.base_url = base_url
+        self.queries = queries
+        self.conditional = conditional
+        self.rng = random.Random(seed)
+        self.etag: Optional[str] = None
+        self.results: List[Dict] = []
+    
+    async def chat(self) -> Dict:
+        body = dict(self.rng.choice(self.queries))
+        r = await self.http.post(f"{self.base_url}/api/chatbot/chat/", json=body)
+        ok = r.status_code == 200 and r.json().get("success", False)
+        return {"status": r.status_code, "ok": ok,
+                "stages": parse_server_timing(r.headers.get("server-timing"))}
+    
+    async def courses(self) -> Dict:
+        headers = {"If-None-Match": self.etag} if self.conditional and self.etag else {}
+        r = await self.http.get(f"{self.base_url}/api/chatbot/courses/", headers=headers)
+        if r.headers.get("etag"):
+            self.etag = r.headers["etag"]
+        return {"status": r.status_code, "ok": r.status_code in (200, 304), "stages": {}}
+    
+    async def run_one(self, endpoint: str, scheduled: float = None):
+        started = time.perf_counter()
+        try:
+            result = await getattr(self, endpoint)()
+        except Exception as e:
+            result = {"status": None, "ok": False, "stages": {}, "error": f"{type(e).__name__}: {e}"}
+        finished = time.perf_counter()
+        # Open loop: latency counts from the scheduled arrival, including queueing
+        result.update(endpoint=endpoint,
+                      latency_ms=(finished - (scheduled or started)) * 1000,
+                      finished=finished)
+        self.results.append(result)
+
+
+async def closed_loop(bench: Bench, endpoints: List[str], concurrency: int,
+                      n_requests: Optional[int], duration: Optional[float]):
+    deadline = time.perf_counter() + duration if duration else None
+    remaining = [n_requests] if n_requests else None
+    
+    async def client():
+        while True:
+            if deadline and time.perf_counter() >= deadline:
+                return
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            await bench.run_one(bench.rng.choice(endpoints))
+    
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+
+async def open_loop(bench: Bench, endpoints: List[str], rate: float, concurrency: int,
+                    n_requests: Optional[int], duration: Optional[float]):
+    slots = asyncio.Semaphore(concurrency)
+    tasks = []
+    start = time.perf_counter()
+    next_at = start
+    sent = 0
+    
+    async def fire(endpoint, scheduled):
+        async with slots:
+            await bench.run_one(endpoint, scheduled)
+    
+    while (n_requests is None or sent < n_requests) and (duration is None or next_at - start < duration):
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(fire(bench.rng.choice(endpoints), next_at)))
+        sent += 1
+        next_at += bench.rng.expovariate(rate)
+    await asyncio.gather(*tasks)
+
+
+# ---------- Report ----------
+
+def percentile(values: List[float], p: float) -> float:
+    """Linear-interpolated percentile (p in 0-100)"""
+    if not values:
+        return float("nan")
+    xs = sorted(values)
+    k = (len(xs) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(values),
+        "mean": sum(values) / len(values) if values else float("nan"),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else float("nan"),
+    }
+
+
+def build_report(results: List[Dict], wall_s: float) -> Dict:
+    report = {"wall_s": wall_s, "requests": len(results),
+              "throughput_rps": len(results) / wall_s if wall_s else 0.0, "endpoints": {}}
+    for endpoint in sorted({r["endpoint"] for r in results}):
+        rs = [r for r in results if r["endpoint"] == endpoint]
+        ok = [r for r in rs if r["ok"]]
+        stage_names = sorted({s for r in ok for s in r["stages"]})
+        errors = {}
+        for r in rs:
+            if not r["ok"]:
+                key = r.get("error") or f"HTTP {r['status']}"
+                errors[key] = errors.get(key, 0) + 1
+        report["endpoints"][endpoint] = {
+            "requests": len(rs),
+            "errors": len(rs) - len(ok),
+            "error_kinds": errors,
+            "throughput_rps": len(ok) / wall_s if wall_s else 0.0,
+            "latency_ms": summarize([r["latency_ms"] for r in ok]),
+            "stages_ms": {s: summarize([r["stages"][s] for r in ok if s in r["stages"]])
+                          for s in stage_names},
+        }
+    return report
+
+
+def print_report(report: Dict):
+    print(f"\n{'='*78}")
+    print(f"{report['requests']} requests in {report['wall_s']:.1f}s "
+          f"({report['throughput_rps']:.2f} req/s)")
+    print(f"{'='*78}")
+    row = "  {:<18}{:>7}{:>10}{:>10}{:>10}{:>10}{:>10}"
+    for endpoint, ep in report["endpoints"].items():
+        print(f"\n{endpoint}: {ep['requests']} requests, {ep['errors']} errors, "
+              f"{ep['throughput_rps']:.2f} ok/s")
+        for kind, count in ep["error_kinds"].items():
+            print(f"  ❌ {count} x {kind}")
+        print(row.format("(ms)", "n", "mean", "p50", "p95", "p99", "max"))
+        for name, s in [("latency", ep["latency_ms"])] + [(f"  {k}", v) for k, v in ep["stages_ms"].items()]:
+            print(row.format(name, s["n"], *(f"{s[k]:.1f}" for k in ("mean", "p50", "p95", "p99", "max"))))
+
+
+# ---------- CLI ----------
+
+def parse_mix(mix: str) -> List[str]:
+    """'chat=3,courses=1' -> ['chat', 'chat', 'chat', 'courses']"""
+    endpoints = []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("chat", "courses"):
+            raise SystemExit(f"Unknown endpoint in --mix: {name}")
+        endpoints += [name] * int(weight or 1)
+    return endpoints
+
+
+async def run(args):
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    endpoints = parse_mix(args.mix)
+    n_requests = args.requests if args.requests or args.duration else 100
+    
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as http:
+        if args.warmup:
+            print(f"🔥 Warm-up: {args.warmup} requests")
+            warm = Bench(http, args.base_url, queries, args.conditional, args.seed + 1)
+            await closed_loop(warm, endpoints, min(args.concurrency, args.warmup), args.warmup, None)
+        
+        bench = Bench(http, args.base_url, queries, args.conditional, args.seed)
+        mode = f"open loop at {args.rate}/s" if args.rate else "closed loop"
+        print(f"🚀 {mode}, concurrency {args.concurrency}, mix {args.mix}, "
+              f"{f'{n_requests} requests' if n_requests else f'{args.duration}s'}")
+        started = time.perf_counter()
+        if args.rate:
+            await open_loop(bench, endpoints, args.rate, args.concurrency, n_requests, args.duration)
+        else:
+            await closed_loop(bench, endpoints, args.concurrency, n_requests, args.duration)
+        wall_s = time.perf_counter() - started
+    
+    report = build_report(bench.results, wall_s)
+    report["config"] = {k: v for k, v in vars(args).items()}
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Wrote report → {args.json}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent latency benchmark for the Handbook Chatbot API')
+    parser.add_argument('--base_url', default=None, help='API to benchmark (default: the spawned one, or http://localhost:8000)')
+    parser.add_argument('--mix', default='chat=1,courses=1', help='Endpoint weights, e.g. chat=3,courses=1')
+    parser.add_argument('--concurrency', type=int, default=8, help='Clients (closed loop) or max in flight (open loop)')
+    parser.add_argument('--rate', type=float, default=None, help='Open-loop Poisson arrival rate (requests/s)')
+    parser.add_argument('--requests', type=int, default=None, help='Number of requests (default 100 unless --duration)')
+    parser.add_argument('--duration', type=float, default=None, help='Run for this many seconds instead')
+    parser.add_argument('--warmup', type=int, default=10, help='Requests sent (and discarded) before measuring')
+    parser.add_argument('--queries', default=None, help='JSONL of chat request bodies (default: built-in set)')
+    parser.add_argument('--conditional', action='store_true', help='Revalidate courses with If-None-Match like a browser')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for query choice and arrivals')
+    parser.add_argument('--timeout', type=float, default=300.0, help='Per-request timeout (s)')
+    parser.add_argument('--json', default=None, help='Also write the report to this file')
+    
+    spawn = parser.add_argument_group('spawned services (--spawn)')
+    spawn.add_argument('--spawn', action='store_true', help='Start fake Ollama, fake Qdrant and the API server locally')
+    spawn.add_argument('--api_port', type=int, default=8010)
+    spawn.add_argument('--ollama_port', type=int, default=11435)
+    spawn.add_argument('--ollama_instances', type=int, default=1,
+                       help='Fake Ollama servers on consecutive ports (the API server balances over them)')
+    spawn.add_argument('--qdrant_port', type=int, default=6334)
+    spawn.add_argument('--tokens_per_s', type=float, default=40.0, help='Fake Ollama generation speed')
+    spawn.add_argument('--ttft_ms', type=float, default=300.0, help='Fake Ollama delay before the first token')
+    spawn.add_argument('--n_tokens', type=int, default=120, help='Fake Ollama tokens per answer')
+    spawn.add_argument('--cold_load_ms', type=float, default=0.0,
+                       help='Fake Ollama model load time when the model is not resident')
+    spawn.add_argument('--tail_rate', type=float, default=0.0, help='Share of fake Ollama requests that stall')
+    spawn.add_argument('--tail_ms', type=float, default=0.0, help='Fake Ollama stall before the first token')
+    spawn.add_argument('--qdrant_latency_ms', type=float, default=0.0, help='Extra fake Qdrant search latency')
+    spawn.add_argument('--answer_cache', action='store_true', help='Keep the answer cache enabled')
+    spawn.add_argument('--fact_answers', action='store_true', help='Keep the fact fast path enabled')
+    spawn.add_argument('--ready_timeout', type=float, default=300.0, help='Seconds to wait for /ready')
+    args = parser.parse_args()
+    
+    if args.base_url is None:
+        args.base_url = f"http://127.0.0.1:{args.api_port}" if args.spawn else "http://localhost:8000"
+    
+    procs = spawn_services(args) if args.spawn else []
+    try:
+        asyncio.run(run(args))
+    finally:
+        stop_services(procs)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Vector quantization benchmark for the course collection
+Compares int8 and binary quantization (with oversampling and optional float32
+rescoring) and the two-stage Matryoshka search (truncated 128/256-d first
+pass, full-vector rescoring), see src/rag/collection_schema.py, against the
+unquantized baseline on our own queries, and reports per configuration:
+- memory: bytes of vectors searched in RAM (the float32 originals of a
+  quantized / Matryoshka collection are only read for rescoring)
+- p50/p95 search latency
+- recall@k: overlap with the exact float32 top k
+
+Queries are the bench_api.py set (or --queries, JSONL of chat request bodies,
+course_code filters included) plus --name_queries questions built from course
+names, embedded once with the real embedding model.
+
+Backends:
+- local (default): LocalVectorIndex over --kb_dir, no servers needed
+- qdrant: builds one collection per variant on a running Qdrant
+  (<collection>_bench_none, ..._int8, ..._binary, ..._mrl256) and deletes them afterwards
+
+Usage:
+    python bench_quantization.py --kb_dir data/processed/courses
+    python bench_quantization.py --backend qdrant --oversampling 1,2,4 --json quant.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+ROOT = Path(__file__).parent.resolve()
+sys.path.insert(0, str(ROOT / "src" / "rag"))
+
+from bench_api import DEFAULT_QUERIES, percentile
+from collection_schema import FULL_VECTOR, MRL_VECTOR, QUANTIZATIONS, create_collection, search_params
+from local_search import LocalVectorIndex, LocalSearchClient, truncate_embeddings
+from query_hybrid_rag import build_course_filter, mrl_search
+
+DEFAULT_KB_DIR = ROOT / "data" / "processed" / "courses"
+DEFAULT_EMBED_DIR = ROOT / "models" / "hf" / "qwen3-embedding-0.6b"
+
+
+# ---------- Queries ----------
+
+def load_queries(path: str, index: LocalVectorIndex, name_queries: int, seed: int) -> List[Dict]:
+    """Chat request bodies: the benchmark set plus questions about random course names"""
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    else:
+        queries = list(DEFAULT_QUERIES)
+    names = sorted({p.get("course_name") for p in index.payloads if p.get("course_name")})
+    rng = np.random.default_rng(seed)
+    for name in rng.choice(names, size=min(name_queries, len(names)), replace=False) if names else []:
+        queries.append({"message": f"What will I study in the {name}?"})
+    return queries
+
+
+def memory_bytes(n: int, dim: int, quantization: str, mrl_dim: int = 0) -> int:
+    """Vector bytes kept in RAM for n points"""
+    if mrl_dim:
+        return n * mrl_dim * 4
+    if quantization == "int8":
+        return n * dim
+    if quantization == "binary":
+        return n * ((dim + 7) // 8)
+    return n * dim * 4
+
+
+# ---------- Runs ----------
+
+def configurations(oversampling: List[float], mrl_dims: List[int]) -> List[Dict]:
+    configs = [{"quantization": "none", "mrl_dim": 0, "oversampling": None, "rescore": True}]
+    for quantization in QUANTIZATIONS[1:]:
+        for factor in oversampling:
+            for rescore in (True, False):
+                if not rescore and factor != oversampling[0]:
+                    continue  # without rescoring only the first `limit` candidates are used
+                configs.append({"quantization": quantization, "mrl_dim": 0,
+                                "oversampling": factor, "rescore": rescore})
+    for mrl_dim in mrl_dims:
+        for factor in oversampling:
+            configs.append({"quantization": "none", "mrl_dim": mrl_dim, "oversampling": factor, "rescore": True})
+    return configs
+
+
+def variant(config: Dict) -> str:
+    """Collection / index variant a configuration runs on"""
+    return f"mrl{config['mrl_dim']}" if config["mrl_dim"] else config["quantization"]
+
+
+def measure(client, collection: str, vectors: np.ndarray, filters: List, truth: List[set],
+            k: int, config: Dict, repeat: int) -> Dict:
+    mrl_dim = config["mrl_dim"]
+    params = None if mrl_dim else search_params(config["oversampling"], config["rescore"])
+    latencies, recalls = [], []
+    for qv, flt, expected in zip(vectors, filters, truth):
+        for i in range(repeat):
+            started = time.perf_counter()
+            if mrl_dim:
+                hits = mrl_search(client, collection, qv, flt, k, mrl_dim, config["oversampling"])
+            else:
+                hits = client.search(collection_name=collection, query_vector=qv.tolist(), query_filter=flt,
+                                     limit=k, with_payload=False, search_params=params)
+            latencies.append((time.perf_counter() - started) * 1000)
+        if expected:
+            recalls.append(len(expected & {hit.id for hit in hits}) / len(expected))
+    return {
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "recall": float(np.mean(recalls)) if recalls else float("nan"),
+    }
+
+
+def run_local(args, baseline: LocalVectorIndex, vectors, filters, truth, configs) -> List[Dict]:
+    results = []
+    indexes = {"none": baseline}
+    for config in configs:
+        name = variant(config)
+        if name not in indexes:
+            indexes[name] = LocalVectorIndex(args.kb_dir, payloads=baseline.payloads,
+                                             quantization=config["quantization"], mrl_dim=config["mrl_dim"])
+        index = indexes[name]
+        client = LocalSearchClient(index, args.collection)
+        measure(client, args.collection, vectors[:1], filters[:1], truth[:1], args.k, config, 1)  # warm up
+        result = measure(client, args.collection, vectors, filters, truth, args.k, config, args.repeat)
+        results.append(config | result | {"memory_bytes": index.search_bytes})
+    return results
+
+
+def run_qdrant(args, baseline: LocalVectorIndex, vectors, filters, truth, configs) -> List[Dict]:
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models as qm
+    
+    client_kwargs = dict(host=args.qdrant_host, port=args.qdrant_port)
+    if args.skip_version_check:
+        client_kwargs["check_compatibility"] = False
+    cli = QdrantClient(**client_kwargs)
+    
+    n, dim = len(baseline), baseline.dim
+    collections = {}
+    try:
+        for config in configs:
+            if variant(config) in collections:
+                continue
+            quantization, mrl_dim = config["quantization"], config["mrl_dim"]
+            name = f"{args.collection}_bench_{variant(config)}"
+            print(f"📦 Building '{name}' ({n} x {dim}, {variant(config)}) ...")
+            create_collection(cli, name, dim, recreate=True, quantization=quantization, mrl_dim=mrl_dim)
+            for i in range(0, n, args.batch):
+                rows = np.arange(i, min(i + args.batch, n))
+                full = np.asarray(baseline.matrix[rows], dtype=np.float32)
+                vectors_batch = full.tolist()
+                if mrl_dim:
+                    vectors_batch = {FULL_VECTOR: vectors_batch,
+                                     MRL_VECTOR: truncate_embeddings(full, mrl_dim).tolist()}
+                cli.upsert(collection_name=name, wait=True, points=qm.Batch(
+                    ids=rows.tolist(),
+                    vectors=vectors_batch,
+                    payloads=[{k: v for k, v in baseline.payloads[r].items() if k != "text"} for r in rows],
+                ))
+            collections[variant(config)] = name
+        
+        results = []
+        for config in configs:
+            name = collections[variant(config)]
+            measure(cli, name, vectors[:1], filters[:1], truth[:1], args.k, config, 1)  # warm up
+            result = measure(cli, name, vectors, filters, truth, args.k, config, args.repeat)
+            results.append(config | result | {
+                "memory_bytes": memory_bytes(n, dim, config["quantization"], config["mrl_dim"])})
+        return results
+    finally:
+        if not args.keep:
+            for name in collections.values():
+                cli.delete_collection(name)
+
+
+# ---------- Report ----------
+
+def print_report(results: List[Dict], n_queries: int, k: int, backend: str):
+    print(f"\n{'='*78}")
+    print(f"{backend}: {n_queries} queries, recall@{k} vs exact float32 search")
+    print(f"{'='*78}")
+    row = "  {:<10}{:>8}{:>9}{:>12}{:>10}{:>10}{:>10}"
+    print(row.format("vectors", "overs.", "rescore", "memory MiB", "p50 ms", "p95 ms", "recall"))
+    for r in results:
+        print(row.format(
+            variant(r),
+            "-" if r["oversampling"] is None else f"{r['oversampling']:g}",
+            "full" if r["mrl_dim"] else "-" if r["quantization"] == "none" else ("yes" if r["rescore"] else "no"),
+            f"{r['memory_bytes'] / 2**20:.2f}",
+            f"{r['p50_ms']:.2f}", f"{r['p95_ms']:.2f}", f"{r['recall']:.3f}",
+        ))
+
+
+# ---------- CLI ----------
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory / latency / recall of quantized vector search')
+    parser.add_argument('--kb_dir', default=str(DEFAULT_KB_DIR), help='Folder with embeddings.npy + payloads.jsonl')
+    parser.add_argument('--embed_dir', default=os.environ.get('HANDBOOK_EMBED_DIR', str(DEFAULT_EMBED_DIR)),
+                        help='Embedding model directory')
+    parser.add_argument('--queries', default=None, help='JSONL of chat request bodies (default: bench_api.py set)')
+    parser.add_argument('--name_queries', type=int, default=100, help='Extra questions built from course names')
+    parser.add_argument('--k', type=int, default=30, help='Results per search (the API server retrieves 30)')
+    parser.add_argument('--oversampling', default='1,2,4', help='Comma-separated oversampling factors')
+    parser.add_argument('--mrl_dims', default='128,256', help='Matryoshka first-pass sizes (empty = skip)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed searches per query')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the course-name queries')
+    parser.add_argument('--backend', default='local', choices=['local', 'qdrant'])
+    parser.add_argument('--collection', default='courses', help='Collection name (prefix of the qdrant ones)')
+    parser.add_argument('--qdrant_host', default='localhost')
+    parser.add_argument('--qdrant_port', type=int, default=6333)
+    parser.add_argument('--batch', type=int, default=256, help='Upsert batch size (qdrant)')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark collections (qdrant)')
+    parser.add_argument('--skip_version_check', action='store_true',
+                        help='Skip qdrant-client/server compatibility check (useful if client > server).')
+    parser.add_argument('--json', default=None, help='Also write the report to this file')
+    args = parser.parse_args()
+    
+    baseline = LocalVectorIndex(args.kb_dir)
+    queries = load_queries(args.queries, baseline, args.name_queries, args.seed)
+    
+    from sentence_transformers import SentenceTransformer
+    encoder = SentenceTransformer(args.embed_dir)
+    vectors = encoder.encode([q["message"] for q in queries], prompt_name="query",
+                             normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+    filters = [build_course_filter(q.get("course_code"), q.get("course_name")) for q in queries]
+    truth = [{hit.id for hit in baseline.search(qv, limit=args.k, query_filter=flt, with_payload=False)}
+             for qv, flt in zip(vectors, filters)]
+    
+    configs = configurations([float(x) for x in args.oversampling.split(",") if x.strip()],
+                             [int(x) for x in args.mrl_dims.split(",") if x.strip()])
+    run = run_qdrant if args.backend == "qdrant" else run_local
+    results = run(args, baseline, vectors, filters, truth, configs)
+    
+    print_report(results, len(queries), args.k, args.backend)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"backend": args.backend, "queries": len(queries), "k": args.k,
+                       "points": len(baseline), "dim": baseline.dim, "results": results}, f, indent=2)
+        print(f"\nReport written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
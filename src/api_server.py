@@ -10,6 +10,14 @@ where all the RAG dependencies (sentence-transformers, qdrant-client, ollama) ar
 import sys
 import os
 import re
+import json
+import base64
+import hashlib
+import hmac
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 # Add the rag directory to the path so we can import query functions
@@ -17,16 +25,33 @@ HANDBOOK_ROOT = Path(os.environ.get('HANDBOOK_ROOT', Path(__file__).parent.paren
 RAG_DIR = HANDBOOK_ROOT / "src" / "rag"
 sys.path.insert(0, str(RAG_DIR))
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 import traceback
 
 # Import the query functions
 try:
-    from query_hybrid_rag import query_courses
-    from query_with_preprocessing import query_with_full_pipeline
+    from query_encoder import QueryEncoder
+    from answer_cache import AnswerCache
+    from course_catalog import CourseCatalog
+    from course_aliases import CourseAliasIndex
+    from fact_answers import FactAnswerer
+    from session_store import SessionStore, make_backend
+    from followup_reuse import FollowupReuse
+    import metrics
+    from admission import AdmissionController, AdmissionRejected, parse_client_limits
+    from async_pipeline import RagPipeline, RagRun
+    from ollama_client import OllamaClient, OllamaPool, parse_endpoints
+    from query_hybrid_rag import build_ollama_messages
+    from context_packer import ContextPacker, tokenizer_counter
+    from filtered_retrieval import DEFAULT_FIELDS, PREVIEW_CHARS, payload_keys, search_result
+    from sparse_index import BM25Index, INDEX_FILE
+    from collection_schema import schema_problems, search_params
+    from local_search import LocalVectorIndex, AsyncLocalSearchClient
     print("✅ Successfully imported RAG query functions")
 except ImportError as e:
     print(f"❌ Warning: Could not import query functions: {e}")
@@ -34,7 +59,373 @@ except ImportError as e:
     print("Required packages: sentence-transformers, qdrant-client, ollama, etc.")
     raise
 
-app = FastAPI(title="Handbook Chatbot API", version="1.0.0")
+
+# Default configuration - use environment variables or relative paths
+DEFAULT_EMBED_DIR = os.environ.get('HANDBOOK_EMBED_DIR', str(HANDBOOK_ROOT / "models" / "hf" / "qwen3-embedding-0.6b"))
+DEFAULT_COLLECTION = os.environ.get('HANDBOOK_DEFAULT_COLLECTION', "courses")
+DEFAULT_K = int(os.environ.get('HANDBOOK_K', 30))
+DEFAULT_TOPN = int(os.environ.get('HANDBOOK_TOPN', 8))
+DEFAULT_MODEL = os.environ.get('HANDBOOK_MODEL', "qwen2.5:7b")
+QDRANT_HOST = os.environ.get('HANDBOOK_QDRANT_HOST', "localhost")
+QDRANT_PORT = int(os.environ.get('HANDBOOK_QDRANT_PORT', 6333))
+OLLAMA_HOST = os.environ.get('HANDBOOK_OLLAMA_HOST', "127.0.0.1")
+OLLAMA_PORT = int(os.environ.get('HANDBOOK_OLLAMA_PORT', 11434))
+OLLAMA_HOSTS = parse_endpoints(os.environ.get('HANDBOOK_OLLAMA_HOSTS', ""))  # "gpu1:11434,gpu2:11434"; empty = OLLAMA_HOST:PORT
+OLLAMA_POOL_SIZE = int(os.environ.get('HANDBOOK_OLLAMA_POOL_SIZE', 16))
+OLLAMA_TIMEOUT = float(os.environ.get('HANDBOOK_OLLAMA_TIMEOUT_S', 180))
+OLLAMA_KEEP_ALIVE = os.environ.get('HANDBOOK_OLLAMA_KEEP_ALIVE', "30m")  # how long Ollama keeps the model loaded; -1 = forever
+OLLAMA_WARMUP = os.environ.get('HANDBOOK_OLLAMA_WARMUP', "1") == "1"  # load the model before reporting ready
+OLLAMA_KEEP_WARM_S = float(os.environ.get('HANDBOOK_OLLAMA_KEEP_WARM_S', 600))  # ping after this long idle; 0 = off
+OLLAMA_MAX_FAILS = int(os.environ.get('HANDBOOK_OLLAMA_MAX_FAILS', 3))  # consecutive errors that eject a backend
+OLLAMA_EJECT_S = float(os.environ.get('HANDBOOK_OLLAMA_EJECT_S', 30))
+OLLAMA_HEALTH_INTERVAL_S = float(os.environ.get('HANDBOOK_OLLAMA_HEALTH_INTERVAL_S', 10))  # 0 = no active checks
+OLLAMA_HEDGE = os.environ.get('HANDBOOK_OLLAMA_HEDGE', "0") == "1"  # duplicate slow non-streaming generations
+OLLAMA_HEDGE_QUANTILE = float(os.environ.get('HANDBOOK_OLLAMA_HEDGE_QUANTILE', 0.95))
+OLLAMA_HEDGE_MIN_MS = float(os.environ.get('HANDBOOK_OLLAMA_HEDGE_MIN_MS', 500))
+NUM_PREDICT = int(os.environ.get('HANDBOOK_NUM_PREDICT', 0))  # >0: cap on generated tokens (options.num_predict)
+EMBED_WORKERS = int(os.environ.get('HANDBOOK_EMBED_WORKERS', 2))
+EMBED_BATCH_WINDOW_MS = float(os.environ.get('HANDBOOK_EMBED_BATCH_WINDOW_MS', 3))
+EMBED_MAX_BATCH = int(os.environ.get('HANDBOOK_EMBED_MAX_BATCH', 16))
+EMBED_CACHE_SIZE = int(os.environ.get('HANDBOOK_EMBED_CACHE_SIZE', 2048))
+READY_RETRY_SECONDS = float(os.environ.get('HANDBOOK_READY_RETRY_S', 5))
+KB_DIR = os.environ.get('HANDBOOK_KB_DIR', str(HANDBOOK_ROOT / "data" / "processed" / "courses"))
+ANSWER_CACHE_SIZE = int(os.environ.get('HANDBOOK_ANSWER_CACHE_SIZE', 1000))
+ANSWER_CACHE_TTL = float(os.environ.get('HANDBOOK_ANSWER_CACHE_TTL_S', 3600))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get('HANDBOOK_ANSWER_CACHE_THRESHOLD', 0.95))
+SEARCH_BACKEND = os.environ.get('HANDBOOK_SEARCH_BACKEND', "qdrant")  # "qdrant" or "local" (in-process, no Qdrant)
+LOCAL_SEARCH_DTYPE = os.environ.get('HANDBOOK_LOCAL_SEARCH_DTYPE', "float32")  # or "float16" (embeddings.f16.npy)
+LOCAL_QUANTIZATION = os.environ.get('HANDBOOK_LOCAL_QUANTIZATION', "none")  # "int8"/"binary" codes + float rescoring
+# Quantized collections (upsert --quantization): candidates = k * oversampling, rescored with float32 vectors
+QUANT_OVERSAMPLING = float(os.environ.get('HANDBOOK_QUANT_OVERSAMPLING', 0))  # 0 = Qdrant defaults
+QUANT_RESCORE = os.environ.get('HANDBOOK_QUANT_RESCORE', "1") == "1"
+# Collections built with upsert --mrl_dim: ANN on the truncated vector, rescored with the full one
+MRL_DIM = int(os.environ.get('HANDBOOK_MRL_DIM', 0))  # 0 = single full vector
+MRL_OVERSAMPLING = float(os.environ.get('HANDBOOK_MRL_OVERSAMPLING', 4))
+HYBRID_SEARCH = os.environ.get('HANDBOOK_HYBRID', "1") == "1"  # BM25 + dense with RRF if sparse_index.npz exists
+FUSION_K = int(os.environ.get('HANDBOOK_FUSION_K', 60))
+RERANK_MODEL = os.environ.get('HANDBOOK_RERANK_MODEL', "")  # cross-encoder dir; empty = no reranking
+RERANK_BUDGET_MS = float(os.environ.get('HANDBOOK_RERANK_BUDGET_MS', 250))
+RERANK_CACHE_SIZE = int(os.environ.get('HANDBOOK_RERANK_CACHE_SIZE', 8192))
+RERANK_QUANTIZE = os.environ.get('HANDBOOK_RERANK_QUANTIZE', "1") == "1"
+NUM_CTX = int(os.environ.get('HANDBOOK_NUM_CTX', 0))  # 0 = ask Ollama (/api/show); >0 is also sent as options.num_ctx
+ANSWER_TOKENS = int(os.environ.get('HANDBOOK_ANSWER_TOKENS', 512))  # num_ctx kept free for the answer
+MAX_CONTEXT_TOKENS = int(os.environ.get('HANDBOOK_MAX_CONTEXT_TOKENS', 1200))
+COURSES_DIR = os.environ.get('HANDBOOK_COURSES_DIR', str(HANDBOOK_ROOT / "data" / "courses"))
+COURSES_MAX_AGE = int(os.environ.get('HANDBOOK_COURSES_MAX_AGE_S', 300))
+COURSE_ALIASES = os.environ.get('HANDBOOK_COURSE_ALIASES', "1") == "1"  # resolve course names/abbreviations to codes
+FACT_ANSWERS = os.environ.get('HANDBOOK_FACT_ANSWERS', "1") == "1"  # answer field lookups from the course JSON, no LLM
+SESSIONS = os.environ.get('HANDBOOK_SESSIONS', "1") == "1"  # server-side conversation state keyed by session_id
+SESSION_BACKEND = os.environ.get('HANDBOOK_SESSION_BACKEND', "memory")  # memory | sqlite:<path> | module:Class
+SESSION_TTL = float(os.environ.get('HANDBOOK_SESSION_TTL_S', 3600))  # idle time before a session expires
+SESSION_MAX = int(os.environ.get('HANDBOOK_SESSION_MAX', 10000))  # memory backend: LRU size
+SESSION_RECENT_TURNS = int(os.environ.get('HANDBOOK_SESSION_RECENT_TURNS', 2))  # turns kept verbatim in the prompt
+SESSION_TURN_TOKENS = int(os.environ.get('HANDBOOK_SESSION_TURN_TOKENS', 80))  # each question/answer clipped to this
+SESSION_SUMMARY_TOKENS = int(os.environ.get('HANDBOOK_SESSION_SUMMARY_TOKENS', 150))  # rolling summary of older turns
+FOLLOWUP_REUSE = os.environ.get('HANDBOOK_FOLLOWUP_REUSE', "1") == "1"  # serve "tell me more" from the last candidates
+FOLLOWUP_CACHE = int(os.environ.get('HANDBOOK_FOLLOWUP_CACHE', 512))  # sessions whose candidate hits stay in memory
+# Admission control for generation (per route), see src/rag/admission.py
+SEARCH_BATCH_MAX = int(os.environ.get('HANDBOOK_SEARCH_BATCH_MAX', 64))  # queries per /search/batch request
+SEARCH_MAX_LIMIT = int(os.environ.get('HANDBOOK_SEARCH_MAX_LIMIT', 100))  # hits per query
+SEARCH_MAX_DEPTH = int(os.environ.get('HANDBOOK_SEARCH_MAX_DEPTH', 200))  # deepest hit /search/ pages reach
+CHAT_MAX_IN_FLIGHT = int(os.environ.get('HANDBOOK_CHAT_MAX_IN_FLIGHT', 4))
+CHAT_MAX_QUEUE = int(os.environ.get('HANDBOOK_CHAT_MAX_QUEUE', 16))
+CHAT_QUEUE_TIMEOUT = float(os.environ.get('HANDBOOK_CHAT_QUEUE_TIMEOUT_S', 10))
+STREAM_MAX_IN_FLIGHT = int(os.environ.get('HANDBOOK_STREAM_MAX_IN_FLIGHT', 4))
+STREAM_MAX_QUEUE = int(os.environ.get('HANDBOOK_STREAM_MAX_QUEUE', 16))
+STREAM_QUEUE_TIMEOUT = float(os.environ.get('HANDBOOK_STREAM_QUEUE_TIMEOUT_S', 10))
+# Per-client cap: 0 = off. The key is the peer IP, which behind a reverse proxy is the
+# proxy's for every user - list it in TRUSTED_PROXIES
+CLIENT_MAX_IN_FLIGHT = int(os.environ.get('HANDBOOK_CLIENT_MAX_IN_FLIGHT', 0))
+CLIENT_LIMITS = parse_client_limits(os.environ.get('HANDBOOK_CLIENT_LIMITS', ""))  # "key=8,other=1"
+# A client key header is only honoured from a trusted proxy or with the shared secret
+CLIENT_KEY_HEADER = os.environ.get('HANDBOOK_CLIENT_KEY_HEADER', "X-Client-Key")
+CLIENT_KEY_SECRET = os.environ.get('HANDBOOK_CLIENT_KEY_SECRET', "")  # sent as X-Client-Secret; empty = off
+# Proxies whose X-Forwarded-For and client key header are believed ("10.0.0.5,10.0.0.6")
+TRUSTED_PROXIES = {p.strip() for p in os.environ.get('HANDBOOK_TRUSTED_PROXIES', "").split(",") if p.strip()}
+
+
+# ---------- Shared resources ----------
+
+class RagResources:
+    """
+    Process-wide registry of the expensive handles used by every chat request:
+    the embedding model (wrapped in a micro-batching QueryEncoder that runs
+    in a bounded thread pool), an AsyncQdrantClient (or, with
+    HANDBOOK_SEARCH_BACKEND=local, an in-process search over the memory-mapped
+    KB files) and an OllamaPool of OllamaClients, one per Ollama server
+    (pooled keep-alive connections, model kept loaded with keep_alive,
+    warm-up and keep-warm pings, least-outstanding balancing, health checks).
+    
+    They are created once by `start()` (run in the background from the FastAPI
+    lifespan) so requests never pay the model loading cost. `ready` only turns
+    True once the model is loaded, warmed up, and Qdrant/Ollama answer.
+    """
+    
+    def __init__(self):
+        self.encoder = None
+        self.query_encoder = None
+        self.embed_executor: Optional[ThreadPoolExecutor] = None
+        self.qdrant = None
+        self.ollama: Optional[OllamaPool] = None
+        self.reranker = None
+        self.pipeline = None
+        self.ready = False
+        self.status = "starting"
+        self.error: Optional[str] = None
+    
+    def load_encoder(self):
+        """Load and warm up the embedding model (blocking; run off the event loop)"""
+        from sentence_transformers import SentenceTransformer
+        
+        print(f"⏳ Loading embedding model from {DEFAULT_EMBED_DIR}")
+        self.encoder = SentenceTransformer(DEFAULT_EMBED_DIR)
+        
+        # First encode is much slower (lazy init, kernel selection) - do it now
+        self.status = "warming up embedding model"
+        self.encoder.encode(["warm up"], prompt_name="query", normalize_embeddings=True)
+        print("✅ Embedding model loaded and warmed up")
+    
+    def load_sparse_index(self) -> Optional[BM25Index]:
+        """BM25 index for hybrid search, if enabled and built (see save_kb_files.py)"""
+        if not HYBRID_SEARCH:
+            return None
+        if not (Path(KB_DIR) / INDEX_FILE).exists():
+            print(f"ℹ️  No {INDEX_FILE} in {KB_DIR} - using dense search only")
+            return None
+        index = BM25Index.load(KB_DIR)
+        print(f"✅ Sparse index loaded ({index.n_docs} chunks, {len(index.vocab)} terms) - hybrid search on")
+        return index
+    
+    async def start(self):
+        """Open connections, load the model, then wait until Qdrant/Ollama answer"""
+        from qdrant_client import AsyncQdrantClient
+        
+        if SEARCH_BACKEND != "local":
+            self.qdrant = AsyncQdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+        options = {}
+        if NUM_CTX:
+            options["num_ctx"] = NUM_CTX
+        if NUM_PREDICT:
+            options["num_predict"] = NUM_PREDICT
+        self.ollama = OllamaPool(
+            [OllamaClient(host, port, DEFAULT_MODEL, keep_alive=OLLAMA_KEEP_ALIVE, options=options,
+                          pool_size=OLLAMA_POOL_SIZE, timeout=OLLAMA_TIMEOUT, keep_warm_s=OLLAMA_KEEP_WARM_S)
+             for host, port in OLLAMA_HOSTS or [(OLLAMA_HOST, OLLAMA_PORT)]],
+            max_fails=OLLAMA_MAX_FAILS, eject_s=OLLAMA_EJECT_S, health_interval_s=OLLAMA_HEALTH_INTERVAL_S,
+            hedge=OLLAMA_HEDGE, hedge_quantile=OLLAMA_HEDGE_QUANTILE, hedge_min_ms=OLLAMA_HEDGE_MIN_MS
+        )
+        if len(self.ollama.backends) > 1:
+            print(f"🔀 Ollama pool: {', '.join(b.client.name for b in self.ollama.backends)}"
+                  + (f" (hedging after p{OLLAMA_HEDGE_QUANTILE * 100:g})" if OLLAMA_HEDGE else ""))
+        # Bounded so a burst of chats can't oversubscribe the CPU with encodes
+        self.embed_executor = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+        
+        try:
+            self.status = "loading embedding model"
+            await asyncio.get_running_loop().run_in_executor(self.embed_executor, self.load_encoder)
+            sparse = await asyncio.to_thread(self.load_sparse_index)
+            if RERANK_MODEL:
+                self.status = "loading reranker"
+                from reranker import Reranker
+                self.reranker = await asyncio.to_thread(
+                    Reranker, RERANK_MODEL, RERANK_BUDGET_MS, RERANK_CACHE_SIZE, quantize=RERANK_QUANTIZE
+                )
+                print(f"✅ Cross-encoder reranker loaded from {RERANK_MODEL} (budget {RERANK_BUDGET_MS:g} ms)")
+            if SEARCH_BACKEND == "local":
+                self.status = "loading local vector index"
+                index = await asyncio.to_thread(
+                    LocalVectorIndex, KB_DIR, LOCAL_SEARCH_DTYPE,
+                    sparse.payloads if sparse is not None else None,
+                    quantization=LOCAL_QUANTIZATION, mrl_dim=MRL_DIM
+                )
+                self.qdrant = AsyncLocalSearchClient(index, DEFAULT_COLLECTION)
+                print(f"✅ Local vector search: {len(index)} x {index.dim} {index.matrix.dtype} from {KB_DIR}"
+                      + (f", {LOCAL_QUANTIZATION} codes ({index.search_bytes / 2**20:.1f} MiB)"
+                         if index.codes is not None else "")
+                      + (f", {MRL_DIM}-d first pass" if MRL_DIM else ""))
+            self.query_encoder = QueryEncoder(
+                self.encoder, self.embed_executor,
+                window_ms=EMBED_BATCH_WINDOW_MS,
+                max_batch=EMBED_MAX_BATCH,
+                cache_size=EMBED_CACHE_SIZE
+            )
+            # Chunk sizes come from payload n_tokens; headers/prompt use the embedding
+            # model's tokenizer (same Qwen BPE vocabulary as the chat model)
+            packer = ContextPacker(MAX_CONTEXT_TOKENS, max_chunks=DEFAULT_TOPN,
+                                   count_tokens=tokenizer_counter(getattr(self.encoder, "tokenizer", None)))
+            self.pipeline = RagPipeline(
+                self.query_encoder, self.qdrant, self.ollama,
+                collection=DEFAULT_COLLECTION,
+                k=DEFAULT_K,
+                topn=DEFAULT_TOPN,
+                sparse=sparse,
+                fusion_k=FUSION_K,
+                reranker=self.reranker,
+                packer=packer,
+                num_ctx=NUM_CTX or 2048,
+                answer_tokens=ANSWER_TOKENS,
+                max_context_tokens=MAX_CONTEXT_TOKENS,
+                search_params=search_params(QUANT_OVERSAMPLING, QUANT_RESCORE) if QUANT_OVERSAMPLING else None,
+                mrl_dim=MRL_DIM,
+                mrl_oversampling=MRL_OVERSAMPLING
+            )
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            print(f"❌ Failed to load search resources: {e}")
+            traceback.print_exc()
+            return
+        
+        # Qdrant/Ollama may still be starting up - keep checking until both answer
+        while True:
+            self.status = "waiting for Qdrant and Ollama"
+            try:
+                if not await self.qdrant.collection_exists(DEFAULT_COLLECTION):
+                    raise RuntimeError(f"Collection '{DEFAULT_COLLECTION}' not found")
+                await self.ollama.tags()
+                if not NUM_CTX:
+                    await self.discover_num_ctx()
+                if SEARCH_BACKEND != "local":
+                    await self.check_collection_schema()
+                if OLLAMA_WARMUP:
+                    await self.warm_up_model()
+                self.ollama.start_keep_warm()
+                self.error = None
+                self.status = "ready"
+                self.ready = True
+                print("✅ Shared resources ready (embedding model, Qdrant, Ollama)")
+                return
+            except Exception as e:
+                self.error = str(e)
+                print(f"⚠️  Not ready yet: {e} (retrying in {READY_RETRY_SECONDS}s)")
+                await asyncio.sleep(READY_RETRY_SECONDS)
+    
+    async def discover_num_ctx(self):
+        """Size the context budget from the num_ctx Ollama really runs the model with"""
+        try:
+            self.pipeline.num_ctx = await self.ollama.num_ctx()
+            print(f"✅ {DEFAULT_MODEL} runs with num_ctx={self.pipeline.num_ctx} "
+                  f"(context budget ≤ {MAX_CONTEXT_TOKENS} tokens, {ANSWER_TOKENS} reserved for the answer)")
+        except Exception as e:
+            print(f"⚠️  Could not read num_ctx of {DEFAULT_MODEL}: {e} (assuming {self.pipeline.num_ctx})")
+    
+    async def warm_up_model(self):
+        """Load the chat model now so the first user doesn't wait for it"""
+        self.status = f"loading {DEFAULT_MODEL} in Ollama"
+        try:
+            await self.ollama.warm_up()
+        except Exception as e:
+            print(f"⚠️  Warm-up generation with {DEFAULT_MODEL} failed: {e} (first request may be slow)")
+    
+    async def check_collection_schema(self):
+        """Warn about payload indexes missing from the collection (filters would scan payloads)"""
+        try:
+            problems = schema_problems(await self.qdrant.get_collection(DEFAULT_COLLECTION))
+        except Exception as e:
+            print(f"⚠️  Could not verify the schema of '{DEFAULT_COLLECTION}': {e}")
+            return
+        for problem in problems:
+            print(f"⚠️  Collection '{DEFAULT_COLLECTION}': {problem}")
+        if problems:
+            print(f"   Fix with: python src/rag/collection_schema.py --collection {DEFAULT_COLLECTION} --migrate")
+        else:
+            print(f"✅ Collection '{DEFAULT_COLLECTION}' matches the declared schema")
+    
+    async def close(self):
+        """Release connections on shutdown"""
+        self.ready = False
+        if self.ollama is not None:
+            await self.ollama.close()
+        if self.qdrant is not None:
+            await self.qdrant.close()
+        if self.embed_executor is not None:
+            self.embed_executor.shutdown(wait=False)
+        if self.reranker is not None:
+            self.reranker.close()
+
+
+resources = RagResources()
+
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_SIZE,
+    ttl_seconds=ANSWER_CACHE_TTL,
+    semantic_threshold=ANSWER_CACHE_THRESHOLD,
+    manifest_path=str(Path(KB_DIR) / "manifest.json")
+)
+
+course_catalog = CourseCatalog(COURSES_DIR, manifest_path=str(Path(KB_DIR) / "manifest.json"))
+course_aliases = CourseAliasIndex()
+fact_answerer = FactAnswerer()
+sessions = SessionStore(make_backend(SESSION_BACKEND, SESSION_MAX), ttl_seconds=SESSION_TTL,
+                        max_recent=SESSION_RECENT_TURNS, turn_tokens=SESSION_TURN_TOKENS,
+                        summary_tokens=SESSION_SUMMARY_TOKENS)
+followups = FollowupReuse(max_sessions=FOLLOWUP_CACHE if FOLLOWUP_REUSE else 0)
+
+
+def load_course_data():
+    """Build the course catalog, the alias index and the fact answerer from data/courses/*.json"""
+    course_catalog.load()
+    course_aliases.build(course_catalog.records)
+    fact_answerer.build(course_catalog.records)
+    print(f"🔤 Course aliases: {len(course_aliases.aliases)} names, "
+          f"{len(course_aliases.abbreviations)} abbreviations")
+
+
+def refresh_course_data():
+    """Rebuild catalog, aliases and fact answerer if the knowledge base was rebuilt"""
+    if course_catalog.refresh_if_changed():
+        course_aliases.build(course_catalog.records)
+        fact_answerer.build(course_catalog.records)
+
+admission = {
+    "chat": AdmissionController("chat", CHAT_MAX_IN_FLIGHT, CHAT_MAX_QUEUE, CHAT_QUEUE_TIMEOUT,
+                                CLIENT_MAX_IN_FLIGHT, CLIENT_LIMITS),
+    "chat_stream": AdmissionController("chat_stream", STREAM_MAX_IN_FLIGHT, STREAM_MAX_QUEUE,
+                                       STREAM_QUEUE_TIMEOUT, CLIENT_MAX_IN_FLIGHT, CLIENT_LIMITS),
+}
+
+metrics.register_stats("handbook_answer_cache", answer_cache.snapshot, gauges=("size", "hit_rate"))
+metrics.register_stats(
+    "handbook_query_encoder",
+    lambda: resources.query_encoder.stats if resources.query_encoder else None
+)
+metrics.register_stats("handbook_course_aliases", lambda: course_aliases.stats)
+metrics.register_stats("handbook_fact_answers", fact_answerer.snapshot, gauges=("answer_rate",))
+metrics.register_stats("handbook_sessions", sessions.snapshot, gauges=("active",))
+metrics.register_stats(
+    "handbook_followups", followups.snapshot,
+    gauges=("reuse_rate", "avg_reuse_ms", "avg_search_ms", "avg_saved_ms", "cached_sessions")
+)
+metrics.register_stats(
+    "handbook_ollama",
+    lambda: resources.ollama.stats if resources.ollama else None,
+    gauges=("last_load_ms", "backends", "healthy_backends", "outstanding")
+)
+metrics.register_stats(
+    "handbook_reranker",
+    lambda: resources.reranker.stats if resources.reranker else None
+)
+for _route, _controller in admission.items():
+    metrics.register_stats(f"handbook_admission_{_route}", _controller.snapshot,
+                           gauges=("in_flight", "queue_depth", "max_in_flight", "max_queue", "hold_seconds"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The course catalog and aliases only need local files - build them before serving
+    await asyncio.to_thread(load_course_data)
+    # Load in the background so /health answers while the model is loading
+    loader = asyncio.create_task(resources.start())
+    yield
+    loader.cancel()
+    try:
+        await loader
+    except asyncio.CancelledError:
+        pass
+    await resources.close()
+
+
+app = FastAPI(title="Handbook Chatbot API", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware - allow frontend to connect
 app.add_middleware(
@@ -52,12 +443,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Default configuration - use environment variables or relative paths
-DEFAULT_EMBED_DIR = os.environ.get('HANDBOOK_EMBED_DIR', str(HANDBOOK_ROOT / "models" / "hf" / "qwen3-embedding-0.6b"))
-DEFAULT_COLLECTION = os.environ.get('HANDBOOK_DEFAULT_COLLECTION', "courses")
-DEFAULT_K = int(os.environ.get('HANDBOOK_K', 30))
-DEFAULT_TOPN = int(os.environ.get('HANDBOOK_TOPN', 8))
-DEFAULT_MODEL = os.environ.get('HANDBOOK_MODEL', "qwen2.5:7b")
 
 
 def extract_course_code_from_text(text: str) -> Optional[str]:
@@ -85,20 +470,166 @@ def extract_course_code_from_text(text: str) -> Optional[str]:
     return None
 
 
+def find_course_in_text(text: str) -> Optional[str]:
+    """Course code(s) for a code or course name/abbreviation mentioned in `text`"""
+    code = extract_course_code_from_text(text)
+    if code or not COURSE_ALIASES:
+        return code
+    match = course_aliases.find_in_text(text)
+    if match is not None:
+        print(f"  🔍 Resolved course mention: {match}")
+        return match.course_code
+    return None
+
+
+def resolve_course_filter(request: "ChatRequest | SearchQuery", session=None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (course_code, course_name) to filter on: the explicit code from the request;
+    otherwise the explicit course_name resolved to codes by the alias index
+    (falling back to a MatchText filter on the name if it can't be resolved);
+    otherwise a course code, name or abbreviation mentioned in the message or,
+    failing that, the course the session resolved earlier or one mentioned in
+    earlier user messages of `history`. Several comma-separated codes mean an
+    ambiguous mention (see course_aliases.py).
+    """
+    course_code, course_name = request.course_code, request.course_name
+    extracted_course_code = None
+    if not course_code and course_name and COURSE_ALIASES:
+        refresh_course_data()
+        match = course_aliases.lookup(course_name)
+        if match is not None:
+            print(f"  🔍 Resolved course name: {match}")
+            course_code, course_name = match.course_code, None
+    
+    # Extract course code from message if not provided explicitly
+    if not course_code:
+        refresh_course_data()
+        extracted_course_code = find_course_in_text(request.message)
+        # Stay on the course of the conversation
+        if not extracted_course_code and not course_name and session is not None:
+            if session.course_code or session.course_name:
+                print(f"  🧵 Using session course: {session.course_code or session.course_name}")
+                extracted_course_code, course_name = session.course_code, session.course_name
+        # Also check conversation history for course codes
+        if not extracted_course_code and not course_name and getattr(request, "history", None):
+            for msg in request.history:
+                if msg.get("type") == "user":
+                    extracted_course_code = find_course_in_text(msg.get("text", ""))
+                    if extracted_course_code:
+                        break
+    
+    # Use extracted course code if available, otherwise use provided one
+    final_course_code = course_code or extracted_course_code
+    if final_course_code:
+        if extracted_course_code:
+            print(f"  ✅ Using extracted course code: {final_course_code}")
+        else:
+            print(f"  ✅ Using provided course code: {final_course_code}")
+    elif course_name:
+        print(f"  ℹ️  Unknown course name, filtering by name text: {course_name}")
+    else:
+        print(f"  ℹ️  No course code specified (will search all courses)")
+    
+    return final_course_code, course_name
+
+
+def answer_fact(query: str, course_code: Optional[str]):
+    """Templated answer from the course JSON if the question is a field lookup (see fact_answers.py)"""
+    if not FACT_ANSWERS:
+        return None
+    fact = fact_answerer.answer(query, course_code)
+    if fact is not None:
+        print(f"  ⚡ Answered from course data: {fact}")
+    return fact
+
+
+def remember_turn(session, query: str, answer: str, course_code: Optional[str], course_name: Optional[str],
+                  run: RagRun = None):
+    """Record a finished turn: course, last retrieval (candidate ids/scores, which went into a context) and history"""
+    if session is None:
+        return
+    if course_code or course_name:
+        session.course_code, session.course_name = course_code, None if course_code else course_name
+    if run is not None and run.hits:
+        session.last_retrieval = followups.record(session.id, run, session.last_retrieval)
+    else:
+        session.last_retrieval = None
+    sessions.add_turn(session, query, answer)
+    sessions.save(session)
+
+
+def client_key(http_request: Request) -> str:
+    """
+    Key for per-client limits, normally the caller's IP. The client key header
+    is only honoured from a trusted proxy or alongside the shared secret
+    (X-Client-Secret == HANDBOOK_CLIENT_KEY_SECRET); anyone else could pick a
+    fresh key per request or claim one from CLIENT_LIMITS. A request from a
+    trusted proxy without the header is keyed on the forwarded address: the
+    right-most X-Forwarded-For entry that isn't itself a trusted proxy.
+    """
+    host = http_request.client.host if http_request.client else "unknown"
+    key = http_request.headers.get(CLIENT_KEY_HEADER)
+    if key:
+        secret = http_request.headers.get("X-Client-Secret", "")
+        if host in TRUSTED_PROXIES or (CLIENT_KEY_SECRET and hmac.compare_digest(secret, CLIENT_KEY_SECRET)):
+            return key
+    if host in TRUSTED_PROXIES:
+        forwarded = [a.strip() for a in http_request.headers.get("X-Forwarded-For", "").split(",") if a.strip()]
+        for address in reversed(forwarded):
+            if address not in TRUSTED_PROXIES:
+                return address
+    return host
+
+
+async def admit(route: str, http_request: Request):
+    """Wait for a generation slot on `route`, or fail fast with 429/503 + Retry-After"""
+    started = time.perf_counter()
+    try:
+        ticket = await admission[route].acquire(client_key(http_request))
+    except AdmissionRejected as e:
+        print(f"  🚦 {route}: rejected ({e.status_code}) - {e.reason}, retry after {e.retry_after}s")
+        metrics.observe_request(route, (time.perf_counter() - started) * 1000, "rejected")
+        raise HTTPException(status_code=e.status_code, detail=e.reason,
+                            headers={"Retry-After": str(e.retry_after)})
+    metrics.observe_admission_wait(route, ticket.waited)
+    return ticket
+
+
 # Request/Response models
 class ChatRequest(BaseModel):
     message: str
     course_code: Optional[str] = None
     course_name: Optional[str] = None
-    history: Optional[List[Dict]] = None
+    history: Optional[List[Dict]] = None  # only read when there is no session (older clients)
     concise: Optional[bool] = True
     use_preprocessing: Optional[bool] = True
+    session_id: Optional[str] = None      # from a previous response; omitted/unknown = new session
 
 
 class ChatResponse(BaseModel):
     response: str
     success: bool
     error: Optional[str] = None
+    session_id: Optional[str] = None
+
+
+class SearchQuery(BaseModel):
+    message: str
+    course_code: Optional[str] = None
+    course_name: Optional[str] = None
+    history: Optional[List[Dict]] = None
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchQuery]
+    limit: Optional[int] = None   # hits per query (default HANDBOOK_TOPN)
+
+
+class SearchRequest(SearchQuery):
+    limit: Optional[int] = None         # hits per page (default HANDBOOK_TOPN)
+    cursor: Optional[str] = None        # next_cursor of the previous page
+    fields: Optional[List[str]] = None  # hit fields besides id/score (default: --quiet shape)
+    preview_chars: Optional[int] = PREVIEW_CHARS
 
 
 @app.get("/")
@@ -118,78 +649,94 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe - 200 only once the shared RAG resources are loaded"""
+    body = {"ready": resources.ready, "status": resources.status}
+    if resources.error:
+        body["error"] = resources.error
+    return JSONResponse(status_code=200 if resources.ready else 503, content=body)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (stage latencies, Ollama stats, cache counters)"""
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/api/chatbot/cache/")
+async def cache_stats():
+    """Answer cache hit/miss counters"""
+    return answer_cache.snapshot()
+
+
+@app.get("/api/chatbot/facts/")
+async def fact_stats():
+    """Fact fast path counters: lookups, answers without the LLM and why the rest fell through"""
+    return fact_answerer.snapshot()
+
+
+@app.get("/api/chatbot/session/{session_id}")
+async def get_session(session_id: str):
+    """A conversation's server-side state: course, rolling summary, recent turns, last retrieval"""
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return dict(session.to_dict(), conversation=sessions.conversation(session))
+
+
+@app.delete("/api/chatbot/session/{session_id}")
+async def delete_session(session_id: str):
+    """Forget a conversation (the frontend's "clear chat")"""
+    followups.forget(session_id)
+    return {"deleted": sessions.delete(session_id)}
+
+
+@app.get("/api/chatbot/followups/")
+async def followup_stats():
+    """How often follow-ups are served from the session's last candidates, and the retrieval time saved"""
+    return followups.snapshot()
+
+
+@app.get("/api/chatbot/admission/")
+async def admission_stats():
+    """Generation slots in use, queue depth and rejection counters per route"""
+    return {route: controller.snapshot() for route, controller in admission.items()}
+
+
+@app.get("/api/chatbot/ollama/")
+async def ollama_stats():
+    """Ollama backends: health, requests in flight, errors, ejections and hedging counters"""
+    if resources.ollama is None:
+        raise HTTPException(status_code=503, detail=f"Service not ready: {resources.status}")
+    return resources.ollama.snapshot()
+
+
 @app.get("/api/chatbot/courses/")
-async def get_courses():
+async def get_courses(request: Request):
     """
-    Get list of available courses from Qdrant collection
+    Get list of available courses
+    
+    Served from the in-memory catalog built from data/courses/*.json at startup
+    (rebuilt when the knowledge base manifest changes), with an ETag so the
+    frontend can revalidate instead of downloading the list again.
     
     Returns:
         List of course codes and names available in the knowledge base
     """
-    try:
-        from qdrant_client import QdrantClient
-        
-        # Connect to Qdrant
-        cli = QdrantClient(host="localhost", port=6333)
-        
-        # Check if courses collection exists
-        if not cli.collection_exists(DEFAULT_COLLECTION):
-            return {
-                "courses": [],
-                "success": False,
-                "error": f"Collection '{DEFAULT_COLLECTION}' not found"
-            }
-        
-        # Get sample points to extract unique course codes
-        # We'll use scroll to get a sample of points
-        try:
-            points, _ = cli.scroll(
-                collection_name=DEFAULT_COLLECTION,
-                limit=1000,  # Get up to 1000 points
-                with_payload=True
-            )
-            
-            # Extract unique course codes and names
-            courses_dict = {}
-            for point in points:
-                payload = point.payload or {}
-                course_code = payload.get("course_code")
-                course_name = payload.get("course_name")
-                
-                if course_code and course_code not in courses_dict:
-                    courses_dict[course_code] = course_name or ""
-            
-            # Convert to list of dicts
-            courses = [
-                {"code": code, "name": name}
-                for code, name in sorted(courses_dict.items())
-            ]
-            
-            print(f"Found {len(courses)} unique courses")
-            
-            return {
-                "courses": courses,
-                "success": True
-            }
-        except Exception as e:
-            print(f"Error scrolling collection: {e}")
-            return {
-                "courses": [],
-                "success": False,
-                "error": str(e)
-            }
-    except Exception as e:
-        print(f"Error getting courses: {e}")
-        traceback.print_exc()
-        return {
-            "courses": [],
-            "success": False,
-            "error": str(e)
-        }
+    refresh_course_data()
+    headers = {
+        "ETag": course_catalog.etag,
+        "Cache-Control": f"public, max-age={COURSES_MAX_AGE}",
+    }
+    if request.headers.get("if-none-match") == course_catalog.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=course_catalog.body, media_type="application/json", headers=headers)
 
 
 @app.post("/api/chatbot/chat/", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request, response: Response):
     """
     Main chat endpoint - processes user messages using RAG pipeline
     
@@ -211,90 +758,84 @@ async def chat(request: ChatRequest):
             print(f"  History: {len(request.history)} previous messages")
         print(f"{'='*70}\n")
         
+        started = time.perf_counter()
+        
         # Extract query
         query = request.message.strip()
         
         if not query:
             raise HTTPException(status_code=400, detail="Message cannot be empty")
         
-        # Extract course code from message if not provided explicitly
-        extracted_course_code = None
-        if not request.course_code:
-            extracted_course_code = extract_course_code_from_text(query)
-            # Also check conversation history for course codes
-            if not extracted_course_code and request.history:
-                for msg in request.history:
-                    if msg.get("type") == "user":
-                        extracted_course_code = extract_course_code_from_text(msg.get("text", ""))
-                        if extracted_course_code:
-                            break
+        if not resources.ready:
+            raise HTTPException(status_code=503, detail=f"Service not ready: {resources.status}")
         
-        # Use extracted course code if available, otherwise use provided one
-        final_course_code = request.course_code or extracted_course_code
-        if final_course_code:
-            if extracted_course_code and not request.course_code:
-                print(f"  ✅ Using extracted course code: {final_course_code}")
-            else:
-                print(f"  ✅ Using provided course code: {final_course_code}")
-        else:
-            print(f"  ℹ️  No course code specified (will search all courses)")
+        session = sessions.open(request.session_id) if SESSIONS else None
+        session_id = session.id if session is not None else None
+        final_course_code, course_name = resolve_course_filter(request, session)
         
-        # Convert history format from frontend to backend format
-        conversation_history = []
-        if request.history:
-            for msg in request.history:
-                # Convert frontend format {type: "user"/"bot", text: "..."} to backend format
-                conversation_history.append({
-                    "type": msg.get("type", "user"),  # "user" or "bot"
-                    "text": msg.get("text", "")
-                })
-            print(f"Converted {len(conversation_history)} messages from conversation history")
+        # Field lookups (credit points, CRICOS code, ...) need neither retrieval nor the LLM
+        fact = answer_fact(query, final_course_code)
+        if fact is not None:
+            remember_turn(session, query, fact.text, fact.course_code, None)
+            total_ms = (time.perf_counter() - started) * 1000
+            metrics.observe_request("chat", total_ms, "fact")
+            response.headers["Server-Timing"] = metrics.server_timing_header({"fact": total_ms})
+            return ChatResponse(response=fact.text, success=True, session_id=session_id)
         
-        # Use preprocessing pipeline if requested (default)
-        if request.use_preprocessing:
-            try:
-                response_text = query_with_full_pipeline(
-                    query=query,
-                    embed_dir=DEFAULT_EMBED_DIR,
-                    collection=DEFAULT_COLLECTION,
-                    course_code=final_course_code,
-                    course_name=request.course_name,
-                    generate=True,
-                    topn=DEFAULT_TOPN,
-                    model=DEFAULT_MODEL,
-                    concise=request.concise if request.concise is not None else True
-                )
-            except Exception as e:
-                print(f"Error in preprocessing pipeline: {e}")
-                traceback.print_exc()
-                # Fallback to hybrid RAG
-                response_text = query_courses(
-                    query=query,
-                    embed_dir=DEFAULT_EMBED_DIR,
-                    collection=DEFAULT_COLLECTION,
-                    course_code=final_course_code,
-                    course_name=request.course_name,
-                    k=DEFAULT_K,
-                    topn=DEFAULT_TOPN,
-                    generate=True,
-                    concise=request.concise if request.concise is not None else True
-                )
-        else:
-            # Use hybrid RAG directly
-            response_text = query_courses(
-                query=query,
-                embed_dir=DEFAULT_EMBED_DIR,
-                collection=DEFAULT_COLLECTION,
-                course_code=final_course_code,
-                course_name=request.course_name,
-                k=DEFAULT_K,
-                topn=DEFAULT_TOPN,
-                generate=True,
-                concise=request.concise if request.concise is not None else True
-            )
+        concise = request.concise if request.concise is not None else True
+        conversation = sessions.conversation(session)
+        
+        # Answer cache: same question first, then a semantically equivalent one.
+        # The query vector is cached by the QueryEncoder, so retrieval reuses it.
+        # Answers that depend on earlier turns are neither served from nor put in the cache.
+        cached, query_vector = None, None
+        if not conversation:
+            cached = answer_cache.get_exact(query, final_course_code, course_name, concise)
+            if cached is None:
+                embed_started = time.perf_counter()
+                query_vector = await resources.query_encoder.encode(query)
+                embed_ms = (time.perf_counter() - embed_started) * 1000
+                cached = answer_cache.get_semantic(query_vector, final_course_code, course_name, concise)
+        if cached is not None:
+            print("  ⚡ Answer served from cache")
+            remember_turn(session, query, cached, final_course_code, course_name)
+            total_ms = (time.perf_counter() - started) * 1000
+            metrics.observe_request("chat", total_ms, "cache_hit")
+            response.headers["Server-Timing"] = metrics.server_timing_header({"cache": total_ms})
+            return ChatResponse(response=cached, success=True, session_id=session_id)
+        
+        # Staged pipeline: the quality-check stage is the "preprocessing" variant.
+        # A failing stage is retried/degraded on its own instead of the whole
+        # query being re-embedded and re-searched by a fallback pipeline.
+        run = RagRun(query, final_course_code, course_name, concise, query_vector=query_vector,
+                     conversation=conversation)
+        if query_vector is not None:
+            run.timings["embed"] = embed_ms
+        # Cache hits never wait; only requests that will reach Ollama take a slot
+        ticket = await admit("chat", http_request)
+        run.timings["queue"] = ticket.waited * 1000
+        try:
+            # "Tell me more" on the same course: the last turn's candidates, no embed/search
+            await followups.retrieve(run, session if FOLLOWUP_REUSE else None, resources.pipeline,
+                                     quality_check=bool(request.use_preprocessing))
+            response_text = await resources.pipeline.execute(run, quality_check=bool(request.use_preprocessing))
+        finally:
+            ticket.release()
+        if run.degraded:
+            print(f"  ⚠️  Degraded stages: {', '.join(run.degraded)} ({run.errors})")
+        print(f"  ⏱️  Stage timings (ms): " + ", ".join(f"{k}={v:.0f}" for k, v in run.timings.items()))
+        
+        total_ms = (time.perf_counter() - started) * 1000
+        metrics.observe_run("chat", run, total_ms, outcome="degraded" if run.degraded else "ok")
+        response.headers["Server-Timing"] = metrics.server_timing_header(run.timings, total_ms)
         
         if not response_text or response_text.strip() == "":
             response_text = "I couldn't generate a response. Please try rephrasing your question."
+        elif not response_text.startswith("Error generating response"):
+            if not conversation:
+                answer_cache.put(query, response_text, run.query_vector,
+                                 final_course_code, course_name, concise)
+            remember_turn(session, query, response_text, final_course_code, course_name, run)
         
         print(f"\n{'='*70}")
         print(f"Response generated successfully")
@@ -302,7 +843,8 @@ async def chat(request: ChatRequest):
         
         return ChatResponse(
             response=response_text,
-            success=True
+            success=True,
+            session_id=session_id
         )
         
     except HTTPException:
@@ -314,6 +856,7 @@ async def chat(request: ChatRequest):
         print(f"  Error: {error_msg}")
         print(f"{'='*70}\n")
         traceback.print_exc()
+        metrics.observe_request("chat", (time.perf_counter() - started) * 1000, "error")
         
         return ChatResponse(
             response="Sorry, there was an error processing your request. Please try again.",
@@ -322,14 +865,296 @@ async def chat(request: ChatRequest):
         )
 
 
+def _ndjson(event: Dict) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@app.post("/api/chatbot/chat/stream/")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Streaming chat endpoint - same request body as /api/chatbot/chat/, but the
+    answer is sent as newline-delimited JSON events while Ollama generates it:
+    
+        {"type": "meta", "course_code": ..., "results": [...], "retrieval_ms": ...}
+        {"type": "token", "content": "..."}            (repeated)
+        {"type": "done", "ttft_ms": ..., "total_ms": ..., "ollama": {...}}
+    
+    or a single {"type": "error", "error": "..."} event if something fails.
+    Field lookups answered from the course JSON send the whole answer as one
+    token event (the meta event has `"fact": true` and no results). The meta
+    event carries the `session_id` to send with the next message, and `reused`
+    ("page" / "rerank") when a follow-up was served from the last turn's
+    candidates instead of a new search.
+    `ttft_ms` is measured from request arrival to the first generated token.
+    When all generation slots are busy the request waits briefly in a queue,
+    then gets 429/503 with Retry-After before any event is sent.
+    """
+    query = request.message.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    if not resources.ready:
+        raise HTTPException(status_code=503, detail=f"Service not ready: {resources.status}")
+    
+    started = time.perf_counter()
+    session = sessions.open(request.session_id) if SESSIONS else None
+    session_id = session.id if session is not None else None
+    final_course_code, course_name = resolve_course_filter(request, session)
+    concise = request.concise if request.concise is not None else True
+    
+    fact = answer_fact(query, final_course_code)
+    if fact is not None:
+        remember_turn(session, query, fact.text, fact.course_code, None)
+        total_ms = (time.perf_counter() - started) * 1000
+        metrics.observe_request("chat_stream", total_ms, "fact")
+        events = [
+            {"type": "meta", "course_code": fact.course_code, "retrieval_ms": 0.0, "results": [], "fact": True,
+             "session_id": session_id},
+            {"type": "token", "content": fact.text},
+            {"type": "done", "ttft_ms": round(total_ms, 1), "total_ms": round(total_ms, 1)},
+        ]
+        return StreamingResponse(iter([_ndjson(event) for event in events]), media_type="application/x-ndjson",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    
+    # Taken before the response starts so a rejection is still a proper HTTP status
+    ticket = await admit("chat_stream", http_request)
+    
+    async def events():
+        try:
+            run = RagRun(query, final_course_code, course_name, concise, conversation=sessions.conversation(session))
+            run.timings["queue"] = ticket.waited * 1000
+            await followups.retrieve(run, session if FOLLOWUP_REUSE else None, resources.pipeline,
+                                     quality_check=False)
+            hits = run.hits
+            retrieval_ms = (time.perf_counter() - started) * 1000
+            yield _ndjson({
+                "type": "meta",
+                "session_id": session_id,
+                "course_code": final_course_code,
+                "reused": run.reused,
+                "retrieval_ms": round(retrieval_ms, 1),
+                "results": [
+                    {
+                        "score": hit.score,
+                        "course_code": hit.payload.get("course_code"),
+                        "course_name": hit.payload.get("course_name"),
+                        "chunk_label": hit.payload.get("chunk_label"),
+                        "source_url": hit.payload.get("source_url"),
+                    }
+                    for hit in hits[:DEFAULT_TOPN]
+                ]
+            })
+            
+            if not hits:
+                yield _ndjson({"type": "token", "content": "No relevant course information found."})
+                yield _ndjson({"type": "done", "ttft_ms": None,
+                               "total_ms": round((time.perf_counter() - started) * 1000, 1)})
+                return
+            
+            ttft_ms = None
+            stats = {}
+            answer = []
+            messages = build_ollama_messages(query, run.context, concise, run.conversation)
+            async for chunk in resources.ollama.stream_chat(messages):
+                if chunk["content"]:
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                    answer.append(chunk["content"])
+                    yield _ndjson({"type": "token", "content": chunk["content"]})
+                if chunk["done"]:
+                    stats = chunk.get("stats", {})
+            remember_turn(session, query, "".join(answer), final_course_code, course_name, run)
+            
+            total_ms = (time.perf_counter() - started) * 1000
+            run.timings["generate"] = total_ms - retrieval_ms
+            run.ollama_stats = stats
+            metrics.observe_run("chat_stream", run, total_ms)
+            if ttft_ms is not None:
+                metrics.observe_ttft("chat_stream", ttft_ms)
+            print(f"  ⏱️  Streamed answer: TTFT {ttft_ms or 0:.0f} ms, total {total_ms:.0f} ms")
+            yield _ndjson({
+                "type": "done",
+                "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+                "total_ms": round(total_ms, 1),
+                "ollama": stats
+            })
+        except Exception as e:
+            print(f"Error in streaming chat: {e}")
+            traceback.print_exc()
+            metrics.observe_request("chat_stream", (time.perf_counter() - started) * 1000, "error")
+            yield _ndjson({"type": "error", "error": str(e)})
+        finally:
+            ticket.release()
+    
+    # Also released after the response in case the stream never started (release is idempotent)
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(ticket.release)
+    )
+
+
+# ---------- Retrieval-only search ----------
+
+FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def search_fingerprint(query: str, course_code: Optional[str], course_name: Optional[str]) -> str:
+    """Ties a cursor to the query and filter it was issued for"""
+    key = json.dumps([query, course_code, course_name], ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(offset: int, fingerprint: str) -> str:
+    raw = json.dumps({"o": offset, "q": fingerprint}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> int:
+    """Offset of the page `cursor` points to; ValueError if it is malformed or from another query"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        offset = int(data["o"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if data.get("q") != fingerprint or offset < 0:
+        raise ValueError("Cursor does not belong to this query")
+    return offset
+
+
+@app.post("/api/chatbot/search/")
+async def search(request: SearchRequest, response: Response):
+    """
+    Retrieval only - ranked handbook sections for one question, no LLM
+    
+    Same retrieval as chat (course filter resolution, dense + BM25 fusion),
+    returned in the filtered_retrieval.py --quiet shape, so a UI can show the
+    top matching sections immediately and only then decide whether to ask for
+    a generated answer. Pages are fetched with the returned `next_cursor`;
+    `fields` picks the hit fields (only those payload keys are fetched).
+    
+    Returns:
+        query, course filter, results (id, score + fields) and next_cursor (null on the last page)
+    """
+    started = time.perf_counter()
+    query = request.message.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    limit = request.limit or DEFAULT_TOPN
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SEARCH_MAX_LIMIT}")
+    fields = list(DEFAULT_FIELDS) if request.fields is None else list(dict.fromkeys(request.fields))
+    bad = [f for f in fields if not FIELD_RE.match(f)]
+    if bad:
+        raise HTTPException(status_code=400, detail=f"Invalid field names: {', '.join(bad)}")
+    preview_chars = max(0, request.preview_chars if request.preview_chars is not None else PREVIEW_CHARS)
+    if not resources.ready:
+        raise HTTPException(status_code=503, detail=f"Service not ready: {resources.status}")
+    
+    print(f"\n🔎 Search: {query!r} (limit {limit}{', cursor' if request.cursor else ''})")
+    course_code, course_name = resolve_course_filter(request)
+    fingerprint = search_fingerprint(query, course_code, course_name)
+    offset = 0
+    if request.cursor:
+        try:
+            offset = decode_cursor(request.cursor, fingerprint)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if offset >= SEARCH_MAX_DEPTH:
+        raise HTTPException(status_code=400, detail=f"Results are only paged up to {SEARCH_MAX_DEPTH} hits")
+    
+    # One extra hit tells whether there is a next page
+    depth = min(offset + limit + 1, SEARCH_MAX_DEPTH + 1)
+    run = RagRun(query, course_code, course_name)
+    try:
+        timings = await resources.pipeline.search_batch(
+            [run], limit=depth, with_payload=payload_keys(fields) or False)
+    except Exception as e:
+        print(f"❌ Search failed: {e}")
+        traceback.print_exc()
+        metrics.observe_request("search", (time.perf_counter() - started) * 1000, "error")
+        raise HTTPException(status_code=502, detail=f"Search failed: {e}")
+    
+    page = run.hits[offset:offset + limit]
+    more = len(run.hits) > offset + limit and offset + limit < SEARCH_MAX_DEPTH
+    
+    total_ms = (time.perf_counter() - started) * 1000
+    for stage, ms in timings.items():
+        metrics.observe_stage("search", stage, ms)
+    metrics.observe_request("search", total_ms, "ok")
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings, total_ms)
+    
+    result = search_result(query, page, limit, preview_chars, fields)
+    result.update(course_code=course_code, course_name=course_name, offset=offset,
+                  next_cursor=encode_cursor(offset + limit, fingerprint) if more else None)
+    return result
+
+
+@app.post("/api/chatbot/search/batch")
+async def search_batch(request: BatchSearchRequest, response: Response):
+    """
+    Retrieval only, for many queries at once - no reranking, no LLM
+    
+    All queries are embedded in one batch and searched with a single Qdrant
+    search_batch call; course filters are resolved per query as in chat.
+    Meant for evaluation scripts, prefetching and bulk lookups.
+    
+    Returns:
+        One filtered_retrieval.py --quiet style result per query, in order
+    """
+    started = time.perf_counter()
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries given")
+    if len(request.queries) > SEARCH_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {SEARCH_BATCH_MAX} queries per batch")
+    if any(not q.message.strip() for q in request.queries):
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    limit = request.limit or DEFAULT_TOPN
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SEARCH_MAX_LIMIT}")
+    if not resources.ready:
+        raise HTTPException(status_code=503, detail=f"Service not ready: {resources.status}")
+    
+    print(f"\n🔎 Batch search: {len(request.queries)} queries, limit {limit}")
+    runs = []
+    for q in request.queries:
+        course_code, course_name = resolve_course_filter(q)
+        runs.append(RagRun(q.message.strip(), course_code, course_name))
+    
+    try:
+        timings = await resources.pipeline.search_batch(runs, limit=limit)
+    except Exception as e:
+        print(f"❌ Batch search failed: {e}")
+        traceback.print_exc()
+        metrics.observe_request("search_batch", (time.perf_counter() - started) * 1000, "error")
+        raise HTTPException(status_code=502, detail=f"Search failed: {e}")
+    
+    total_ms = (time.perf_counter() - started) * 1000
+    for stage, ms in timings.items():
+        metrics.observe_stage("search_batch", stage, ms)
+    metrics.observe_request("search_batch", total_ms, "ok")
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings, total_ms)
+    print(f"  ⏱️  Batch timings (ms): " + ", ".join(f"{k}={v:.0f}" for k, v in timings.items())
+          + f", total={total_ms:.0f}")
+    
+    results = []
+    for run in runs:
+        result = search_result(run.query, run.hits, limit)
+        result["course_code"] = run.course_code
+        result["course_name"] = run.course_name
+        results.append(result)
+    return {"count": len(results), "limit": limit, "results": results}
+
+
 @app.post("/api/chatbot/test/")
-async def test_chat():
+async def test_chat(http_request: Request, response: Response):
     """Test endpoint to verify the API is working"""
     test_request = ChatRequest(
         message="What courses are available?",
         concise=True
     )
-    return await chat(test_request)
+    return await chat(test_request, http_request, response)
 
 
 if __name__ == "__main__":
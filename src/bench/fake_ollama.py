@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for Ollama (benchmarking only)
+Serves /api/tags, /api/show, /api/generate (model load only) and /api/chat
+(streaming and non-streaming) with the same response format as Ollama, but
+"generates" at a fixed, configurable speed:
+- load/prompt evaluation is a fixed delay before the first token (--ttft_ms)
+- then --n_tokens tokens at --tokens_per_s
+- with --cold_load_ms the model starts unloaded, is unloaded `keep_alive`
+  after the last request (as sent by the client, Ollama's 5m by default) and
+  the next request waits --cold_load_ms longer, reported as load_duration
+- --tail_rate of the requests stall --tail_ms longer before the first token
+  and --fail_rate of them fail with HTTP 500 (seeded, to exercise the
+  API server's load balancing, ejection and hedging across several fakes)
+The answer text depends only on the question, so runs are comparable between
+commits and machines without a GPU or model download.
+
+Usage:
+    python src/bench/fake_ollama.py --port 11435 --tokens_per_s 40 --ttft_ms 300
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "The course requires students to complete core subjects and electives "
+    "across the degree with credit points awarded for each stage of study "
+    "including admission requirements career options and learning outcomes"
+).split()
+
+
+class FakeOllama:
+    """Timing model + deterministic text for the fake /api/chat"""
+    
+    def __init__(self, tokens_per_s: float = 40.0, ttft_ms: float = 300.0,
+                 n_tokens: int = 120, load_ms: float = 0.0, model: str = "qwen2.5:7b",
+                 cold_load_ms: float = 0.0, tail_rate: float = 0.0, tail_ms: float = 0.0,
+                 fail_rate: float = 0.0, seed: int = 0):
+        self.tokens_per_s = tokens_per_s
+        self.ttft = ttft_ms / 1000.0
+        self.n_tokens = n_tokens
+        self.load = load_ms / 1000.0
+        self.model = model
+        self.cold_load = cold_load_ms / 1000.0
+        self.loaded_until = 0.0  # monotonic time the model gets unloaded (-1: never)
+        self.tail_rate = tail_rate
+        self.tail = tail_ms / 1000.0
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "streamed": 0, "in_flight": 0, "model_loads": 0, "stalls": 0, "failures": 0}
+    
+    def stall(self) -> float:
+        """Extra delay before the first token for the slow tail of requests"""
+        if self.tail_rate and self.rng.random() < self.tail_rate:
+            self.stats["stalls"] += 1
+            return self.tail
+        return 0.0
+    
+    async def load_model(self, keep_alive) -> float:
+        """Wait for a cold load if the model isn't resident; returns the load time (s)"""
+        now = time.monotonic()
+        load = 0.0
+        if self.cold_load and self.loaded_until != -1 and now >= self.loaded_until:
+            self.stats["model_loads"] += 1
+            load = self.cold_load
+            await asyncio.sleep(load)
+        seconds = parse_keep_alive(keep_alive)
+        self.loaded_until = -1 if seconds < 0 else time.monotonic() + seconds
+        return load
+    
+    def tokens(self, messages) -> list:
+        """Same question -> same tokens"""
+        question = messages[-1].get("content", "") if messages else ""
+        seed = int(hashlib.sha1(question.encode("utf-8")).hexdigest()[:8], 16)
+        return [WORDS[(seed + i * 7) % len(WORDS)] + " " for i in range(self.n_tokens)]
+    
+    def final_stats(self, messages, n_tokens: int, started: float, cold_load: float = 0.0) -> dict:
+        prompt_chars = sum(len(m.get("content", "")) for m in messages)
+        eval_s = n_tokens / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+        return {
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "load_duration": int((self.load + cold_load) * 1e9),
+            "prompt_eval_count": prompt_chars // 4,
+            "prompt_eval_duration": int(max(self.ttft - self.load, 0.0) * 1e9),
+            "eval_count": n_tokens,
+            "eval_duration": int(eval_s * 1e9),
+        }
+
+
+def parse_keep_alive(value, default: float = 300.0) -> float:
+    """Ollama keep_alive ("30m", "1h", "90s", 600, -1) in seconds; negative = forever"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    units = {"s": 1, "m": 60, "h": 3600}
+    value = str(value).strip()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def create_app(fake: FakeOllama) -> FastAPI:
+    app = FastAPI(title="Fake Ollama")
+    
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": fake.model, "model": fake.model}]}
+    
+    @app.post("/api/show")
+    async def show():
+        return {"parameters": "num_ctx                        4096", "model_info": {"qwen2.context_length": 32768}}
+    
+    @app.get("/stats")
+    async def stats():
+        return fake.stats
+    
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        # Only the "load the model" form (no prompt) is used by the API server
+        body = await request.json()
+        started = time.perf_counter()
+        load = await fake.load_model(body.get("keep_alive"))
+        return {"model": body.get("model", fake.model), "response": "", "done": True, "done_reason": "load",
+                "total_duration": int((time.perf_counter() - started) * 1e9), "load_duration": int(load * 1e9)}
+    
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", fake.model)
+        tokens = fake.tokens(messages)
+        num_predict = (body.get("options") or {}).get("num_predict")
+        if num_predict is not None and num_predict >= 0:
+            tokens = tokens[:num_predict]
+        started = time.perf_counter()
+        fake.stats["requests"] += 1
+        if fake.fail_rate and fake.rng.random() < fake.fail_rate:
+            fake.stats["failures"] += 1
+            return JSONResponse(status_code=500, content={"error": "simulated failure"})
+        cold_load = await fake.load_model(body.get("keep_alive"))
+        stall = fake.stall()
+        per_token = 1.0 / fake.tokens_per_s if fake.tokens_per_s > 0 else 0.0
+        
+        if not body.get("stream", True):
+            fake.stats["in_flight"] += 1
+            try:
+                await asyncio.sleep(fake.ttft + stall + per_token * len(tokens))
+            finally:
+                fake.stats["in_flight"] -= 1
+            return JSONResponse(dict(
+                {"model": model, "message": {"role": "assistant", "content": "".join(tokens)},
+                 "done": True, "done_reason": "stop"},
+                **fake.final_stats(messages, len(tokens), started, cold_load)
+            ))
+        
+        async def lines():
+            fake.stats["streamed"] += 1
+            fake.stats["in_flight"] += 1
+            try:
+                await asyncio.sleep(fake.ttft)
+                # Sleep to absolute deadlines so the rate doesn't drift under load
+                for i, token in enumerate(tokens):
+                    delay = started + cold_load + stall + fake.ttft + per_token * (i + 1) - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    yield json.dumps({"model": model, "message": {"role": "assistant", "content": token},
+                                      "done": False}) + "\n"
+                yield json.dumps(dict(
+                    {"model": model, "message": {"role": "assistant", "content": ""},
+                     "done": True, "done_reason": "stop"},
+                    **fake.final_stats(messages, len(tokens), started, cold_load)
+                )) + "\n"
+            finally:
+                fake.stats["in_flight"] -= 1
+        
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deterministic fake Ollama server for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=11435, help='Port (real Ollama uses 11434)')
+    parser.add_argument('--tokens_per_s', type=float, default=40.0, help='Generation speed')
+    parser.add_argument('--ttft_ms', type=float, default=300.0, help='Delay before the first token (load + prompt eval)')
+    parser.add_argument('--n_tokens', type=int, default=120, help='Tokens per answer')
+    parser.add_argument('--load_ms', type=float, default=0.0, help='Part of ttft_ms reported as load_duration')
+    parser.add_argument('--cold_load_ms', type=float, default=0.0,
+                        help='Extra delay when the model is not loaded (starts unloaded, unloads after keep_alive)')
+    parser.add_argument('--tail_rate', type=float, default=0.0, help='Share of requests that stall')
+    parser.add_argument('--tail_ms', type=float, default=0.0, help='Stall before the first token')
+    parser.add_argument('--fail_rate', type=float, default=0.0, help='Share of chat requests answered with HTTP 500')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for stalls and failures')
+    args = parser.parse_args()
+    
+    import uvicorn
+    fake = FakeOllama(args.tokens_per_s, args.ttft_ms, args.n_tokens, args.load_ms,
+                      cold_load_ms=args.cold_load_ms, tail_rate=args.tail_rate, tail_ms=args.tail_ms,
+                      fail_rate=args.fail_rate, seed=args.seed)
+    print(f"🤖 Fake Ollama on {args.host}:{args.port} "
+          f"({args.tokens_per_s} tok/s, TTFT {args.ttft_ms} ms, {args.n_tokens} tokens)")
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for Qdrant (benchmarking only)
+Implements the REST calls the API server makes (collection exists / info,
+points search, search/batch and retrieve by id) with exact brute-force search over an in-memory matrix:
+- if --kb_dir has embeddings.npy + payloads.jsonl (save_kb_files.py output),
+  those are served with the same point ids upsert_to_qdrant_from_files.py uses
+- otherwise chunks are built from data/courses/*.json with ingest_courses.py
+  and given seeded random unit vectors (meaningless scores, but real payloads
+  and a realistic collection size)
+The collection reports the settings and payload indexes declared in
+collection_schema.py, and also answers searches on the named vectors of an
+--mrl_dim collection ("mrl" = truncated, "full"). An optional fixed --latency_ms is added to every search.
+
+Usage:
+    python src/bench/fake_qdrant.py --port 6334
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+HANDBOOK_ROOT = Path(os.environ.get('HANDBOOK_ROOT', SCRIPT_DIR.parent.parent))
+sys.path.insert(0, str(HANDBOOK_ROOT / "src" / "rag"))
+
+import collection_schema
+from ingest_courses import create_chunks_from_course
+from local_search import truncate_embeddings
+
+DEFAULT_KB_DIR = HANDBOOK_ROOT / "data" / "processed" / "courses"
+DEFAULT_COURSES_DIR = HANDBOOK_ROOT / "data" / "courses"
+
+
+# ---------- Data ----------
+
+def load_kb(kb_dir: Path):
+    """(matrix, payloads) from save_kb_files.py output"""
+    matrix = np.load(kb_dir / "embeddings.npy").astype(np.float32)
+    payloads = []
+    with open(kb_dir / "payloads.jsonl", "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            r = json.loads(line)
+            payloads.append(r.get("meta", {}) | {"text": r.get("text", ""), "row_id": r.get("id")})
+    return matrix, payloads
+
+
+def synthetic_kb(courses_dir: Path, dim: int, seed: int):
+    """(matrix, payloads) with real course chunks and seeded random vectors"""
+    payloads = []
+    for json_file in sorted(courses_dir.glob("*.json")):
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                course_data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for chunk in create_chunks_from_course(course_data, json_file.name):
+            payloads.append(chunk["meta"] | {"text": chunk["text"], "row_id": chunk["id"]})
+    
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((len(payloads), dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix, payloads
+
+
+# ---------- Filters ----------
+
+def _condition_matches(payload: Dict[str, Any], cond: Dict[str, Any], point_id: int = None) -> bool:
+    if cond.get("must") is not None or cond.get("should") is not None or cond.get("must_not") is not None:
+        return filter_matches(payload, cond, point_id)
+    if cond.get("has_id") is not None:
+        return point_id in cond["has_id"]
+    match = cond.get("match") or {}
+    value = payload.get(cond.get("key"))
+    if isinstance(value, list):  # array payload (faculty): any element matches
+        return any(_condition_matches({"v": v}, {"key": "v", "match": match}) for v in value)
+    if match.get("value") is not None:
+        return value == match["value"]
+    if match.get("text") is not None:
+        return isinstance(value, str) and match["text"].lower() in value.lower()
+    if match.get("any") is not None:
+        return value in match["any"]
+    return True
+
+
+def filter_matches(payload: Dict[str, Any], flt: Optional[Dict[str, Any]], point_id: int = None) -> bool:
+    """Subset of Qdrant's filter semantics: must / should / must_not of match and has_id conditions"""
+    if not flt:
+        return True
+    if flt.get("must") and not all(_condition_matches(payload, c, point_id) for c in flt["must"]):
+        return False
+    if flt.get("should") and not any(_condition_matches(payload, c, point_id) for c in flt["should"]):
+        return False
+    if flt.get("must_not") and any(_condition_matches(payload, c, point_id) for c in flt["must_not"]):
+        return False
+    return True
+
+
+# ---------- Search ----------
+
+class FakeCollection:
+    """Exact search over one in-memory collection"""
+    
+    def __init__(self, matrix: np.ndarray, payloads: List[Dict[str, Any]]):
+        self.matrix = matrix
+        self.payloads = payloads
+        self._filter_cache: Dict[str, np.ndarray] = {}
+        self._truncated: Dict[int, np.ndarray] = {}  # Matryoshka dim -> matrix
+    
+    def _mask(self, flt: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not flt:
+            return None
+        key = json.dumps(flt, sort_keys=True)
+        mask = self._filter_cache.get(key)
+        if mask is None:
+            mask = np.array([filter_matches(p, flt, i) for i, p in enumerate(self.payloads)], dtype=bool)
+            if "has_id" not in key:  # id lists (rescoring requests) rarely repeat
+                self._filter_cache[key] = mask
+        return mask
+    
+    def info(self) -> Dict[str, Any]:
+        """GET /collections/{name} result for a collection built per collection_schema.py"""
+        n = len(self.payloads)
+        return {
+            "status": "green", "optimizer_status": "ok", "vectors_count": n,
+            "indexed_vectors_count": n, "points_count": n, "segments_count": 1,
+            "config": {
+                "params": {
+                    "vectors": {"size": int(self.matrix.shape[1]), "distance": collection_schema.DISTANCE.value,
+                                "on_disk": collection_schema.ON_DISK_VECTORS},
+                    "shard_number": 1, "replication_factor": 1, "write_consistency_factor": 1,
+                    "on_disk_payload": collection_schema.ON_DISK_PAYLOAD,
+                },
+                "hnsw_config": {"m": collection_schema.HNSW_M, "ef_construct": collection_schema.HNSW_EF_CONSTRUCT,
+                                "full_scan_threshold": 10000},
+                "optimizer_config": {"deleted_threshold": 0.2, "vacuum_min_vector_number": 1000,
+                                     "default_segment_number": 0, "flush_interval_sec": 5},
+                "wal_config": {"wal_capacity_mb": 32, "wal_segments_ahead": 0},
+            },
+            "payload_schema": {
+                field: {"data_type": collection_schema.index_type(field_schema),
+                        "points": sum(1 for p in self.payloads if p.get(field) not in (None, "", []))}
+                for field, field_schema in collection_schema.PAYLOAD_INDEXES.items()
+            },
+        }
+    
+    def search(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        vector = body.get("vector")
+        matrix = self.matrix
+        if isinstance(vector, dict):  # named vector {"name": ..., "vector": [...]}
+            if vector.get("name") == collection_schema.MRL_VECTOR:
+                dim = len(vector.get("vector") or [])
+                if dim not in self._truncated:
+                    self._truncated[dim] = truncate_embeddings(self.matrix, dim)
+                matrix = self._truncated[dim]
+            vector = vector.get("vector")
+        q = np.asarray(vector, dtype=np.float32)
+        if q.shape[0] != matrix.shape[1]:
+            raise ValueError(f"Vector dimension error: expected dim: {matrix.shape[1]}, got {q.shape[0]}")
+        
+        scores = matrix @ (q / (np.linalg.norm(q) or 1.0))
+        mask = self._mask(body.get("filter"))
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        
+        limit = int(body.get("limit") or 10)
+        offset = int(body.get("offset") or 0)
+        n = min(limit + offset, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n] if n else np.array([], dtype=int)
+        top = top[np.argsort(-scores[top], kind="stable")][offset:]
+        
+        threshold = body.get("score_threshold")
+        with_payload = body.get("with_payload")
+        points = []
+        for i in top:
+            score = float(scores[i])
+            if score == -np.inf or (threshold is not None and score < threshold):
+                continue
+            payload = None
+            if with_payload is True:
+                payload = self.payloads[i]
+            elif isinstance(with_payload, list):
+                payload = {k: v for k, v in self.payloads[i].items() if k in with_payload}
+            points.append({"id": int(i), "version": 0, "score": score, "payload": payload, "vector": None})
+        return points
+
+
+    def retrieve(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Points by id (POST /points), unknown ids skipped"""
+        with_payload = body.get("with_payload", True)
+        points = []
+        for i in body.get("ids") or []:
+            if not isinstance(i, int) or not 0 <= i < len(self.payloads):
+                continue
+            payload = None
+            if with_payload is True:
+                payload = self.payloads[i]
+            elif isinstance(with_payload, list):
+                payload = {k: v for k, v in self.payloads[i].items() if k in with_payload}
+            points.append({"id": i, "payload": payload, "vector": None})
+        return points
+
+
+def create_app(collections: Dict[str, FakeCollection], latency_ms: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Fake Qdrant")
+    
+    def ok(result, started):
+        return {"result": result, "status": "ok", "time": time.perf_counter() - started}
+    
+    def not_found(name):
+        return JSONResponse(status_code=404, content={
+            "status": {"error": f"Not found: Collection `{name}` doesn't exist!"}, "time": 0.0})
+    
+    @app.get("/collections/{name}/exists")
+    async def collection_exists(name: str):
+        return ok({"exists": name in collections}, time.perf_counter())
+    
+    @app.get("/collections/{name}")
+    async def collection_info(name: str):
+        if name not in collections:
+            return not_found(name)
+        return ok(collections[name].info(), time.perf_counter())
+    
+    @app.post("/collections/{name}/points/search")
+    async def search(name: str, request: Request):
+        started = time.perf_counter()
+        if name not in collections:
+            return not_found(name)
+        body = await request.json()
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        try:
+            return ok(collections[name].search(body), started)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"status": {"error": str(e)}, "time": 0.0})
+    
+    @app.post("/collections/{name}/points/search/batch")
+    async def search_batch(name: str, request: Request):
+        started = time.perf_counter()
+        if name not in collections:
+            return not_found(name)
+        body = await request.json()
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)  # one round trip for the whole batch
+        try:
+            return ok([collections[name].search(search) for search in body.get("searches", [])], started)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"status": {"error": str(e)}, "time": 0.0})
+    
+    @app.post("/collections/{name}/points")
+    async def retrieve(name: str, request: Request):
+        started = time.perf_counter()
+        if name not in collections:
+            return not_found(name)
+        body = await request.json()
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        return ok(collections[name].retrieve(body), started)
+    
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deterministic fake Qdrant server for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=6334, help='Port (real Qdrant uses 6333)')
+    parser.add_argument('--collection', default='courses', help='Collection name to serve')
+    parser.add_argument('--kb_dir', default=str(DEFAULT_KB_DIR), help='Directory with embeddings.npy + payloads.jsonl')
+    parser.add_argument('--courses_dir', default=str(DEFAULT_COURSES_DIR), help='Course JSON files (used when kb_dir has no embeddings)')
+    parser.add_argument('--dim', type=int, default=1024, help='Vector size of the synthetic collection')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic vectors')
+    parser.add_argument('--latency_ms', type=float, default=0.0, help='Extra delay added to every search')
+    args = parser.parse_args()
+    
+    kb_dir = Path(args.kb_dir)
+    if (kb_dir / "embeddings.npy").exists() and (kb_dir / "payloads.jsonl").exists():
+        matrix, payloads = load_kb(kb_dir)
+        source = str(kb_dir)
+    else:
+        matrix, payloads = synthetic_kb(Path(args.courses_dir), args.dim, args.seed)
+        source = f"{args.courses_dir} (synthetic vectors, seed {args.seed})"
+    
+    import uvicorn
+    print(f"🗄️  Fake Qdrant on {args.host}:{args.port}: '{args.collection}' = "
+          f"{matrix.shape[0]} points x {matrix.shape[1]} from {source}")
+    app = create_app({args.collection: FakeCollection(matrix, payloads)}, args.latency_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ let isOpen = false;
 let messageHistory = [];
 let currentCourseCode = null;  // Optional: filter by course code
 let currentCourseName = null;  // Optional: filter by course name
+let sessionId = localStorage.getItem('chatbot_session_id');  // Server-side conversation (course, summary)
 
 /**
  * Fetch available courses from backend and populate dropdown (optional)
@@ -152,6 +153,15 @@ function clearConversationMemory() {
     messageHistory = [];
     localStorage.removeItem('chatbot_history');
     
+    // Forget the server-side session too (best effort)
+    if (sessionId) {
+        const baseUrl = getApiEndpoint().replace('/api/chatbot/chat/', '');
+        fetch(`${baseUrl}/api/chatbot/session/${encodeURIComponent(sessionId)}`, { method: 'DELETE' })
+            .catch(() => {});
+        sessionId = null;
+        localStorage.removeItem('chatbot_session_id');
+    }
+    
     // Keep only welcome message
     const welcomeText = "Hello! I'm your UTS Handbook assistant. Ask me about courses, admission requirements, career options, and more!";
     messageHistory.push({
@@ -265,9 +275,14 @@ async function sendToBackend(message) {
             course_code: currentCourseCode || null,
             course_name: currentCourseName || null,
             concise: USE_CONCISE,
-            use_preprocessing: true,  // Use the full preprocessing pipeline
-            history: messageHistory.slice(-10) // Send last 10 messages for context (optional)
+            use_preprocessing: true  // Use the full preprocessing pipeline
         };
+        // The server keeps the conversation; only send history without a session
+        if (sessionId) {
+            requestBody.session_id = sessionId;
+        } else {
+            requestBody.history = messageHistory.slice(-10);
+        }
         
         // Remove null values
         if (!requestBody.course_code) delete requestBody.course_code;
@@ -290,6 +305,11 @@ async function sendToBackend(message) {
         
         const data = await response.json();
         
+        if (data.session_id && data.session_id !== sessionId) {
+            sessionId = data.session_id;
+            localStorage.setItem('chatbot_session_id', sessionId);
+        }
+        
         // Handle response - the API returns { response: "...", success: true }
         if (data.success && data.response) {
             addMessage(data.response, 'bot');
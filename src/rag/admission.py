@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Admission control for LLM-bound requests
+Ollama only generates a few answers at a time; everything beyond that just
+queues inside it until the client times out. AdmissionController bounds the
+number of generations in flight per route, keeps a short FIFO wait queue in
+front, and rejects the rest immediately:
+- 429 when one client key already has too many requests admitted/queued
+- 503 when the queue is full or the queue wait times out
+Both carry a Retry-After estimated from recent generation times, so clients
+back off instead of piling on.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """Request turned away; map to an HTTP error with Retry-After"""
+    
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """An admitted request's slot; release() exactly once (extra calls are ignored)"""
+    
+    def __init__(self, controller: "AdmissionController", client: str, waited: float):
+        self.controller = controller
+        self.client = client
+        self.waited = waited
+        self.admitted_at = time.monotonic()
+        self.released = False
+    
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+def parse_client_limits(spec: str) -> Dict[str, int]:
+    """'key1=8,key2=2' -> {'key1': 8, 'key2': 2}"""
+    limits = {}
+    for part in (spec or "").split(","):
+        key, _, value = part.partition("=")
+        if key.strip() and value.strip():
+            limits[key.strip()] = int(value)
+    return limits
+
+
+class AdmissionController:
+    """Bounded in-flight limit + short FIFO queue + per-client cap for one route"""
+    
+    def __init__(self, route: str, max_in_flight: int = 4, max_queue: int = 16,
+                 queue_timeout: float = 10.0, client_limit: int = 0,
+                 client_limits: Optional[Dict[str, int]] = None):
+        self.route = route
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.client_limit = client_limit          # 0 = no per-client cap
+        self.client_limits = client_limits or {}  # overrides for specific client keys
+        
+        self.in_flight = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self._per_client: Dict[str, int] = {}     # admitted + queued per client key
+        self._hold_ewma: Optional[float] = None   # seconds a slot is typically held
+        
+        self.stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0,
+                      "rejected_client_limit": 0, "queue_timeouts": 0}
+    
+    # ---------- Estimates ----------
+    
+    def _limit_for(self, client: str) -> int:
+        return self.client_limits.get(client, self.client_limit)
+    
+    def retry_after(self, ahead: int = 0) -> int:
+        """Seconds until roughly `ahead` queued requests have been served"""
+        hold = self._hold_ewma or 1.0
+        return max(1, math.ceil(hold * (ahead + 1) / max(self.max_in_flight, 1)))
+    
+    # ---------- Acquire / release ----------
+    
+    async def acquire(self, client: str) -> AdmissionTicket:
+        """Wait for a slot (bounded by queue_timeout) or raise AdmissionRejected"""
+        limit = self._limit_for(client)
+        if limit and self._per_client.get(client, 0) >= limit:
+            self.stats["rejected_client_limit"] += 1
+            raise AdmissionRejected(429, f"Too many concurrent requests for client '{client}'",
+                                    self.retry_after())
+        
+        started = time.monotonic()
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+        else:
+            if len(self._waiters) >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                raise AdmissionRejected(503, "Server busy, generation queue is full",
+                                        self.retry_after(len(self._waiters)))
+            
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            self.stats["queued"] += 1
+            self._per_client[client] = self._per_client.get(client, 0) + 1
+            try:
+                # On success the slot (in_flight already counted) was handed over by _release()
+                await asyncio.wait_for(fut, timeout=self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if fut.done() and not fut.cancelled():
+                    # The slot was handed over just as we gave up - pass it on
+                    self._hand_over()
+                elif fut in self._waiters:
+                    self._waiters.remove(fut)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.stats["queue_timeouts"] += 1
+                raise AdmissionRejected(503, f"Server busy, no generation slot within {self.queue_timeout:g}s",
+                                        self.retry_after(len(self._waiters)))
+            finally:
+                self._drop_client(client)
+        
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        self.stats["admitted"] += 1
+        return AdmissionTicket(self, client, time.monotonic() - started)
+    
+    def _drop_client(self, client: str):
+        count = self._per_client.get(client, 0) - 1
+        if count > 0:
+            self._per_client[client] = count
+        else:
+            self._per_client.pop(client, None)
+    
+    def _hand_over(self):
+        """Give a freed slot to the oldest live waiter, or return it to the pool"""
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+    
+    def _release(self, ticket: AdmissionTicket):
+        held = time.monotonic() - ticket.admitted_at
+        self._hold_ewma = held if self._hold_ewma is None else 0.8 * self._hold_ewma + 0.2 * held
+        self._drop_client(ticket.client)
+        self._hand_over()
+    
+    def snapshot(self) -> Dict:
+        """Counters plus current queue state (for the stats endpoint and /metrics)"""
+        return dict(self.stats, in_flight=self.in_flight, queue_depth=len(self._waiters),
+                    max_in_flight=self.max_in_flight, max_queue=self.max_queue,
+                    hold_seconds=round(self._hold_ewma or 0.0, 3))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Answer cache for the chat endpoint
+Students ask the same questions over and over, and each one costs a full Ollama
+generation. AnswerCache keeps generated answers in two tiers:
+- exact:    normalized query + course filters + concise flag
+- semantic: query embedding within a cosine threshold of a cached one
+            (only compared against entries with the same filters)
+Entries are evicted LRU-first and expire after a TTL. The whole cache is dropped
+when the knowledge base is rebuilt (manifest.json `created_at` changes).
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
+
+import numpy as np
+
+from kb_version import ManifestWatcher
+from query_encoder import normalize_query
+
+FilterKey = Tuple[Optional[str], Optional[str], bool]
+
+
+class AnswerCache:
+    """Exact + semantic LRU/TTL cache of generated answers"""
+    
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600,
+                 semantic_threshold: float = 0.95, manifest_path: str = None,
+                 version_check_interval: float = 10.0):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        
+        # exact key -> {"answer", "vector", "filters", "created"}
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        # filters -> stacked vectors of that group's entries (rebuilt lazily)
+        self._groups: Dict[FilterKey, Dict] = {}
+        
+        self.kb_version = ManifestWatcher(manifest_path, version_check_interval)
+        
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0,
+                      "evictions": 0, "expirations": 0, "invalidations": 0}
+    
+    # ---------- Keys ----------
+    
+    @staticmethod
+    def filter_key(course_code: str = None, course_name: str = None, concise: bool = True) -> FilterKey:
+        return (
+            course_code.upper() if course_code else None,
+            normalize_query(course_name) if course_name else None,
+            bool(concise)
+        )
+    
+    def _exact_key(self, query: str, filters: FilterKey) -> Tuple:
+        return (normalize_query(query),) + filters
+    
+    # ---------- Invalidation ----------
+    
+    def clear(self):
+        self._entries.clear()
+        self._groups.clear()
+    
+    def _check_version(self):
+        """Drop everything if the knowledge base was rebuilt"""
+        if self.kb_version.changed():
+            print(f"🔄 Knowledge base version changed ({self.kb_version.version}), clearing answer cache")
+            self.stats["invalidations"] += 1
+            self.clear()
+    
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            group = self._groups.get(entry["filters"])
+            if group is not None:
+                group["keys"].discard(key)
+                group["matrix"] = None
+    
+    def _expired(self, entry: Dict) -> bool:
+        return time.monotonic() - entry["created"] > self.ttl
+    
+    # ---------- Lookup ----------
+    
+    def get_exact(self, query: str, course_code: str = None, course_name: str = None,
+                  concise: bool = True) -> Optional[str]:
+        """Cached answer for the same normalized question and filters, if any"""
+        self._check_version()
+        key = self._exact_key(query, self.filter_key(course_code, course_name, concise))
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self._remove(key)
+            self.stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["exact_hits"] += 1
+        return entry["answer"]
+    
+    def get_semantic(self, query_vector: List[float], course_code: str = None,
+                     course_name: str = None, concise: bool = True) -> Optional[str]:
+        """Cached answer whose question embedding is close enough to `query_vector`"""
+        filters = self.filter_key(course_code, course_name, concise)
+        group = self._groups.get(filters)
+        if not group or not group["keys"]:
+            self.stats["misses"] += 1
+            return None
+        
+        if group["matrix"] is None:
+            group["order"] = list(group["keys"])
+            group["matrix"] = np.stack([self._entries[k]["vector"] for k in group["order"]])
+        
+        # Vectors are normalized, so the dot product is the cosine similarity
+        sims = group["matrix"] @ np.asarray(query_vector, dtype=np.float32)
+        best = int(np.argmax(sims))
+        key = group["order"][best]
+        entry = self._entries.get(key)
+        if sims[best] < self.semantic_threshold or entry is None:
+            self.stats["misses"] += 1
+            return None
+        if self._expired(entry):
+            self._remove(key)
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["semantic_hits"] += 1
+        return entry["answer"]
+    
+    # ---------- Store ----------
+    
+    def put(self, query: str, answer: str, query_vector: List[float] = None,
+            course_code: str = None, course_name: str = None, concise: bool = True):
+        """Cache an answer (the vector is optional; without it only exact hits are possible)"""
+        self._check_version()
+        filters = self.filter_key(course_code, course_name, concise)
+        key = self._exact_key(query, filters)
+        self._remove(key)
+        
+        vector = np.asarray(query_vector, dtype=np.float32) if query_vector is not None else None
+        self._entries[key] = {"answer": answer, "vector": vector,
+                              "filters": filters, "created": time.monotonic()}
+        if vector is not None:
+            group = self._groups.setdefault(filters, {"keys": set(), "matrix": None})
+            group["keys"].add(key)
+            group["matrix"] = None
+        
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+    
+    def snapshot(self) -> Dict:
+        """Counters plus current size/version (for the stats endpoint)"""
+        lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        return dict(self.stats, size=len(self._entries), version=self.kb_version.version,
+                    hit_rate=round(hits / lookups, 4) if lookups else 0.0)
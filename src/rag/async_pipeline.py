@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Async RAG pipeline for the API server
+Same steps as query_with_full_pipeline() / query_courses(), modelled as explicit
+stages (RagPipeline) over a per-request RagRun, and without blocking the event loop:
+- query embedding goes through QueryEncoder (batched, cached, bounded thread pool)
+- Qdrant search goes through AsyncQdrantClient
+- Ollama is called through OllamaClient (pooled keep-alive connections,
+  keep_alive hint so the model stays loaded)
+- the context is packed to a token budget derived from the model's num_ctx
+"""
+import asyncio
+import math
+import time
+from typing import List, Dict, Any, Optional
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models as qm
+
+from context_packer import ContextPacker, context_budget, messages_tokens
+from filtered_retrieval import check_result_quality
+from ollama_client import OllamaClient, response_stats
+from query_encoder import QueryEncoder, normalize_query
+from query_hybrid_rag import (
+    build_course_filter, build_ollama_messages, mrl_query_vector, rescore_request
+)
+from sparse_index import BM25Index, rrf_fuse
+
+# ---------- Retrieval ----------
+
+async def async_retrieve_courses(
+    query: str,
+    encoder: QueryEncoder,
+    client: AsyncQdrantClient,
+    collection: str = "courses",
+    course_code: str = None,
+    course_name: str = None,
+    limit: int = 30,
+    search_params: qm.SearchParams = None
+):
+    """Async version of filtered_retrieval.retrieve_courses() (hits sorted by score)"""
+    qv = await encoder.encode(query)
+    
+    hits = await client.search(
+        collection_name=collection,
+        query_vector=qv,
+        query_filter=build_course_filter(course_code, course_name),
+        limit=limit,
+        with_payload=True,
+        search_params=search_params
+    )
+    
+    hits.sort(key=lambda x: x.score, reverse=True)
+    return hits
+
+async def async_mrl_search(client: AsyncQdrantClient, collection: str, qv, query_filter, limit: int,
+                           mrl_dim: int, oversampling: float = 4.0, search_params: qm.SearchParams = None):
+    """Async version of query_hybrid_rag.mrl_search() (Matryoshka first pass + full rescoring)"""
+    candidates = await client.search(
+        collection_name=collection,
+        query_vector=mrl_query_vector(qv, mrl_dim),
+        query_filter=query_filter,
+        limit=int(math.ceil(limit * oversampling)),
+        with_payload=False,
+        search_params=search_params
+    )
+    if not candidates:
+        return []
+    return await client.search(collection_name=collection, **rescore_request(qv, candidates, limit))
+
+
+# ---------- Staged pipeline ----------
+
+class RagRun:
+    """
+    Per-request state of one RAG query. Each stage stores its output here, so a
+    retry or fallback only redoes the stage that failed and every variant of the
+    pipeline (with/without quality checks, blocking/streaming generation) works
+    from the same embedded query and retrieved hits.
+    """
+    
+    def __init__(self, query: str, course_code: str = None, course_name: str = None,
+                 concise: bool = True, query_vector: List[float] = None, conversation: str = ""):
+        self.query = query
+        self.course_code = course_code
+        self.course_name = course_name
+        self.concise = concise
+        self.conversation = conversation  # earlier turns of the session, for the prompt
+        
+        # Stage outputs
+        self.normalized_query: Optional[str] = None
+        self.query_vector: Optional[List[float]] = query_vector
+        self.hits: Optional[list] = None
+        self.rerank_scores: Optional[List[float]] = None  # aligned with hits once reranked
+        self.quality: Optional[Dict[str, Any]] = None
+        self.context: Optional[str] = None
+        self.context_info: Dict[str, Any] = {}  # packer stats: budget, tokens, chunks, dedup/truncation
+        self.answer: Optional[str] = None
+        self.ollama_stats: Dict[str, Any] = {}  # Ollama timing/token fields of the generation
+        
+        # Bookkeeping
+        self.timings: Dict[str, float] = {}   # stage -> milliseconds
+        self.errors: Dict[str, str] = {}      # stage -> last error
+        self.degraded: List[str] = []         # stages that fell back to a cheaper result
+        self.reused: Optional[str] = None     # hits taken from the session's last candidates (followup_reuse.py)
+
+
+class RagPipeline:
+    """
+    normalize → embed → search → quality check → rerank → context build → generate
+    
+    Stages whose output is already on the RagRun are skipped. Failing stages are
+    retried (`retries` times) and then degraded where a cheaper result exists:
+    search drops the fuzzy course_name filter, context build falls back to plain
+    concatenation, generation returns an error message instead of raising.
+    
+    The context is packed by `packer` (context_packer.ContextPacker) into
+    whatever `num_ctx` leaves after the prompt and `answer_tokens`, capped at
+    `max_context_tokens`. Generation goes through `ollama` (OllamaClient), which
+    sends its configured options (e.g. {"num_ctx": 4096}) and keep_alive.
+    
+    With a `sparse` BM25Index the search stage is hybrid: the dense (Qdrant)
+    and sparse (BM25) legs run concurrently and are fused with reciprocal-rank
+    fusion; their latencies are recorded as "search" and "sparse". If the
+    sparse leg fails, the dense results are used alone.
+    
+    With a `reranker` the candidates are reordered by a cross-encoder and only
+    the best `topn` go into the context; over its time budget the stage is
+    skipped (degraded) and the retrieval order is kept.
+    """
+    
+    def __init__(self, encoder: QueryEncoder, qdrant: AsyncQdrantClient, ollama: OllamaClient,
+                 collection: str = "courses", k: int = 30, topn: int = 8,
+                 retries: int = 1, sparse: BM25Index = None, fusion_k: int = 60, reranker=None,
+                 packer: ContextPacker = None, num_ctx: int = 2048, answer_tokens: int = 512,
+                 max_context_tokens: int = 1200,
+                 search_params: qm.SearchParams = None, mrl_dim: int = 0, mrl_oversampling: float = 4.0):
+        self.encoder = encoder
+        self.qdrant = qdrant
+        self.ollama = ollama
+        self.collection = collection
+        self.k = k
+        self.topn = topn
+        self.retries = retries
+        self.sparse = sparse
+        self.fusion_k = fusion_k
+        self.reranker = reranker
+        self.packer = packer or ContextPacker(max_context_tokens, max_chunks=topn)
+        self.num_ctx = num_ctx
+        self.answer_tokens = answer_tokens
+        self.max_context_tokens = max_context_tokens
+        self.search_params = search_params  # oversampling/rescoring on a quantized collection
+        self.mrl_dim = mrl_dim  # > 0: two-stage search (Matryoshka first pass, full rescoring)
+        self.mrl_oversampling = mrl_oversampling
+    
+    async def _attempt(self, run: RagRun, stage: str, fn, retries: int = None):
+        """Run one stage with timing and retries; re-raises the last error"""
+        retries = self.retries if retries is None else retries
+        started = time.perf_counter()
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    result = fn()
+                    if asyncio.iscoroutine(result):
+                        result = await result
+                    return result
+                except Exception as e:
+                    run.errors[stage] = str(e)
+                    print(f"⚠️  Stage '{stage}' failed (attempt {attempt + 1}/{retries + 1}): {e}")
+                    if attempt == retries:
+                        raise
+        finally:
+            run.timings[stage] = run.timings.get(stage, 0.0) + (time.perf_counter() - started) * 1000
+    
+    # ---------- Stages ----------
+    
+    async def normalize(self, run: RagRun):
+        if run.normalized_query is None:
+            run.normalized_query = normalize_query(run.query)
+            if run.course_code:
+                run.course_code = run.course_code.strip().upper()
+    
+    async def embed(self, run: RagRun):
+        # Only search needs the vector; hits given up front (follow-ups) skip both
+        if run.query_vector is None and run.hits is None:
+            run.query_vector = await self._attempt(run, "embed", lambda: self.encoder.encode(run.query))
+    
+    async def search(self, run: RagRun):
+        if run.hits is not None:
+            return
+        
+        if self.sparse is None:
+            run.hits = await self._dense_search(run)
+            return
+        
+        self.sparse = self.sparse.refresh_if_changed()
+        dense, sparse = await asyncio.gather(self._dense_search(run), self._sparse_search(run))
+        run.hits = rrf_fuse([dense, sparse], k=self.fusion_k, limit=self.k)
+    
+    async def _sparse_search(self, run: RagRun):
+        """BM25 leg (in a worker thread so it overlaps the Qdrant call); None on failure"""
+        index = self.sparse
+        try:
+            return await self._attempt(run, "sparse", lambda: asyncio.to_thread(
+                index.search, run.query, self.k, run.course_code, run.course_name
+            ), retries=0)
+        except Exception:
+            run.degraded.append("sparse")
+            return None
+    
+    async def _dense_search(self, run: RagRun):
+        async def _search(course_name):
+            if self.mrl_dim:
+                return await async_mrl_search(
+                    self.qdrant, self.collection, run.query_vector,
+                    build_course_filter(run.course_code, course_name), self.k,
+                    self.mrl_dim, self.mrl_oversampling, self.search_params
+                )
+            hits = await self.qdrant.search(
+                collection_name=self.collection,
+                query_vector=run.query_vector,
+                query_filter=build_course_filter(run.course_code, course_name),
+                limit=self.k,
+                with_payload=True,
+                search_params=self.search_params
+            )
+            hits.sort(key=lambda x: x.score, reverse=True)
+            return hits
+        
+        try:
+            return await self._attempt(run, "search", lambda: _search(run.course_name))
+        except Exception:
+            # MatchText on course_name needs a full-text index; retry without it
+            if not run.course_name:
+                raise
+            run.degraded.append("search")
+            return await self._attempt(run, "search", lambda: _search(None), retries=0)
+    
+    async def check_quality(self, run: RagRun):
+        if run.quality is None:
+            run.quality = check_result_quality(run.hits, run.query)
+    
+    async def rerank(self, run: RagRun):
+        if self.reranker is None or not run.hits or run.rerank_scores is not None or "rerank" in run.degraded:
+            return
+        try:
+            scores = await self._attempt(run, "rerank", lambda: self.reranker.ascore(run.query, run.hits),
+                                         retries=0)
+        except Exception:
+            scores = None
+        if scores is None:
+            # Over budget (or failed): keep the retrieval order
+            run.degraded.append("rerank")
+            return
+        ranked = sorted(range(len(run.hits)), key=lambda i: -scores[i])
+        run.hits = [run.hits[i] for i in ranked]
+        run.rerank_scores = [scores[i] for i in ranked]
+    
+    def context_budget(self, run: RagRun) -> int:
+        """Context tokens left in num_ctx after the prompt and the answer reserve"""
+        overhead = messages_tokens(build_ollama_messages(run.query, "", run.concise, run.conversation),
+                                   self.packer.count_tokens)
+        return context_budget(self.num_ctx, overhead, self.answer_tokens, self.max_context_tokens)
+    
+    async def build_context(self, run: RagRun):
+        if run.context is not None:
+            return
+        # Reranked hits are trustworthy enough to cut at topn; cosine order isn't
+        if run.rerank_scores is not None:
+            hits, scores = run.hits[:self.topn], run.rerank_scores[:self.topn]
+        else:
+            hits, scores = run.hits, None
+        try:
+            run.context, run.context_info = await self._attempt(
+                run, "context",
+                lambda: self.packer.pack(hits, scores, self.context_budget(run)),
+                retries=0
+            )
+        except Exception:
+            run.degraded.append("context")
+            run.context = "\n\n".join((hit.payload or {}).get("text", "") for hit in hits[:self.topn])
+    
+    async def generate(self, run: RagRun):
+        if run.answer is not None:
+            return
+        try:
+            data = await self._attempt(run, "generate", lambda: self.ollama.chat(
+                build_ollama_messages(run.query, run.context, run.concise, run.conversation)
+            ))
+            run.answer = data["message"]["content"]
+            run.ollama_stats = response_stats(data)
+        except Exception as e:
+            run.degraded.append("generate")
+            run.answer = f"Error generating response: {e}"
+    
+    # ---------- Drivers ----------
+    
+    async def retrieve(self, run: RagRun, quality_check: bool = True):
+        """Stages up to and including context build (everything generation needs)"""
+        await self.normalize(run)
+        await self.embed(run)
+        await self.search(run)
+        if quality_check:
+            await self.check_quality(run)
+        if run.hits:
+            await self.rerank(run)
+            await self.build_context(run)
+    
+    async def execute(self, run: RagRun, generate: bool = True, quality_check: bool = True) -> str:
+        """Run every stage that hasn't produced its output yet and return the answer"""
+        await self.retrieve(run, quality_check=quality_check)
+        
+        if not run.hits:
+            print("❌ No results found.")
+            return "No relevant course information found."
+        print(f"  Results: {len(run.hits)} (top score {run.hits[0].score:.3f})")
+        
+        if not generate:
+            return "Search completed (no generation requested)"
+        
+        await self.generate(run)
+        return run.answer
+    
+    # ---------- Batch retrieval ----------
+    
+    async def search_batch(self, runs: List[RagRun], limit: int = None, with_payload=True) -> Dict[str, float]:
+        """Retrieve hits for many runs at once (no rerank, no generation)
+        
+        The queries are embedded in one batched encode and searched with one
+        Qdrant search_batch call (two with mrl_dim: the Matryoshka first pass,
+        then the full-vector rescoring of every query's candidates). With a
+        sparse index each run is fused with its BM25 leg as in search().
+        `with_payload` may be a list of payload keys to keep responses small.
+        Returns the batch stage timings in milliseconds.
+        """
+        limit = limit or self.k
+        timings = {}
+        for run in runs:
+            await self.normalize(run)
+        
+        started = time.perf_counter()
+        todo = [run for run in runs if run.query_vector is None]
+        if todo:
+            vectors = await self.encoder.encode_many([run.query for run in todo])
+            for run, vector in zip(todo, vectors):
+                run.query_vector = vector
+        timings["embed"] = (time.perf_counter() - started) * 1000
+        
+        started = time.perf_counter()
+        filters = [build_course_filter(run.course_code, run.course_name) for run in runs]
+        if self.mrl_dim:
+            candidates = await self.qdrant.search_batch(collection_name=self.collection, requests=[
+                qm.SearchRequest(vector=mrl_query_vector(run.query_vector, self.mrl_dim), filter=flt,
+                                 limit=int(math.ceil(limit * self.mrl_oversampling)), with_payload=False,
+                                 params=self.search_params)
+                for run, flt in zip(runs, filters)
+            ])
+            requests = []
+            for run, hits in zip(runs, candidates):
+                rescore = rescore_request(run.query_vector, hits, limit)
+                requests.append(qm.SearchRequest(vector=rescore["query_vector"], filter=rescore["query_filter"],
+                                                 limit=limit, with_payload=with_payload))
+        else:
+            requests = [
+                qm.SearchRequest(vector=list(map(float, run.query_vector)), filter=flt, limit=limit,
+                                 with_payload=with_payload, params=self.search_params)
+                for run, flt in zip(runs, filters)
+            ]
+        dense = await self.qdrant.search_batch(collection_name=self.collection, requests=requests)
+        timings["search"] = (time.perf_counter() - started) * 1000
+        
+        if self.sparse is None:
+            for run, hits in zip(runs, dense):
+                run.hits = sorted(hits, key=lambda x: x.score, reverse=True)
+            return timings
+        
+        started = time.perf_counter()
+        self.sparse = self.sparse.refresh_if_changed()
+        index = self.sparse
+        
+        def _sparse_all():
+            return [index.search(run.query, limit, run.course_code, run.course_name) for run in runs]
+        
+        try:
+            sparse = await asyncio.to_thread(_sparse_all)
+        except Exception as e:
+            print(f"⚠️  Batch BM25 search failed, using dense results only: {e}")
+            sparse = [None] * len(runs)
+        for run, hits, bm25 in zip(runs, dense, sparse):
+            run.hits = rrf_fuse([hits, bm25], k=self.fusion_k, limit=limit)
+        timings["sparse"] = (time.perf_counter() - started) * 1000
+        return timings
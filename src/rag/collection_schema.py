@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Declared schema of the Qdrant course collection
+Vector, HNSW and payload storage settings and the payload indexes live here, in
+one place, and are applied by every code path that creates the collection
+(upsert_to_qdrant_from_files.py) as well as by --migrate for an existing one.
+Without payload indexes every course_code / course_name filter scans payloads.
+
+Payload indexes:
+    course_code, chunk_type, study_level, faculty   keyword (exact MatchValue / MatchAny)
+    course_name                                     full text (MatchText)
+
+Payload storage: indexed fields are always held in memory; ON_DISK_PAYLOAD
+decides where the rest of the payload (mostly chunk text) lives. The course
+collection is a few thousand small chunks, so it stays in RAM by default.
+
+Vector quantization (optional, chosen at build time with
+upsert_to_qdrant_from_files.py --quantization):
+    none     float32 vectors in RAM (4 bytes per dimension)
+    int8     scalar quantization, 1 byte per dimension (4x smaller)
+    binary   1 bit per dimension (32x smaller); needs rescoring to keep recall
+The quantized vectors stay in RAM, the float32 originals move to disk and are
+only read to rescore the oversampled candidates (search_params()).
+
+Matryoshka first pass (optional, --mrl_dim 128|256): Qwen3-Embedding vectors
+can be truncated to their first dimensions and re-normalized. The collection
+then has two named vectors:
+    mrl    truncated vector, HNSW-indexed, in RAM - searched first
+    full   1024-d vector on disk, no HNSW graph - rescores the candidates by id
+
+Usage:
+    python collection_schema.py --collection courses --verify    # exit 1 if anything is missing
+    python collection_schema.py --collection courses --migrate   # create missing indexes, fix settings
+"""
+import argparse
+from typing import Dict, List, Optional, Union
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qm
+
+DISTANCE = qm.Distance.COSINE   # embeddings are normalized
+HNSW_M = 32
+HNSW_EF_CONSTRUCT = 256
+ON_DISK_VECTORS = False
+ON_DISK_PAYLOAD = False
+
+QUANTIZATIONS = ("none", "int8", "binary")
+MRL_DIMS = (128, 256)
+FULL_VECTOR = "full"
+MRL_VECTOR = "mrl"
+INT8_QUANTILE = 0.99    # clip the outer 1% of values so the int8 range isn't wasted on outliers
+
+PAYLOAD_INDEXES: Dict[str, Union[qm.PayloadSchemaType, qm.TextIndexParams]] = {
+    "course_code": qm.PayloadSchemaType.KEYWORD,
+    "chunk_type": qm.PayloadSchemaType.KEYWORD,
+    "study_level": qm.PayloadSchemaType.KEYWORD,
+    "faculty": qm.PayloadSchemaType.KEYWORD,    # list of faculties; matches any element
+    "course_name": qm.TextIndexParams(
+        type=qm.TextIndexType.TEXT,
+        tokenizer=qm.TokenizerType.WORD,
+        min_token_len=2,
+        max_token_len=32,
+        lowercase=True,
+    ),
+}
+
+
+def index_type(field_schema) -> str:
+    """'keyword', 'text', ... for a declared index or a PayloadIndexInfo.data_type"""
+    if isinstance(field_schema, qm.TextIndexParams):
+        return "text"
+    return getattr(field_schema, "value", str(field_schema))
+
+
+# ---------- Create ----------
+
+def vectors_config(dim: int, quantization: str = "none",
+                   mrl_dim: int = 0) -> Union[qm.VectorParams, Dict[str, qm.VectorParams]]:
+    # Quantized collections search the in-RAM codes; originals are only read for rescoring
+    on_disk = ON_DISK_VECTORS or quantization != "none"
+    if not mrl_dim:
+        return qm.VectorParams(size=dim, distance=DISTANCE, on_disk=on_disk)
+    return {
+        MRL_VECTOR: qm.VectorParams(size=mrl_dim, distance=DISTANCE, on_disk=on_disk),
+        # Only looked up by id to rescore: no graph (m=0), kept on disk
+        FULL_VECTOR: qm.VectorParams(size=dim, distance=DISTANCE, on_disk=True,
+                                     hnsw_config=qm.HnswConfigDiff(m=0)),
+    }
+
+
+def quantization_config(quantization: str = "none") -> Optional[qm.QuantizationConfig]:
+    if quantization == "int8":
+        return qm.ScalarQuantization(scalar=qm.ScalarQuantizationConfig(
+            type=qm.ScalarType.INT8, quantile=INT8_QUANTILE, always_ram=True))
+    if quantization == "binary":
+        return qm.BinaryQuantization(binary=qm.BinaryQuantizationConfig(always_ram=True))
+    if quantization != "none":
+        raise ValueError(f"Unknown quantization '{quantization}' (choose from {', '.join(QUANTIZATIONS)})")
+    return None
+
+
+def search_params(oversampling: float = None, rescore: bool = True, hnsw_ef: int = None) -> Optional[qm.SearchParams]:
+    """Search parameters for a quantized collection (None = server defaults)
+    
+    Fetches limit * oversampling candidates by the quantized vectors and, with
+    `rescore`, reorders them by the original float32 vectors.
+    """
+    if oversampling is None and hnsw_ef is None:
+        return None
+    quantization = None
+    if oversampling is not None:
+        quantization = qm.QuantizationSearchParams(ignore=False, rescore=rescore, oversampling=oversampling)
+    return qm.SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
+
+
+def hnsw_config() -> qm.HnswConfigDiff:
+    return qm.HnswConfigDiff(m=HNSW_M, ef_construct=HNSW_EF_CONSTRUCT)
+
+
+def create_collection(client: QdrantClient, collection: str, dim: int, recreate: bool = False,
+                      quantization: str = "none", mrl_dim: int = 0):
+    """Create (or drop and recreate) the collection with the declared settings and indexes"""
+    kwargs = dict(collection_name=collection, vectors_config=vectors_config(dim, quantization, mrl_dim),
+                  hnsw_config=hnsw_config(), on_disk_payload=ON_DISK_PAYLOAD,
+                  quantization_config=quantization_config(quantization))
+    if recreate:
+        client.recreate_collection(**kwargs)
+    else:
+        client.create_collection(**kwargs)
+    # Indexes are cheapest to build while points are being inserted
+    create_payload_indexes(client, collection, PAYLOAD_INDEXES)
+
+
+def create_payload_indexes(client: QdrantClient, collection: str, indexes: Dict) -> List[str]:
+    for field, field_schema in indexes.items():
+        client.create_payload_index(collection_name=collection, field_name=field,
+                                    field_schema=field_schema, wait=True)
+    return list(indexes)
+
+
+# ---------- Verify / migrate ----------
+
+def schema_problems(info: qm.CollectionInfo) -> List[str]:
+    """Differences between a collection (get_collection() result) and the declared schema"""
+    problems = []
+    existing = info.payload_schema or {}
+    for field, field_schema in PAYLOAD_INDEXES.items():
+        wanted = index_type(field_schema)
+        if field not in existing:
+            problems.append(f"missing {wanted} index on '{field}'")
+        elif index_type(existing[field].data_type) != wanted:
+            problems.append(f"index on '{field}' is {index_type(existing[field].data_type)}, expected {wanted}")
+    
+    params = info.config.params
+    if bool(params.on_disk_payload) != ON_DISK_PAYLOAD:
+        problems.append(f"on_disk_payload is {bool(params.on_disk_payload)}, expected {ON_DISK_PAYLOAD}")
+    hnsw = info.config.hnsw_config
+    if (hnsw.m, hnsw.ef_construct) != (HNSW_M, HNSW_EF_CONSTRUCT):
+        problems.append(f"HNSW m={hnsw.m} ef_construct={hnsw.ef_construct}, "
+                        f"expected m={HNSW_M} ef_construct={HNSW_EF_CONSTRUCT}")
+    return problems
+
+
+def migrate(client: QdrantClient, collection: str) -> List[str]:
+    """Bring an existing collection in line with the schema; returns what was changed"""
+    info = client.get_collection(collection)
+    existing = info.payload_schema or {}
+    actions = []
+    
+    missing = {}
+    for field, field_schema in PAYLOAD_INDEXES.items():
+        current = existing.get(field)
+        if current is not None and index_type(current.data_type) != index_type(field_schema):
+            client.delete_payload_index(collection_name=collection, field_name=field, wait=True)
+            actions.append(f"dropped {index_type(current.data_type)} index on '{field}'")
+            current = None
+        if current is None:
+            missing[field] = field_schema
+    for field in create_payload_indexes(client, collection, missing):
+        actions.append(f"created {index_type(PAYLOAD_INDEXES[field])} index on '{field}'")
+    
+    params = info.config.params
+    hnsw = info.config.hnsw_config
+    if bool(params.on_disk_payload) != ON_DISK_PAYLOAD or (hnsw.m, hnsw.ef_construct) != (HNSW_M, HNSW_EF_CONSTRUCT):
+        client.update_collection(collection_name=collection,
+                                 collection_params=qm.CollectionParamsDiff(on_disk_payload=ON_DISK_PAYLOAD),
+                                 hnsw_config=hnsw_config())
+        actions.append(f"set on_disk_payload={ON_DISK_PAYLOAD}, HNSW m={HNSW_M} ef_construct={HNSW_EF_CONSTRUCT}")
+    return actions
+
+
+# ---------- CLI ----------
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify or migrate the Qdrant collection schema')
+    parser.add_argument('--collection', default='courses', help='Qdrant collection name')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6333)
+    parser.add_argument('--migrate', action='store_true', help='Create missing indexes and fix settings')
+    parser.add_argument('--verify', action='store_true', help='Report differences from the schema (default)')
+    parser.add_argument('--skip_version_check', action='store_true',
+                        help='Skip qdrant-client/server compatibility check (useful if client > server).')
+    args = parser.parse_args()
+    
+    client_kwargs = dict(host=args.host, port=args.port)
+    if args.skip_version_check:
+        client_kwargs["check_compatibility"] = False  # qdrant-client >= 1.11
+    client = QdrantClient(**client_kwargs)
+    
+    if args.migrate:
+        actions = migrate(client, args.collection)
+        for action in actions:
+            print(f"🔧 {action}")
+        if not actions:
+            print(f"✅ '{args.collection}' already matches the schema")
+    
+    problems = schema_problems(client.get_collection(args.collection))
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        print(f"Run with --migrate to fix '{args.collection}'")
+        return 1
+    print(f"✅ '{args.collection}': {len(PAYLOAD_INDEXES)} payload indexes present, settings match")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
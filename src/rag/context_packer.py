@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Token-budget context packer
+Builds the LLM context from retrieved chunks in model tokens rather than
+characters:
+- chunk sizes come from `n_tokens`, precomputed at ingest by save_kb_files.py
+  and stored in the payload (estimated from length for older KBs)
+- citation headers are counted too
+- lines already present in a selected chunk are removed (the `course_info`
+  chunk repeats the course overview, for example); a chunk that is entirely
+  duplicate is dropped
+- chunks are chosen greedily by relevance per token, and the best one is
+  truncated to fit instead of being skipped
+- the budget comes from the Ollama model's real num_ctx minus the prompt
+  overhead and the tokens reserved for the answer (see context_budget())
+Selected chunks are emitted in relevance order.
+"""
+import math
+from typing import Callable, Dict, List, Optional, Tuple
+
+CHARS_PER_TOKEN = 4.0
+# <|im_start|>role\n ... <|im_end|>\n around every message (and the assistant turn)
+MESSAGE_OVERHEAD_TOKENS = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count when no tokenizer is at hand (~4 characters per token)"""
+    return int(math.ceil(len(text or "") / CHARS_PER_TOKEN))
+
+
+def tokenizer_counter(tokenizer) -> Callable[[str], int]:
+    """Token counter backed by a Hugging Face tokenizer (estimate_tokens if None)"""
+    if tokenizer is None:
+        return estimate_tokens
+    return lambda text: len(tokenizer.encode(text or "", add_special_tokens=False))
+
+
+def count_chunk_tokens(texts: List[str], tokenizer=None) -> List[int]:
+    """Token counts of chunk texts for the `n_tokens` payload field (batched)"""
+    if tokenizer is None:
+        return [estimate_tokens(t) for t in texts]
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+def messages_tokens(messages: List[Dict[str, str]], count_tokens: Callable[[str], int] = estimate_tokens) -> int:
+    """Prompt tokens of chat messages, including the chat template's per-message markers"""
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages) + MESSAGE_OVERHEAD_TOKENS
+
+
+def format_context_header(payload: Dict) -> str:
+    """Citation header of a context block, e.g. [Course Code: C10302 | (...) | - Overview]"""
+    course_code = payload.get("course_code", "")
+    course_name = payload.get("course_name", "")
+    chunk_label = payload.get("chunk_label", "")
+    source_url = payload.get("source_url", "")
+    
+    cite_parts = []
+    if course_code:
+        cite_parts.append(f"Course Code: {course_code}")
+    if course_name:
+        cite_parts.append(f"({course_name})")
+    if chunk_label:
+        cite_parts.append(f"- {chunk_label}")
+    
+    cite = " | ".join(cite_parts)
+    if source_url:
+        cite += f"\nSource: {source_url}"
+    return f"[{cite}]"
+
+
+def _line_key(line: str) -> str:
+    return " ".join(line.split()).casefold()
+
+
+def context_budget(num_ctx: int, overhead_tokens: int, answer_tokens: int = 512,
+                   max_context_tokens: int = 1200) -> int:
+    """Tokens available for context: what's left of num_ctx, capped at max_context_tokens"""
+    return max(0, min(max_context_tokens, num_ctx - overhead_tokens - answer_tokens))
+
+
+class ContextPacker:
+    """Selects, dedups and truncates chunks to fit a token budget"""
+    
+    def __init__(self, budget_tokens: int = 1200, max_chunks: int = 8,
+                 count_tokens: Callable[[str], int] = estimate_tokens,
+                 min_truncate_tokens: int = 48, min_line_chars: int = 20):
+        self.budget_tokens = budget_tokens
+        self.max_chunks = max_chunks
+        self.count_tokens = count_tokens
+        self.min_truncate_tokens = min_truncate_tokens
+        # Short lines ("Overview:", "Notes:") repeat legitimately; don't dedup them
+        self.min_line_chars = min_line_chars
+    
+    def _chunk_tokens(self, payload: Dict, text: str) -> int:
+        n = payload.get("n_tokens")
+        if n is None:
+            return self.count_tokens(text)
+        return int(n)
+    
+    @staticmethod
+    def _values(hits: List, scores: Optional[List[float]]) -> List[float]:
+        """Relevance in (0, 1]: min-max scaled scores (cross-encoder logits can be negative)"""
+        raw = list(scores) if scores is not None else [hit.score for hit in hits]
+        if not raw:
+            return []
+        lo, hi = min(raw), max(raw)
+        if hi - lo < 1e-9:
+            return [1.0] * len(raw)
+        return [0.05 + 0.95 * (s - lo) / (hi - lo) for s in raw]
+    
+    def _truncate(self, text: str, n_tokens: int, max_tokens: int) -> str:
+        """Cut `text` to about `max_tokens` at a line (or word) boundary"""
+        keep_chars = int(len(text) * max_tokens / max(n_tokens, 1))
+        cut = text[:keep_chars]
+        boundary = cut.rfind("\n")
+        if boundary < keep_chars // 2:
+            boundary = cut.rfind(" ")
+        if boundary > 0:
+            cut = cut[:boundary]
+        return cut.rstrip() + " ..."
+    
+    def pack(self, hits: List, scores: Optional[List[float]] = None,
+             budget_tokens: int = None) -> Tuple[str, Dict]:
+        """(context, info) for `hits`; `scores` (e.g. rerank scores) override hit.score"""
+        budget = self.budget_tokens if budget_tokens is None else budget_tokens
+        values = self._values(hits, scores)
+        info = {"budget": budget, "tokens": 0, "chunks": 0, "deduped_lines": 0,
+                "dropped_duplicates": 0, "truncated": 0, "candidates": len(hits), "selected": []}
+        
+        # Candidates with their cost in tokens (header + text)
+        candidates = []
+        for rank, hit in enumerate(hits):
+            payload = hit.payload or {}
+            text = payload.get("text", "")
+            if not text:
+                continue
+            header = format_context_header(payload)
+            cost = self.count_tokens(header) + 1 + self._chunk_tokens(payload, text)
+            candidates.append({"rank": rank, "payload": payload, "header": header, "text": text,
+                               "tokens": cost, "value": values[rank]})
+        if not candidates:
+            return "", info
+        
+        # Best chunk first (truncated if needed), then the rest by value per token
+        order = [candidates[0]] + sorted(candidates[1:], key=lambda c: c["value"] / c["tokens"], reverse=True)
+        
+        seen_lines = set()
+        selected = []
+        remaining = budget
+        for c in order:
+            if len(selected) >= self.max_chunks or remaining < self.min_truncate_tokens:
+                break
+            
+            # Drop lines that an already selected chunk contains
+            lines = c["text"].split("\n")
+            kept = [line for line in lines
+                    if len(line.strip()) < self.min_line_chars or _line_key(line) not in seen_lines]
+            removed = len(lines) - len(kept)
+            text = c["text"]
+            tokens = c["tokens"]
+            if removed:
+                if all(len(line.strip()) < self.min_line_chars for line in kept):
+                    info["dropped_duplicates"] += 1
+                    continue
+                info["deduped_lines"] += removed
+                new_text = "\n".join(kept)
+                header_tokens = self.count_tokens(c["header"]) + 1
+                tokens = header_tokens + int(math.ceil((tokens - header_tokens) * len(new_text) / max(len(text), 1)))
+                text = new_text
+            
+            if tokens > remaining:
+                # Only the top chunk is worth truncating; others make room for denser ones
+                if c is not order[0]:
+                    continue
+                header_tokens = self.count_tokens(c["header"]) + 1
+                text = self._truncate(text, tokens - header_tokens, remaining - header_tokens)
+                tokens = remaining
+                info["truncated"] += 1
+            
+            for line in text.split("\n"):
+                if len(line.strip()) >= self.min_line_chars:
+                    seen_lines.add(_line_key(line))
+            selected.append((c["rank"], f"{c['header']}\n{text}"))
+            remaining -= tokens
+            info["tokens"] += tokens
+        
+        selected.sort(key=lambda x: x[0])
+        info["chunks"] = len(selected)
+        info["selected"] = [rank for rank, _ in selected]  # indexes into `hits`
+        return "\n\n".join(block for _, block in selected), info
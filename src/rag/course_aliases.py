@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Course name / alias resolver
+Maps course mentions in free text ("Bachelor of Acounting", "BBus", "bachelor
+of comp...") to course codes, so retrieval can filter on the course_code
+keyword (MatchValue / MatchAny) instead of a fuzzy MatchText on course_name,
+which needs a full-text index and is slow at query time.
+
+Built from the same data/courses/*.json records as the CourseCatalog:
+- aliases: course names, award names ("Bachelor of Business") and award
+  abbreviations ("BBus", "BIT") from the `awards` field
+- a character trie over the normalized aliases finds the longest alias that
+  starts at each word of a message, and completes a trailing prefix
+- a character-trigram index over the alias vocabulary corrects misspelled
+  words before the trie lookup; whole names are also matched by trigram
+  similarity when looked up directly
+
+Usage:
+    python course_aliases.py --q "What are the admission requirements for the Bachelor of Acounting?"
+    python course_aliases.py --q "BBus majors"
+"""
+import argparse
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+# Get project root directory
+SCRIPT_DIR = Path(__file__).parent.resolve()
+HANDBOOK_ROOT = Path(os.environ.get('HANDBOOK_ROOT', SCRIPT_DIR.parent.parent))
+DEFAULT_COURSES_DIR = HANDBOOK_ROOT / "data" / "courses"
+
+_WORD = re.compile(r"[a-z0-9]+")
+_PAREN = re.compile(r"\(((?:[^()]|\([^()]*\))*)\)")     # one level of nesting: "(LLB(Hons))"
+_ABBREVIATION = re.compile(r"[A-Za-z][A-Za-z0-9]*(?:\([A-Za-z]+\))?")
+_MAJOR_PLACEHOLDER = re.compile(r"\s*\bin\s*\(name of[^)]*\)", re.I)
+_COURSE_CODE = re.compile(r"^C\d{5}$")
+_TERMINAL = "\0"
+
+# Alias sources, best first: an alias keeps only the codes of its best source
+NAME, AWARD = 0, 1
+# Aliases made only of these words ("bachelor of", "none") would match anything
+GENERIC_WORDS = frozenset(
+    "a and bachelor certificate diploma doctor graduate honours in master none of the".split()
+)
+
+
+def normalize_alias(text: str) -> str:
+    """'Bachelor of Business (Honours)' -> 'bachelor of business honours'"""
+    return " ".join(_WORD.findall((text or "").lower().replace("&", " and ")))
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def is_abbreviation(text: str) -> bool:
+    """'BBus', 'BIT', 'LLB(Hons)' - but not 'Honours', 'Advanced' or 'Co-op'"""
+    return bool(_ABBREVIATION.fullmatch(text)) and sum(c.isupper() for c in text) >= 2
+
+
+def split_award(award: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    Award names with their abbreviations; combined degrees list several:
+    'Bachelor of Laws (Honours) (LLB(Hons)) Bachelor of Arts (BA)'
+    -> [('Bachelor of Laws (Honours)', 'LLB(Hons)'), ('Bachelor of Arts', 'BA')]
+    """
+    award = _MAJOR_PLACEHOLDER.sub("", award or "")
+    parts, start = [], 0
+    for m in _PAREN.finditer(award):
+        inner = m.group(1).strip()
+        if is_abbreviation(inner):
+            parts.append((award[start:m.start()].strip(), inner))
+            start = m.end()
+    if award[start:].strip():
+        parts.append((award[start:].strip(), None))
+    return parts
+
+
+class AliasMatch:
+    """A resolved course mention"""
+    
+    def __init__(self, alias: str, codes: List[str], kind: str, score: float = 1.0):
+        self.alias = alias
+        self.codes = codes
+        self.kind = kind      # "name", "abbreviation", "prefix" or "fuzzy"
+        self.score = score
+    
+    @property
+    def course_code(self) -> str:
+        """Filter value: one code, or several comma-separated (see build_course_filter)"""
+        return ",".join(self.codes)
+    
+    def __repr__(self):
+        return f"AliasMatch({self.alias!r} -> {self.course_code}, {self.kind}, {self.score:.2f})"
+
+
+class CourseAliasIndex:
+    """Trie + trigram index from course aliases to course codes"""
+    
+    def __init__(self, max_codes: int = 6, min_word_similarity: float = 0.7,
+                 min_name_similarity: float = 0.8):
+        self.max_codes = max_codes                      # broader mentions don't narrow anything
+        self.min_word_similarity = min_word_similarity  # trigram Dice for correcting a word
+        self.min_name_similarity = min_name_similarity  # trigram Dice for a whole name
+        self.aliases: Dict[str, List[str]] = {}         # normalized alias -> codes
+        self.abbreviations: Dict[str, List[str]] = {}   # exact-case abbreviation -> codes
+        self._abbreviations_lower: Dict[str, List[str]] = {}
+        self._trie: Dict = {}
+        self._vocab: Set[str] = set()
+        self._word_grams: Dict[str, List[str]] = {}     # trigram -> vocabulary words
+        self._alias_grams: Dict[str, List[str]] = {}    # trigram -> aliases
+        self._corrections: Dict[str, str] = {}
+        self.stats = {"lookups": 0, "resolved": 0, "unresolved": 0, "fuzzy": 0, "prefix": 0}
+    
+    # ---------- Build ----------
+    
+    def build(self, records: Dict[str, List[Dict]]) -> "CourseAliasIndex":
+        """Index CourseCatalog.records (code -> [{"filename", "name", "data"}, ...])"""
+        names: Dict[str, Tuple[int, Set[str]]] = {}
+        
+        def add(alias: str, code: str, source: int):
+            if not alias or GENERIC_WORDS.issuperset(alias.split()):
+                return
+            current = names.get(alias)
+            if current is None or source < current[0]:
+                names[alias] = (source, {code})
+            elif source == current[0]:
+                current[1].add(code)
+        
+        award_abbreviations: Dict[str, List[Tuple[str, str]]] = {}
+        for code, entries in records.items():
+            if not _COURSE_CODE.match(code):
+                continue
+            for entry in entries:
+                add(normalize_alias(entry["name"]), code, NAME)
+                for award in entry["data"].get("awards") or []:
+                    for award_name, abbreviation in split_award(award):
+                        award_name = normalize_alias(award_name)
+                        add(award_name, code, AWARD)
+                        if abbreviation:
+                            award_abbreviations.setdefault(abbreviation, []).append((code, award_name))
+        
+        self.aliases = {alias: sorted(codes) for alias, (_, codes) in names.items()}
+        
+        # "BBus" -> the course actually named "Bachelor of Business" if there is one,
+        # rather than every combined degree that includes that award
+        self.abbreviations = {}
+        for abbreviation, pairs in award_abbreviations.items():
+            own = {code for code, award_name in pairs
+                   if names.get(award_name, (AWARD,))[0] == NAME and code in names[award_name][1]}
+            self.abbreviations[abbreviation] = sorted(own or {code for code, _ in pairs})
+        self._abbreviations_lower = {}
+        for abbreviation, codes in self.abbreviations.items():
+            merged = set(self._abbreviations_lower.get(abbreviation.lower(), [])) | set(codes)
+            self._abbreviations_lower[abbreviation.lower()] = sorted(merged)
+        
+        self._trie = {}
+        for alias in self.aliases:
+            node = self._trie
+            for ch in alias:
+                node = node.setdefault(ch, {})
+            node[_TERMINAL] = alias
+        
+        self._vocab = {word for alias in self.aliases for word in alias.split()}
+        self._word_grams = {}
+        for word in self._vocab:
+            for gram in trigrams(word):
+                self._word_grams.setdefault(gram, []).append(word)
+        self._alias_grams = {}
+        for alias in self.aliases:
+            for gram in trigrams(alias):
+                self._alias_grams.setdefault(gram, []).append(alias)
+        self._corrections = {}
+        return self
+    
+    # ---------- Matching helpers ----------
+    
+    def _match(self, alias: str, codes: List[str], kind: str, score: float = 1.0) -> Optional[AliasMatch]:
+        if not codes or len(codes) > self.max_codes:
+            return None
+        return AliasMatch(alias, codes, kind, score)
+    
+    @staticmethod
+    def _best_by_trigrams(text: str, grams_index: Dict[str, List[str]]) -> Tuple[Optional[str], float]:
+        """Candidate with the highest trigram Dice similarity to `text`"""
+        grams = trigrams(text)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in grams_index.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        best, best_score = None, 0.0
+        for candidate, n in shared.items():
+            score = 2.0 * n / (len(grams) + len(candidate) + 2)  # len(trigrams(x)) == len(x) + 2
+            if score > best_score:
+                best, best_score = candidate, score
+        return best, best_score
+    
+    def _correct(self, word: str) -> str:
+        """Closest alias vocabulary word for a misspelled one (unchanged if none is close)"""
+        if len(word) < 4 or word.isdigit() or word in self._vocab:
+            return word
+        corrected = self._corrections.get(word)
+        if corrected is None:
+            best, score = self._best_by_trigrams(word, self._word_grams)
+            corrected = best if best is not None and score >= self.min_word_similarity else word
+            if len(self._corrections) >= 4096:
+                self._corrections.clear()
+            self._corrections[word] = corrected
+        return corrected
+    
+    def _walk(self, text: str, start: int) -> Tuple[Optional[str], Optional[Dict], int]:
+        """
+        Longest alias starting at `start` that ends on a word boundary, plus the
+        deepest trie node reached at the end of a word of `text` (or of the text
+        itself, mid-word) and how many characters that took - for completing
+        prefixes like "master of data science ..." or "... bachelor of comp"
+        """
+        node = self._trie
+        longest, deepest, depth = None, None, 0
+        i = start
+        while i < len(text):
+            node = node.get(text[i])
+            if node is None:
+                break
+            i += 1
+            if i == len(text) or text[i] == " ":
+                deepest, depth = node, i - start
+                if _TERMINAL in node:
+                    longest = node[_TERMINAL]
+        return longest, deepest, depth
+    
+    def _complete(self, node: Dict) -> Tuple[Optional[str], List[str]]:
+        """Shortest alias below a trie node and the codes of all aliases below it
+        (stops early once there are too many codes to be useful)"""
+        codes: Set[str] = set()
+        shortest = None
+        stack = [node]
+        while stack and len(codes) <= self.max_codes:
+            current = stack.pop()
+            for key, child in current.items():
+                if key == _TERMINAL:
+                    codes.update(self.aliases[child])
+                    if shortest is None or len(child) < len(shortest):
+                        shortest = child
+                else:
+                    stack.append(child)
+        return shortest, sorted(codes)
+    
+    # ---------- Lookup ----------
+    
+    def _find(self, text: str) -> Optional[AliasMatch]:
+        # Longest alias (at least two words) starting at any word, on the spelling-corrected text
+        words = _WORD.findall((text or "").lower().replace("&", " and "))
+        corrected = [self._correct(w) for w in words]
+        norm = " ".join(corrected)
+        starts, pos = [], 0
+        for word in corrected:
+            starts.append(pos)
+            pos += len(word) + 1
+        
+        best, prefix = None, None
+        for i, start in enumerate(starts):
+            alias, node, depth = self._walk(norm, start)
+            if alias and alias.count(" ") >= 1 and (best is None or len(alias) > len(best[0])):
+                span = len(alias.split())
+                best = (alias, corrected[i:i + span] != words[i:i + span])
+            if node is not None and (prefix is None or depth > prefix[1]):
+                prefix_words = norm[start:start + depth].split()
+                if len(prefix_words) >= 2 and not GENERIC_WORDS.issuperset(prefix_words):
+                    prefix = (node, depth)
+        
+        # More of the message matches the start of a longer name than any whole alias:
+        # "master of data science part time", "... bachelor of computing sc"
+        if prefix is not None and (best is None or prefix[1] > len(best[0])):
+            alias, codes = self._complete(prefix[0])
+            match = self._match(alias, codes, "prefix") if alias is not None else None
+            if match is not None:
+                return match
+        
+        if best is not None:
+            alias, fixed = best
+            match = self._match(alias, self.aliases[alias], "fuzzy" if fixed else "name")
+            if match is not None:
+                return match
+        
+        # Abbreviations only as written ("BIT", not "bit")
+        for token in _ABBREVIATION.findall(text or ""):
+            codes = self.abbreviations.get(token)
+            if codes:
+                match = self._match(token, codes, "abbreviation")
+                if match is not None:
+                    return match
+        return None
+    
+    def find_in_text(self, text: str) -> Optional[AliasMatch]:
+        """Course mentioned anywhere in a free-text message (None if none or ambiguous)"""
+        self.stats["lookups"] += 1
+        return self._count(self._find(text))
+    
+    def lookup(self, name: str) -> Optional[AliasMatch]:
+        """Resolve a value meant to be a course name or abbreviation (e.g. ChatRequest.course_name)"""
+        self.stats["lookups"] += 1
+        name = (name or "").strip()
+        codes = self.abbreviations.get(name) or self._abbreviations_lower.get(name.lower())
+        if codes:
+            return self._count(self._match(name, codes, "abbreviation"))
+        key = normalize_alias(name)
+        if key in self.aliases:
+            return self._count(self._match(key, self.aliases[key], "name"))
+        alias, score = self._best_by_trigrams(key, self._alias_grams)
+        if alias is not None and score >= self.min_name_similarity:
+            return self._count(self._match(alias, self.aliases[alias], "fuzzy", score))
+        return self._count(self._find(name))
+    
+    def _count(self, match: Optional[AliasMatch]) -> Optional[AliasMatch]:
+        if match is None:
+            self.stats["unresolved"] += 1
+        else:
+            self.stats["resolved"] += 1
+            if match.kind in ("fuzzy", "prefix"):
+                self.stats[match.kind] += 1
+        return match
+
+
+# ---------- CLI ----------
+
+def main():
+    from course_catalog import CourseCatalog
+    
+    parser = argparse.ArgumentParser(description='Resolve course mentions to course codes')
+    parser.add_argument('--q', required=True, help='Message (or course name with --name)')
+    parser.add_argument('--name', action='store_true', help='Treat --q as a course name field, not a message')
+    parser.add_argument('--courses_dir', default=str(DEFAULT_COURSES_DIR), help='Directory of course JSON files')
+    args = parser.parse_args()
+    
+    catalog = CourseCatalog(args.courses_dir).load()
+    started = time.perf_counter()
+    index = CourseAliasIndex().build(catalog.records)
+    print(f"🔤 {len(index.aliases)} aliases, {len(index.abbreviations)} abbreviations "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    
+    started = time.perf_counter()
+    match = index.lookup(args.q) if args.name else index.find_in_text(args.q)
+    print(f"{match} in {(time.perf_counter() - started) * 1000:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
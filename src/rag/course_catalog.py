@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+In-memory course catalog for the API server
+Built once from data/courses/*.json (the same files ingest_courses.py indexes,
+using the same code/name fallbacks), so /api/chatbot/courses/ never has to
+scroll Qdrant. The JSON response body and its ETag are precomputed; the catalog
+is rebuilt only when the knowledge base manifest changes.
+"""
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ingest_courses import get_course_code, get_course_name
+from kb_version import ManifestWatcher
+
+# Get project root directory
+SCRIPT_DIR = Path(__file__).parent.resolve()
+HANDBOOK_ROOT = Path(os.environ.get('HANDBOOK_ROOT', SCRIPT_DIR.parent.parent))
+DEFAULT_COURSES_DIR = HANDBOOK_ROOT / "data" / "courses"
+
+
+class CourseCatalog:
+    """All courses in the knowledge base, with a ready-to-send JSON body"""
+    
+    def __init__(self, courses_dir: str = str(DEFAULT_COURSES_DIR),
+                 manifest_path: Optional[str] = None, check_interval: float = 10.0):
+        self.courses_dir = Path(courses_dir)
+        self.kb_version = ManifestWatcher(manifest_path, check_interval)
+        # course code -> list of {"filename", "name", "data"} (several files can share a code)
+        self.records: Dict[str, List[Dict]] = {}
+        self.courses: List[Dict[str, str]] = []
+        self.body: bytes = b""
+        self.etag: str = ""
+    
+    def load(self) -> "CourseCatalog":
+        """(Re)build the catalog from the course JSON files"""
+        records: Dict[str, List[Dict]] = {}
+        for json_file in sorted(self.courses_dir.glob("*.json")):
+            try:
+                with open(json_file, "r", encoding="utf-8") as f:
+                    course_data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Skipping {json_file.name}: {e}")
+                continue
+            code = get_course_code(course_data, json_file.name)
+            records.setdefault(code, []).append({
+                "filename": json_file.name,
+                "name": get_course_name(course_data, json_file.name),
+                "data": course_data,
+            })
+        
+        # One entry per code, named after the first file (as ingestion order would)
+        courses = [{"code": code, "name": entries[0]["name"] or ""}
+                   for code, entries in sorted(records.items())]
+        body = json.dumps({"courses": courses, "success": True}, ensure_ascii=False).encode("utf-8")
+        
+        self.records = records
+        self.courses = courses
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        print(f"📚 Course catalog: {len(courses)} courses from {self.courses_dir}")
+        return self
+    
+    def refresh_if_changed(self) -> bool:
+        """Rebuild if the knowledge base was rebuilt since the last load"""
+        if self.kb_version.changed():
+            self.load()
+            return True
+        return False
+
+
+# ---------- CLI ----------
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the course catalog served by /api/chatbot/courses/')
+    parser.add_argument('--courses_dir', default=str(DEFAULT_COURSES_DIR), help='Directory of course JSON files')
+    args = parser.parse_args()
+    
+    catalog = CourseCatalog(args.courses_dir).load()
+    for course in catalog.courses:
+        print(f"{course['code']}\t{course['name']}")
+    print(f"\n{len(catalog.courses)} courses, ETag {catalog.etag}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
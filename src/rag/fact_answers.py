@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Extractive answers for course fact questions
+Many questions are plain field lookups ("How many credit points is C10235?",
+"What's the CRICOS code of the Bachelor of Accounting?"). They are answered
+straight from the structured course JSON written by
+create_structured_course_json.py, with a fixed template and the usual
+[Course Code: XXX] citation, so they skip embedding, search and generation:
+- intents are patterns anchored to questions about the course itself ("how
+  long is the course", "how many credit points is C10235"): credit points,
+  duration, CRICOS code, UAC codes, location, fees, intakes
+- the course comes from the caller (the API server resolves codes, names and
+  abbreviations with course_aliases.py) or from the message itself
+- anything else falls through to the RAG pipeline (None): no intent, more than
+  one intent or clause ("where can I work after it, and when does it start?"),
+  another subject noun ("how long are the lectures", "credit points for the
+  major"), open-ended phrasing ("compare", "why", "can I get credit for ..."),
+  a long message, an unknown or ambiguous course, or a field the JSON doesn't have
+
+Usage:
+    python fact_answers.py --q "How many credit points is C10235?"
+    python fact_answers.py --q "What is the CRICOS code for the Bachelor of Accounting?"
+"""
+import argparse
+import os
+import re
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Get project root directory
+SCRIPT_DIR = Path(__file__).parent.resolve()
+HANDBOOK_ROOT = Path(os.environ.get('HANDBOOK_ROOT', SCRIPT_DIR.parent.parent))
+DEFAULT_COURSES_DIR = HANDBOOK_ROOT / "data" / "courses"
+
+_COURSE_CODE = re.compile(r"\b[Cc]\d{5}\b")
+_YEARS = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*Year\(s\)\s*$", re.I)
+_UAC_CODE = re.compile(r"(?<!\d)\d{6}(?!\d)")
+_MONTHS = {"jan": "January", "feb": "February", "mar": "March", "apr": "April", "may": "May", "jun": "June",
+           "jul": "July", "aug": "August", "sep": "September", "oct": "October", "nov": "November",
+           "dec": "December"}
+
+# Phrasing that needs reasoning over the text, not a field value
+DECLINE = re.compile(
+    r"\b(compare|comparison|versus|vs|differen\w*|better|best|why|should|recommend\w*|explain|"
+    r"cheaper|reduce|scholarships?|waiver|exempt\w*|prior learning|rpl|credit for|advanced standing|"
+    r"transfer|change|switch|if i|instead|domestic|commonwealth|csp|hecs\w*|fee-help|apply|application)\b",
+    re.I
+)
+# Something other than the course the field would be read for
+OTHER_SUBJECT = re.compile(
+    r"\b(lectures?|subjects?|units?|(sub-?)?majors?|minors?|class(es)?|tutorials?|electives?|streams?|"
+    r"specialisations?|assessments?|exams?|placements?|internships?|careers?|jobs?|work|employment|"
+    r"living|accommodation|visas?|parking|library)\b",
+    re.I
+)
+# A second clause or question: ", and when ...", "; ...", "...? How ..."
+MULTI_CLAUSE = re.compile(
+    r"[,;]\s*(and|but|also|or|plus|then|what|when|where|how|which|who|is|are|does|do|can)\b|"
+    r"\band (what|when|where|how|which|who|is|are|does|do|can)\b|\?\s*\S",
+    re.I
+)
+MAX_WORDS = 25
+
+
+def present(value) -> bool:
+    """Field has a value (the JSON uses None, "None", "" and [] for missing)"""
+    if isinstance(value, list):
+        return any(present(v) for v in value)
+    return value is not None and str(value).strip() not in ("", "None")
+
+
+def join_words(items: List[str]) -> str:
+    """['a', 'b', 'c'] -> 'a, b and c'"""
+    return items[0] if len(items) == 1 else ", ".join(items[:-1]) + " and " + items[-1]
+
+
+# ---------- Field readers ----------
+# Each returns the answer sentence for one course, or None if the field is missing
+
+def credit_points_fact(data: Dict, query: str) -> Optional[str]:
+    m = re.match(r"\s*(\d+)", str(data.get("credit_points") or ""))
+    if not m or not present(data.get("credit_points")):
+        return None
+    return f"It is {m.group(1)} credit points."
+
+
+def duration_fact(data: Dict, query: str) -> Optional[str]:
+    def years(value) -> Optional[str]:
+        m = _YEARS.match(str(value or ""))
+        if not m or float(m.group(1)) <= 0:
+            return None
+        n = m.group(1)
+        return f"{n} year" if n == "1" else f"{n} years"
+    
+    full, part = years(data.get("duration_fulltime")), years(data.get("duration_parttime"))
+    asks_part = re.search(r"part[- ]?time", query, re.I)
+    asks_full = re.search(r"full[- ]?time", query, re.I)
+    parts = []
+    if full and not (asks_part and not asks_full):
+        parts.append(f"{full} full-time")
+    if part and not (asks_full and not asks_part):
+        parts.append(f"{part} part-time")
+    if not parts or (asks_part and not part) or (asks_full and not full):
+        return None
+    sessions = str(data.get("duration_sessions") or "").rstrip("*").strip()
+    suffix = f" ({sessions} sessions full-time)" if sessions.isdigit() and full and not asks_part else ""
+    return f"The course takes {join_words(parts)}{suffix}."
+
+
+def cricos_fact(data: Dict, query: str) -> Optional[str]:
+    code = str(data.get("cricos_code") or "").strip()
+    if not present(code):
+        return None
+    return f"The CRICOS code is {code}."
+
+
+def uac_fact(data: Dict, query: str) -> Optional[str]:
+    # The scraped list mixes codes with major names and sessions: keep the 6-digit codes
+    codes = list(dict.fromkeys(_UAC_CODE.findall(" ".join(str(v) for v in data.get("uac_codes") or []))))
+    if not codes:
+        return None
+    return f"The UAC code{'s are' if len(codes) > 1 else ' is'} {join_words(codes)}."
+
+
+def location_fact(data: Dict, query: str) -> Optional[str]:
+    places = [str(v).strip() for v in data.get("location") or [] if present(v)]
+    if not places:
+        return None
+    return f"It is offered at {join_words(places)}."
+
+
+def fee_fact(data: Dict, query: str) -> Optional[str]:
+    fee = str(data.get("course_fee") or "").replace(",", "").strip()
+    if not fee.isdigit():
+        return None
+    return f"The course fee is A${int(fee):,} per session."
+
+
+def intake_fact(data: Dict, query: str) -> Optional[str]:
+    intakes = []
+    for part in re.split(r"[/,&]|\band\b", str(data.get("course_intake") or "")):
+        month = _MONTHS.get(part.strip()[:3].lower())
+        if month and month not in intakes:
+            intakes.append(month)
+    if not intakes:
+        return None
+    return f"It has {'intakes' if len(intakes) > 1 else 'an intake'} in {join_words(intakes)}."
+
+
+# What the field belongs to: "the course", "this degree", a code or an award name
+_OF_COURSE = r"(the |this |that |your )?(course|degree|program(me)?|c\d{5}|bachelor|master|graduate|diploma|doctor)"
+
+# Intent name -> (pattern over the message, field reader); answer() takes only messages with exactly one
+INTENTS: Dict[str, Tuple[re.Pattern, Callable[[Dict, str], Optional[str]]]] = {
+    "credit_points": (re.compile(r"\b(how many|number of|total) (credit ?points?|credits|cps?)\b|"
+                                 r"\bcredit ?points? (is|are|of|for|in|does)\b", re.I), credit_points_fact),
+    "duration": (re.compile(r"\bhow long (is|does|will|would|to)\b|\bhow many (years|sessions|semesters)\b|"
+                            r"\b(duration|length) (of|for) " + _OF_COURSE + r"|\bcourse (duration|length)\b",
+                            re.I), duration_fact),
+    "cricos": (re.compile(r"\bcricos\b", re.I), cricos_fact),
+    "uac": (re.compile(r"\buac\b", re.I), uac_fact),
+    "location": (re.compile(r"\b(which|what) campus\b|\blocation of " + _OF_COURSE + r"|"
+                            r"\bwhere (is|are|will|would|can)\b[^,;?]{0,40}\b(taught|located|offered|held|"
+                            r"delivered|studied|based)\b", re.I), location_fact),
+    "fees": (re.compile(r"\b(course |tuition |annual )?fees?\b|\btuition\b|\bhow much\b[^,;?]*\bcost\b|"
+                        r"\bcost of " + _OF_COURSE, re.I), fee_fact),
+    "intake": (re.compile(r"\bintakes?\b|\bstart dates?\b|"
+                          r"\bwhen (does|do|can|will|is)\b[^,;?]{0,40}\b(start|begin|commence)\w*\b", re.I),
+               intake_fact),
+}
+
+
+# ---------- Answerer ----------
+
+class FactAnswer:
+    """A templated answer and what it was built from"""
+    
+    def __init__(self, text: str, course_code: str, intents: List[str]):
+        self.text = text
+        self.course_code = course_code
+        self.intents = intents
+    
+    def __repr__(self):
+        return f"FactAnswer({self.course_code}, {'+'.join(self.intents)})"
+
+
+class FactAnswerer:
+    """Field lookups against the structured course JSON (CourseCatalog.records)"""
+    
+    def __init__(self, max_words: int = MAX_WORDS):
+        self.max_words = max_words
+        self.records: Dict[str, List[Dict]] = {}
+        self.aliases = None
+        self.stats = {"lookups": 0, "answered": 0, "no_intent": 0, "declined": 0,
+                      "no_course": 0, "missing_field": 0}
+    
+    def build(self, records: Dict[str, List[Dict]], aliases=None) -> "FactAnswerer":
+        """Use CourseCatalog.records (code -> [{"filename", "name", "data"}, ...]); `aliases`
+        (a built CourseAliasIndex) resolves course names when no code is passed to answer()"""
+        self.records = records
+        self.aliases = aliases
+        return self
+    
+    @staticmethod
+    def intents(query: str) -> List[str]:
+        return [name for name, (pattern, _) in INTENTS.items() if pattern.search(query)]
+    
+    def _course(self, query: str, course_code: Optional[str]) -> Optional[str]:
+        """The one course the question is about, or None (unknown / several)"""
+        if not course_code:
+            codes = {c.upper() for c in _COURSE_CODE.findall(query)}
+            if len(codes) > 1:
+                return None
+            course_code = codes.pop() if codes else None
+        if not course_code and self.aliases is not None:
+            match = self.aliases.find_in_text(query)
+            course_code = match.course_code if match is not None else None
+        if not course_code or "," in course_code:
+            return None
+        return course_code.strip().upper()
+    
+    def answer(self, query: str, course_code: Optional[str] = None) -> Optional[FactAnswer]:
+        """Templated answer if `query` is a pure field lookup on one known course, else None"""
+        self.stats["lookups"] += 1
+        intents = self.intents(query)
+        if not intents:
+            self.stats["no_intent"] += 1
+            return None
+        # One field of the course itself, asked in one clause - anything more needs the LLM
+        if (len(intents) > 1 or DECLINE.search(query) or OTHER_SUBJECT.search(query)
+                or MULTI_CLAUSE.search(query.strip()) or len(query.split()) > self.max_words):
+            self.stats["declined"] += 1
+            return None
+        code = self._course(query, course_code)
+        entries = self.records.get(code) if code else None
+        if not entries:
+            self.stats["no_course"] += 1
+            return None
+        
+        # Several JSON files can share a code: answer only if they agree
+        reader = INTENTS[intents[0]][1]
+        values = {reader(entry["data"], query) for entry in entries}
+        if len(values) != 1 or None in values:
+            self.stats["missing_field"] += 1
+            return None
+        
+        entry = entries[0]
+        name = entry["name"] or code
+        url = (entry["data"].get("metadata") or {}).get("source_url")
+        text = f"{name} ({code}): {values.pop()} [Course Code: {code}]"
+        if url:
+            text += f"\n\nSource: {url}"
+        self.stats["answered"] += 1
+        return FactAnswer(text, code, intents)
+    
+    def snapshot(self) -> Dict:
+        """Counters plus the share of lookups answered without the LLM"""
+        lookups = self.stats["lookups"]
+        return dict(self.stats, answer_rate=round(self.stats["answered"] / lookups, 4) if lookups else 0.0)
+
+
+# ---------- CLI ----------
+
+def main():
+    from course_aliases import CourseAliasIndex
+    from course_catalog import CourseCatalog
+    
+    parser = argparse.ArgumentParser(description='Answer course fact questions from the structured course JSON')
+    parser.add_argument('--q', required=True, help='Question')
+    parser.add_argument('--course_code', default=None, help='Course the question is about (else taken from --q)')
+    parser.add_argument('--courses_dir', default=str(DEFAULT_COURSES_DIR), help='Directory of course JSON files')
+    args = parser.parse_args()
+    
+    catalog = CourseCatalog(args.courses_dir).load()
+    answerer = FactAnswerer().build(catalog.records, CourseAliasIndex().build(catalog.records))
+    started = time.perf_counter()
+    fact = answerer.answer(args.q, args.course_code)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if fact is None:
+        print(f"No fast-path answer ({elapsed_ms:.2f} ms): {answerer.stats}")
+        return 1
+    print(f"{fact} in {elapsed_ms:.2f} ms\n\n{fact.text}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
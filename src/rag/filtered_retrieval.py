@@ -21,22 +21,28 @@ DEFAULT_EMBED_DIR = HANDBOOK_ROOT / "models" / "hf" / "qwen3-embedding-0.6b"
 
 def retrieve_courses(
     query: str,
-    embed_dir: str,
+    embed_dir: str = None,
     collection: str = "courses",
     course_code: str = None,
     course_name: str = None,
     host="localhost",
     port=6333,
-    limit=30
+    limit=30,
+    encoder: SentenceTransformer = None,
+    client: QdrantClient = None
 ):
-    """Retrieve course documents with optional filtering"""
+    """Retrieve course documents with optional filtering
+    
+    Pass a preloaded `encoder` and `client` to reuse them across queries;
+    otherwise they are created from `embed_dir`/`host`/`port`.
+    """
     
-    # Initialize embedding model
-    enc = SentenceTransformer(embed_dir)
+    # Reuse the shared embedding model if given, otherwise load it
+    enc = encoder if encoder is not None else SentenceTransformer(embed_dir)
     qv = enc.encode([query], prompt_name="query", normalize_embeddings=True)[0].tolist()
     
-    # Initialize Qdrant client
-    cli = QdrantClient(host=host, port=port)
+    # Reuse the shared Qdrant client if given, otherwise connect
+    cli = client if client is not None else QdrantClient(host=host, port=port)
     
     # Build filter if course_code or course_name is specified
     flt = None
@@ -108,7 +114,9 @@ def query_with_filtering(
     show_details: bool = True,
     topn: int = 8,
     host="localhost",
-    port=6333
+    port=6333,
+    encoder=None,
+    qdrant_client=None
 ):
     """Main function for filtered retrieval pipeline"""
     
@@ -134,7 +142,9 @@ def query_with_filtering(
         course_name=course_name,
         host=host,
         port=port,
-        limit=30
+        limit=30,
+        encoder=encoder,
+        client=qdrant_client
     )
     
     # Quality checks
@@ -173,6 +183,41 @@ def query_with_filtering(
     
     return hits
 
+# ---------- Result format ----------
+
+PREVIEW_CHARS = 200
+# Hit fields besides id/score; 'text_preview' is the first PREVIEW_CHARS of the
+# chunk text, any other name is returned from the payload as is
+DEFAULT_FIELDS = ('course_code', 'course_name', 'chunk_label', 'text_preview')
+
+
+def payload_keys(fields: List[str] = DEFAULT_FIELDS) -> List[str]:
+    """Payload keys to fetch for the given hit fields (Qdrant with_payload list)"""
+    return list(dict.fromkeys('text' if f == 'text_preview' else f for f in fields))
+
+
+def hit_result(hit, preview_chars: int = PREVIEW_CHARS, fields: List[str] = DEFAULT_FIELDS) -> Dict[str, Any]:
+    """JSON shape of one hit (--quiet output and the API search endpoints)"""
+    payload = hit.payload or {}
+    result = {'id': hit.id, 'score': hit.score}
+    for field in fields:
+        if field == 'text_preview':
+            result[field] = (payload.get('text') or '')[:preview_chars]
+        else:
+            result[field] = payload.get(field)
+    return result
+
+
+def search_result(query: str, hits: List, topn: int, preview_chars: int = PREVIEW_CHARS,
+                  fields: List[str] = DEFAULT_FIELDS) -> Dict[str, Any]:
+    """JSON result of one query: counts, top score and the top `topn` hits"""
+    return {
+        'query': query,
+        'results_count': len(hits),
+        'top_score': hits[0].score if hits else 0,
+        'results': [hit_result(hit, preview_chars, fields) for hit in hits[:topn]]
+    }
+
 # ---------- CLI ----------
 
 def main():
@@ -205,22 +250,7 @@ def main():
         
         if args.quiet:
             # Just return JSON for pipeline integration
-            result_data = {
-                'query': args.q,
-                'results_count': len(hits),
-                'top_score': hits[0].score if hits else 0,
-                'results': [
-                    {
-                        'score': hit.score,
-                        'course_code': hit.payload.get('course_code'),
-                        'course_name': hit.payload.get('course_name'),
-                        'chunk_label': hit.payload.get('chunk_label'),
-                        'text_preview': hit.payload.get('text', '')[:200]
-                    }
-                    for hit in hits[:args.topn]
-                ]
-            }
-            print(json.dumps(result_data, indent=2))
+            print(json.dumps(search_result(args.q, hits, args.topn), indent=2))
         
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Follow-up turns served from the previous turn's candidates
+"Tell me more" or "is it offered part-time?" on the course the session is
+already on doesn't need a new embedding and vector search: the previous turn's
+k candidates (with a course filter, most of that course's chunks) are still the
+relevant set. The session keeps their ids and scores and which of them went
+into a context (session_store.py); prepare() turns a follow-up into a RagRun
+whose hits are already set, so the pipeline skips embed and search:
+- "page": a bare continuation ("tell me more", "go on", "what else?") gets the
+  candidates that haven't been in a context yet, in their original order
+- "rerank": a short message that refers back ("is it offered part-time?",
+  "what about the fees for that?") gets the whole cached set rescored for the
+  new wording - by the cross-encoder if the pipeline has one, else by term
+  overlap blended with the original scores - provided the set covers its terms
+Anything else goes through normal retrieval: a different course, a longer or
+self-contained question, candidates used up, terms the set doesn't cover.
+"Refers back" means the message opens with a connective or a pronoun subject
+("and the fees?", "is it ...", "they ...") or ends on a pronoun object ("the fees
+for that?"); "this course" or "is there ..." start a new question. A reused turn
+whose context comes out empty, or without the new terms, falls back to a normal
+search (counted as fell_back, which reuse_rate excludes).
+
+The hits themselves (with payloads) are kept per session in a process-local
+LRU; another worker or a restarted one fetches them by id (Qdrant retrieve).
+"""
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+from qdrant_client.http import models as qm
+
+from sparse_index import tokenize
+
+# A message that only asks to go on
+CONTINUE = re.compile(
+    r"^\s*((ok(ay)?|thanks|great|cool|and|so)[\s,]+)?((please|can you|could you)\s+)?"
+    r"((tell|give|show) me\s+)?(more|go on|continue|keep going|what else|anything else|elaborate|say more|"
+    r"expand)(\s+(info|information|details?))?(\s+(about|on)\s+(that|this|it|them))?(\s+please)?\s*[.!?]*\s*$",
+    re.I
+)
+# A message that leans on the previous turn: opening connective, pronoun subject, or trailing pronoun object
+REFERS_BACK = re.compile(
+    r"^\s*(and|also|so|then|what about|how about)\b"
+    r"|^\s*((is|are|does|do|did|can|could|will|would|has|have)\s+)?(it|its|it's|they|they're|them|those|these)\b"
+    r"|\b(it|that|this|them|those|these)\s*[.!?]*\s*$",
+    re.I
+)
+# Words that carry no topic of their own in a follow-up
+FOLLOWUP_WORDS = frozenset(
+    "about also any anything course degree details else explain give info information its know "
+    "more please program programme show so tell that them these they those".split()
+)
+
+
+def content_terms(query: str) -> Set[str]:
+    return {t for t in tokenize(query) if t not in FOLLOWUP_WORDS}
+
+
+def hit_terms(hit) -> Set[str]:
+    payload = hit.payload or {}
+    return set(tokenize(f"{payload.get('chunk_label') or ''} {payload.get('text') or ''}"))
+
+
+def _scaled(scores: List[float]) -> List[float]:
+    lo, hi = min(scores), max(scores)
+    if hi - lo < 1e-9:
+        return [1.0] * len(scores)
+    return [(s - lo) / (hi - lo) for s in scores]
+
+
+class FollowupReuse:
+    """Serves continuation turns from a session's last candidate set"""
+    
+    def __init__(self, max_sessions: int = 512, max_words: int = 12, min_overlap: float = 0.5,
+                 min_unused: int = 2, overlap_weight: float = 0.5):
+        self.max_sessions = max_sessions
+        self.max_words = max_words
+        self.min_overlap = min_overlap        # share of the new terms the best candidate must contain
+        self.min_unused = min_unused          # fewer unused candidates than this: search again
+        self.overlap_weight = overlap_weight  # term overlap vs original score without a reranker
+        self._hits: "OrderedDict[str, List]" = OrderedDict()  # session id -> candidate hits
+        self.search_ms: Optional[float] = None  # moving average of embed + search on normal turns
+        self.stats = {"lookups": 0, "followups": 0, "paged": 0, "reranked": 0, "course_changed": 0,
+                      "exhausted": 0, "off_topic": 0, "fell_back": 0, "payload_fetches": 0, "fetch_failed": 0,
+                      "reuse_ms": 0.0, "saved_ms": 0.0}
+    
+    def classify(self, query: str) -> Optional[str]:
+        """"page", "rerank" or None (not a follow-up)"""
+        if CONTINUE.match(query):
+            return "page"
+        if len(query.split()) <= self.max_words and REFERS_BACK.search(query):
+            return "rerank"
+        return None
+    
+    # ---------- Candidate set ----------
+    
+    def _store(self, session_id: str, hits: List):
+        if self.max_sessions <= 0:
+            return
+        self._hits[session_id] = hits
+        self._hits.move_to_end(session_id)
+        while len(self._hits) > self.max_sessions:
+            self._hits.popitem(last=False)
+    
+    def forget(self, session_id: str):
+        self._hits.pop(session_id, None)
+    
+    def record(self, session_id: str, run, previous: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Session.last_retrieval after `run`: its candidates, or `previous` with the newly used ones
+        
+        "hits" are the candidates ({id, score}, in ranked order), "context" the
+        indexes into them of the last context and "used" of every context so far.
+        """
+        if run.reused and previous is not None:
+            index = {h["id"]: i for i, h in enumerate(previous["hits"])}
+            context = sorted(index[run.hits[i].id] for i in run.context_info.get("selected", [])
+                             if run.hits[i].id in index)
+            used = set(previous.get("used", previous["context"])) | set(context)
+            return dict(previous, context=context, used=sorted(used), followups=previous.get("followups", 0) + 1)
+        
+        scores = run.rerank_scores or [hit.score for hit in run.hits]
+        context = run.context_info.get("selected", [])
+        self._store(session_id, list(run.hits))
+        return {
+            "query": run.query,
+            "course_code": run.course_code,
+            "course_name": run.course_name,
+            "reranked": run.rerank_scores is not None,
+            "hits": [{"id": hit.id, "score": float(score)} for hit, score in zip(run.hits, scores)],
+            "context": context,
+            "used": list(context),
+            "followups": 0,
+        }
+    
+    async def _candidates(self, session_id: str, record: Dict[str, Any], pipeline) -> Optional[List]:
+        """The cached hits, or the same points fetched by id (None if some are gone)"""
+        ids = [h["id"] for h in record["hits"]]
+        hits = self._hits.get(session_id)
+        if hits is not None and [hit.id for hit in hits] == ids:
+            self._hits.move_to_end(session_id)
+            return hits
+        
+        # Not cached in this process (other worker, restart, evicted)
+        self.stats["payload_fetches"] += 1
+        try:
+            points = await pipeline.qdrant.retrieve(pipeline.collection, ids, with_payload=True)
+        except Exception as e:
+            print(f"⚠️  Follow-up candidates unavailable: {e}")
+            self.stats["fetch_failed"] += 1
+            return None
+        payloads = {point.id: point.payload for point in points}
+        if any(i not in payloads for i in ids):
+            self.stats["fetch_failed"] += 1
+            return None
+        hits = [qm.ScoredPoint(id=h["id"], version=0, score=h["score"], payload=payloads[h["id"]])
+                for h in record["hits"]]
+        self._store(session_id, hits)
+        return hits
+    
+    # ---------- Serving ----------
+    
+    async def prepare(self, run, session, pipeline) -> Optional[str]:
+        """Set run.hits from the session's last candidates if `run` continues the last turn
+        
+        Returns the mode ("page" / "rerank", also stored as run.reused) or None,
+        in which case `run` is untouched and goes through normal retrieval.
+        """
+        record = session.last_retrieval if session is not None else None
+        if record is None or run.hits is not None:
+            return None
+        self.stats["lookups"] += 1
+        mode = self.classify(run.query)
+        if mode is None:
+            return None
+        self.stats["followups"] += 1
+        if ((run.course_code or "").strip().upper() != (record["course_code"] or "")
+                or (run.course_name or None) != record["course_name"]):
+            self.stats["course_changed"] += 1
+            return None
+        
+        started = time.perf_counter()
+        hits = await self._candidates(session.id, record, pipeline)
+        if hits is None:
+            return None
+        scores = [h["score"] for h in record["hits"]]
+        
+        if mode == "page":
+            used = set(record.get("used", record["context"]))
+            keep = [i for i in range(len(hits)) if i not in used and (hits[i].payload or {}).get("text")]
+            if len(keep) < self.min_unused:
+                self.stats["exhausted"] += 1
+                return None
+            hits, scores = [hits[i] for i in keep], [scores[i] for i in keep]
+            # Reranking against "tell me more" is meaningless: keep the earlier order
+            rerank_scores = scores if record["reranked"] or pipeline.reranker is not None else None
+        else:
+            terms = content_terms(run.query)
+            rerank_scores = scores if record["reranked"] else None
+            if terms:
+                overlap = [len(terms & hit_terms(hit)) / len(terms) for hit in hits]
+                if max(overlap) < self.min_overlap:
+                    self.stats["off_topic"] += 1
+                    return None
+                if pipeline.reranker is not None:
+                    rerank_scores = None  # the rerank stage scores the set against the new wording
+                else:
+                    w = self.overlap_weight
+                    blended = [(1 - w) * s + w * o for s, o in zip(_scaled(scores), overlap)]
+                    order = sorted(range(len(hits)), key=lambda i: -blended[i])
+                    hits, rerank_scores = [hits[i] for i in order], [blended[i] for i in order]
+        
+        run.hits = list(hits)
+        run.rerank_scores = list(rerank_scores) if rerank_scores is not None else None
+        run.reused = mode
+        run.timings["reuse"] = (time.perf_counter() - started) * 1000
+        self.stats["paged" if mode == "page" else "reranked"] += 1
+        print(f"  ♻️  Follow-up ({mode}) served from {len(run.hits)} cached candidates, no search")
+        return mode
+    
+    def _falls_short(self, run) -> Optional[str]:
+        """Why a reused run's context can't answer the turn, or None if it can"""
+        if not run.context:
+            return "empty context"
+        terms = content_terms(run.query)
+        if run.reused == "rerank" and terms:
+            covered = len(terms & set(tokenize(run.context))) / len(terms)
+            if covered < self.min_overlap:
+                return f"context covers {covered:.0%} of the new terms"
+        return None
+    
+    async def retrieve(self, run, session, pipeline, quality_check: bool = True):
+        """pipeline.retrieve() for `run`, from the session's last candidates when it is a follow-up
+        
+        A reused run whose context falls short is reset and searched normally.
+        Pass session=None to skip reuse (still records the search time).
+        """
+        mode = await self.prepare(run, session, pipeline)
+        await pipeline.retrieve(run, quality_check=quality_check)
+        reason = self._falls_short(run) if mode else None
+        if reason:
+            self.stats["fell_back"] += 1
+            print(f"  ↩️  Follow-up ({mode}) fell back to a new search: {reason}")
+            run.hits = run.rerank_scores = run.quality = run.context = run.reused = None
+            run.context_info = {}
+            run.degraded = []
+            run.timings.pop("reuse", None)
+            await pipeline.retrieve(run, quality_check=quality_check)
+        self.observe(run)
+    
+    def observe(self, run):
+        """After retrieval: normal turns update the embed + search average, reused ones the savings"""
+        if run.reused:
+            ms = run.timings.get("reuse", 0.0)
+            self.stats["reuse_ms"] += ms
+            if self.search_ms is not None:
+                self.stats["saved_ms"] += max(self.search_ms - ms, 0.0)
+        elif "search" in run.timings:
+            ms = run.timings.get("embed", 0.0) + max(run.timings["search"], run.timings.get("sparse", 0.0))
+            self.search_ms = ms if self.search_ms is None else 0.9 * self.search_ms + 0.1 * ms
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus how often the path is taken (and held) and the retrieval time it saves"""
+        reused = self.stats["paged"] + self.stats["reranked"] - self.stats["fell_back"]
+        lookups = self.stats["lookups"]
+        return dict(
+            self.stats,
+            reused=reused,
+            reuse_rate=round(reused / lookups, 4) if lookups else 0.0,
+            avg_reuse_ms=round(self.stats["reuse_ms"] / reused, 2) if reused else 0.0,
+            avg_search_ms=round(self.search_ms or 0.0, 2),
+            avg_saved_ms=round(self.stats["saved_ms"] / reused, 2) if reused else 0.0,
+            cached_sessions=len(self._hits),
+        )
@@ -10,6 +10,8 @@ Outputs JSON Lines with:
   "meta": {
     "course_code": "C10302",
     "course_name": "Bachelor of Sport and Exercise Science...",
+    "study_level": "Undergraduate",
+    "faculty": ["Health"],          # short names from FACULTY_NAMES, e.g. ["Law", "Arts and Social Sciences"]
     "chunk_type": "overview|admission|career|structure|learning_outcomes|...",
     "source_url": "https://handbook.uts.edu.au/courses/c10302.html",
     "ingested_at": "2025-11-10T00:00:00Z"
@@ -69,6 +71,53 @@ def get_course_code(course_data: Dict, filename: str) -> str:
     return course_data.get('course_code', 'UNKNOWN').strip().upper()
 
 
+def get_course_name(course_data: Dict, filename: str) -> str:
+    """Get course name from JSON, falling back to the filename if it's missing/wrong"""
+    course_name = (course_data.get('course_name') or '').strip()
+    
+    # Fix course name if it's wrong (some have "TEQSA Category: Australian University")
+    if not course_name or course_name == "TEQSA Category: Australian University":
+        # Try to extract from filename
+        filename_parts = Path(filename).stem.split('_')
+        # Remove course code and None parts
+        name_parts = [p for p in filename_parts 
+                     if p not in ['None', ''] and not re.match(r'^[C]\d{5}$', p, re.IGNORECASE)]
+        if name_parts:
+            course_name = ' '.join(name_parts).replace('_', ' ')
+    
+    return course_name
+
+
+# The scraper stores faculty as words of the concatenated names,
+# e.g. ["LawArts", "and", "Social", "Sciences"] for Law + Arts and Social Sciences
+FACULTY_NAMES = [
+    "Arts and Social Sciences",
+    "Business",
+    "Design, Architecture and Building",
+    "Engineering and Information Technology",
+    "Graduate Research School",
+    "Graduate School of Health",
+    "Health",
+    "Law",
+    "Science",
+    "TD School",
+    "Vice-Chancellor",
+]
+_FACULTY_RE = re.compile("|".join(re.escape(name) for name in sorted(FACULTY_NAMES, key=len, reverse=True)))
+
+
+def get_faculties(course_data: Dict) -> List[str]:
+    """Faculty names of a course, recovered from the scraped word list"""
+    joined = " ".join(course_data.get('faculty') or []).replace("Vice Chancellor", "Vice-Chancellor")
+    faculties = []
+    for match in _FACULTY_RE.finditer(joined):
+        if match.group(0) not in faculties:
+            faculties.append(match.group(0))
+    if not faculties and joined.strip():
+        faculties.append(joined.strip())
+    return faculties
+
+
 def make_chunk_uuid(course_code: str, chunk_type: str, chunk_index: int, unique_id: str = "") -> str:
     """Generate deterministic UUIDv5 for chunk
     
@@ -104,23 +153,16 @@ def create_chunks_from_course(course_data: Dict, filename: str) -> List[Dict]:
     """Create chunks from a course JSON file"""
     chunks = []
     
-    # Get course code (with fallback logic)
+    # Get course code and name (with fallback logic)
     course_code = get_course_code(course_data, filename)
-    course_name = course_data.get('course_name', '').strip()
-    
-    # Fix course name if it's wrong (some have "TEQSA Category: Australian University")
-    if not course_name or course_name == "TEQSA Category: Australian University":
-        # Try to extract from filename
-        filename_parts = Path(filename).stem.split('_')
-        # Remove course code and None parts
-        name_parts = [p for p in filename_parts 
-                     if p not in ['None', ''] and not re.match(r'^[C]\d{5}$', p, re.IGNORECASE)]
-        if name_parts:
-            course_name = ' '.join(name_parts).replace('_', ' ')
+    course_name = get_course_name(course_data, filename)
     
     metadata = course_data.get('metadata', {})
     source_url = metadata.get('source_url', '')
     ingested_at = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    # Filterable in Qdrant (keyword payload indexes, see collection_schema.py)
+    study_level = course_data.get('study_level') or ""
+    faculty = get_faculties(course_data)
     
     # Use filename as unique identifier for UUID generation
     # This ensures uniqueness even if multiple JSON files have the same course_code or source_url
@@ -164,6 +206,8 @@ def create_chunks_from_course(course_data: Dict, filename: str) -> List[Dict]:
             "meta": {
                 "course_code": course_code,
                 "course_name": course_name,
+                "study_level": study_level,
+                "faculty": faculty,
                 "chunk_type": field,
                 "chunk_label": label,
                 "source_url": source_url,
@@ -188,6 +232,8 @@ def create_chunks_from_course(course_data: Dict, filename: str) -> List[Dict]:
                 "meta": {
                     "course_code": course_code,
                     "course_name": course_name,
+                    "study_level": study_level,
+                    "faculty": faculty,
                     "chunk_type": "learning_outcomes",
                     "chunk_label": "Learning Outcomes",
                     "source_url": source_url,
@@ -205,8 +251,8 @@ def create_chunks_from_course(course_data: Dict, filename: str) -> List[Dict]:
         course_info_parts.append(f"Credit Points: {course_data.get('credit_points')}")
     if course_data.get('cricos_code') and course_data.get('cricos_code') != "None":
         course_info_parts.append(f"CRICOS Code: {course_data.get('cricos_code')}")
-    if course_data.get('faculty'):
-        faculty_str = ", ".join(course_data.get('faculty', []))
+    if faculty:
+        faculty_str = ", ".join(faculty)
         if faculty_str:
             course_info_parts.append(f"Faculty: {faculty_str}")
     if course_data.get('study_level'):
@@ -237,6 +283,8 @@ def create_chunks_from_course(course_data: Dict, filename: str) -> List[Dict]:
             "meta": {
                 "course_code": course_code,
                 "course_name": course_name,
+                "study_level": study_level,
+                "faculty": faculty,
                 "chunk_type": "course_info",
                 "chunk_label": "Course Information",
                 "source_url": source_url,
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Knowledge base version tracking
+save_kb_files.py writes a manifest.json with a `created_at` timestamp every time
+the knowledge base is rebuilt. Anything precomputed from the index (answer cache,
+course catalog, ...) uses ManifestWatcher to notice a rebuild cheaply: it only
+stats the file every few seconds and re-reads it when the mtime changes.
+"""
+import json
+import os
+import time
+from typing import Optional
+
+
+def read_manifest_version(manifest_path: str) -> Optional[str]:
+    """`created_at` of a KB manifest.json (None if missing/unreadable)"""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("created_at")
+    except (OSError, ValueError):
+        return None
+
+
+class ManifestWatcher:
+    """Reports when manifest.json's `created_at` changes"""
+    
+    def __init__(self, manifest_path: Optional[str], check_interval: float = 10.0):
+        self.manifest_path = manifest_path
+        self.check_interval = check_interval
+        self.version = read_manifest_version(manifest_path) if manifest_path else None
+        self._mtime = self._stat()
+        self._last_check = time.monotonic()
+    
+    def _stat(self) -> Optional[float]:
+        try:
+            return os.stat(self.manifest_path).st_mtime if self.manifest_path else None
+        except OSError:
+            return None
+    
+    def changed(self) -> bool:
+        """True (once) if the KB was rebuilt since the last call; `version` is then updated"""
+        if not self.manifest_path:
+            return False
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        mtime = self._stat()
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        version = read_manifest_version(self.manifest_path)
+        if version == self.version:
+            return False
+        self.version = version
+        return True
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+In-process exact vector search over the KB files (Qdrant-free mode)
+The whole course corpus is a few thousand normalized vectors, so a brute-force
+matrix-vector product over embeddings.npy takes about a millisecond - less than
+a network round trip to Qdrant. LocalVectorIndex memory-maps the row-aligned
+matrix (pages are shared between worker processes through the OS page cache),
+keeps a course_code -> rows map for filtering and returns qm.ScoredPoint hits
+with the same ids (row index) and payloads as the Qdrant collection built by
+upsert_to_qdrant_from_files.py.
+
+With `quantization` ("int8" or "binary", the same options as the Qdrant
+collection, see collection_schema.py) the index also holds quantized codes in
+RAM, scans those, and rescores the limit * oversampling best candidates with the
+memory-mapped float vectors.
+
+With `mrl_dim` it also loads the truncated Matryoshka vectors
+(embeddings.<dim>d.npy written by save_kb_files.py, derived from the full matrix
+if missing) and serves them as the named vector "mrl", and the full vectors as
+"full", like a collection built with upsert_to_qdrant_from_files.py --mrl_dim.
+
+LocalSearchClient / AsyncLocalSearchClient expose the subset of the
+QdrantClient / AsyncQdrantClient API the retrieval code uses, so they can be
+passed wherever a Qdrant client is expected.
+
+Usage:
+    python local_search.py --kb_dir data/processed/courses --write_f16   # optional half-size copy
+    python local_search.py --kb_dir data/processed/courses --q "admission requirements" --course_code C10302
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from qdrant_client.http import models as qm
+
+from collection_schema import FULL_VECTOR, INT8_QUANTILE, MRL_VECTOR, QUANTIZATIONS
+from kb_version import ManifestWatcher
+from sparse_index import load_payloads, tokenize
+
+# Get project root directory
+SCRIPT_DIR = Path(__file__).parent.resolve()
+HANDBOOK_ROOT = Path(os.environ.get('HANDBOOK_ROOT', SCRIPT_DIR.parent.parent))
+DEFAULT_KB_DIR = HANDBOOK_ROOT / "data" / "processed" / "courses"
+DEFAULT_EMBED_DIR = HANDBOOK_ROOT / "models" / "hf" / "qwen3-embedding-0.6b"
+F16_FILE = "embeddings.f16.npy"
+
+# float16 / int8 rows are upcast in blocks of this many rows (NumPy has no fast f16/int8 matmul)
+F16_BLOCK_ROWS = 2048
+
+
+def mrl_file(dim: int) -> str:
+    """File name of the truncated Matryoshka embeddings, e.g. embeddings.256d.npy"""
+    return f"embeddings.{dim}d.npy"
+
+
+def truncate_embeddings(vecs: np.ndarray, dim: int) -> np.ndarray:
+    """First `dim` dimensions of each row, re-normalized (Matryoshka truncation)"""
+    small = np.asarray(vecs[:, :dim], dtype=np.float32)
+    norms = np.linalg.norm(small, axis=1, keepdims=True)
+    return small / np.where(norms > 0, norms, 1.0)
+
+
+# Set bits per byte value, for Hamming distances between packed binary codes
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class LocalVectorIndex:
+    """Memory-mapped embeddings.npy + payloads.jsonl with exact cosine search"""
+    
+    def __init__(self, kb_dir: str, dtype: str = "float32", payloads: List[Dict] = None,
+                 check_interval: float = 10.0, quantization: str = "none", mrl_dim: int = 0):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}' (choose from {', '.join(QUANTIZATIONS)})")
+        self.kb_dir = Path(kb_dir)
+        self.dtype = dtype
+        self.quantization = quantization
+        self.mrl_dim = mrl_dim
+        self.kb_version = ManifestWatcher(str(self.kb_dir / "manifest.json"), check_interval)
+        self.load(payloads)
+    
+    def load(self, payloads: List[Dict] = None):
+        """(Re)open the matrix and rebuild the filter maps"""
+        path = self.kb_dir / (F16_FILE if self.dtype == "float16" else "embeddings.npy")
+        if not path.exists():
+            hint = " (create it with --write_f16)" if self.dtype == "float16" else ""
+            raise FileNotFoundError(f"{path} not found{hint}")
+        # mmap: no copy in this process, and the pages are shared with other workers
+        self.matrix = np.load(path, mmap_mode="r")
+        self.payloads = payloads if payloads is not None else load_payloads(self.kb_dir / "payloads.jsonl")
+        if len(self.payloads) != self.matrix.shape[0]:
+            raise ValueError(f"{path.name} has {self.matrix.shape[0]} rows, payloads.jsonl has {len(self.payloads)}")
+        
+        code_rows: Dict[str, List[int]] = {}
+        for row, payload in enumerate(self.payloads):
+            code_rows.setdefault((payload.get("course_code") or "").upper(), []).append(row)
+        self.code_rows = {code: np.array(rows, dtype=np.int64) for code, rows in code_rows.items()}
+        self._mask_cache: Dict = {}
+        self._field_tokens: Dict[str, List[set]] = {}  # payload key -> token set per row
+        self.quantize()
+        
+        self.mrl = None
+        if self.mrl_dim:
+            mrl_path = self.kb_dir / mrl_file(self.mrl_dim)
+            if mrl_path.exists():
+                self.mrl = np.load(mrl_path, mmap_mode="r")
+            else:
+                print(f"ℹ️  No {mrl_path.name} in {self.kb_dir} - truncating the full vectors in memory")
+                self.mrl = truncate_embeddings(self.matrix, self.mrl_dim)
+            if self.mrl.shape != (len(self), self.mrl_dim):
+                raise ValueError(f"{mrl_path.name} has shape {self.mrl.shape}, expected {(len(self), self.mrl_dim)}")
+    
+    def quantize(self):
+        """Build the in-RAM codes for `quantization` (None for float search)"""
+        self.codes = None
+        self.int8_scale = 1.0
+        if self.quantization not in ("int8", "binary"):
+            return
+        n = len(self)
+        # Only one float32 block exists at a time; the codes are filled in place
+        blocks = ((i, np.asarray(self.matrix[i:i + F16_BLOCK_ROWS], dtype=np.float32))
+                  for i in range(0, n, F16_BLOCK_ROWS))
+        if self.quantization == "int8":
+            # Symmetric range from the INT8_QUANTILE of |x| (on a sample of rows for large KBs)
+            sample = self.matrix[np.linspace(0, n - 1, min(n, 4096)).astype(np.int64)] if n else np.zeros(1)
+            bound = float(np.quantile(np.abs(np.asarray(sample, dtype=np.float32)), INT8_QUANTILE)) or 1.0
+            self.int8_scale = bound / 127
+            self.codes = np.empty((n, self.dim), dtype=np.int8)
+            for i, block in blocks:
+                self.codes[i:i + len(block)] = np.clip(np.rint(block / self.int8_scale), -127, 127)
+        else:
+            self.codes = np.empty((n, (self.dim + 7) // 8), dtype=np.uint8)
+            for i, block in blocks:
+                self.codes[i:i + len(block)] = np.packbits(block > 0, axis=1)
+    
+    @property
+    def search_bytes(self) -> int:
+        """Bytes scanned per unfiltered first-pass query: Matryoshka vectors, codes or the float matrix"""
+        if self.mrl is not None:
+            return int(self.mrl.nbytes)
+        return int(self.codes.nbytes if self.codes is not None else self.matrix.nbytes)
+    
+    def refresh_if_changed(self):
+        """Reopen the files if the knowledge base was rebuilt"""
+        if self.kb_version.changed():
+            print(f"🔄 Knowledge base version changed ({self.kb_version.version}), reloading local vectors")
+            self.load()
+    
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1])
+    
+    def __len__(self) -> int:
+        return int(self.matrix.shape[0])
+    
+    # ---------- Filtering ----------
+    
+    def _condition_rows(self, cond) -> np.ndarray:
+        """Rows (sorted) matching one qm.FieldCondition"""
+        match = cond.match
+        if cond.key == "course_code" and isinstance(match, qm.MatchValue):
+            return self.code_rows.get(str(match.value).upper(), np.zeros(0, dtype=np.int64))
+        if cond.key == "course_code" and isinstance(match, qm.MatchAny):
+            rows = [self.code_rows[code] for code in {str(v).upper() for v in match.any} if code in self.code_rows]
+            return np.sort(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+        
+        cache_key = (cond.key, type(match).__name__, repr(match))
+        rows = self._mask_cache.get(cache_key)
+        if rows is None:
+            if isinstance(match, qm.MatchValue):
+                keep = [p.get(cond.key) == match.value for p in self.payloads]
+            elif isinstance(match, qm.MatchText):
+                # Like Qdrant's full-text match: every query token appears in the field
+                wanted = set(tokenize(match.text))
+                tokens = self._field_tokens.get(cond.key)
+                if tokens is None:
+                    tokens = [set(tokenize(str(p.get(cond.key) or ""))) for p in self.payloads]
+                    self._field_tokens[cond.key] = tokens
+                keep = [wanted <= row_tokens for row_tokens in tokens]
+            elif isinstance(match, qm.MatchAny):
+                keep = [p.get(cond.key) in match.any for p in self.payloads]
+            else:
+                raise ValueError(f"Unsupported condition for local search: {cond}")
+            rows = np.flatnonzero(keep)
+            if len(self._mask_cache) >= 1024:
+                self._mask_cache.clear()
+            self._mask_cache[cache_key] = rows
+        return rows
+    
+    def filter_rows(self, query_filter: Optional[qm.Filter]) -> Optional[np.ndarray]:
+        """Rows allowed by a `must` filter of field conditions (None = all rows)"""
+        if query_filter is None or not query_filter.must:
+            if query_filter is not None and (query_filter.should or query_filter.must_not):
+                raise ValueError("Local search only supports `must` filters")
+            return None
+        rows = None
+        for cond in query_filter.must:
+            if isinstance(cond, qm.HasIdCondition):  # point id = row
+                ids = np.unique(np.asarray(cond.has_id, dtype=np.int64))
+                cond_rows = ids[(ids >= 0) & (ids < len(self))]
+            else:
+                cond_rows = self._condition_rows(cond)
+            rows = cond_rows if rows is None else np.intersect1d(rows, cond_rows, assume_unique=True)
+        return rows
+    
+    # ---------- Search ----------
+    
+    @staticmethod
+    def _dot(matrix: np.ndarray, q: np.ndarray) -> np.ndarray:
+        if matrix.dtype == np.float32:
+            return matrix @ q
+        return np.concatenate([
+            matrix[i:i + F16_BLOCK_ROWS].astype(np.float32) @ q
+            for i in range(0, matrix.shape[0], F16_BLOCK_ROWS)
+        ]) if matrix.shape[0] else np.zeros(0, dtype=np.float32)
+    
+    def _scores(self, q: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        return self._dot(self.matrix if rows is None else self.matrix[rows], q)
+    
+    def _quantized_scores(self, q: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Approximate cosine similarities from the codes"""
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.quantization == "int8":
+            return self._dot(codes, q) * self.int8_scale
+        # binary: 1 - 2 * (Hamming distance / dim)
+        q_bits = np.packbits(q > 0)
+        if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+            hamming = np.bitwise_count(codes ^ q_bits).sum(axis=1, dtype=np.int32)
+        else:
+            hamming = POPCOUNT[codes ^ q_bits].sum(axis=1, dtype=np.int32)
+        return 1.0 - 2.0 * hamming.astype(np.float32) / self.dim
+    
+    @staticmethod
+    def _top(scores: np.ndarray, n: int) -> np.ndarray:
+        """Indices of the n best scores, best first"""
+        n = min(n, len(scores))
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        top = np.argpartition(-scores, n - 1)[:n]
+        return top[np.argsort(-scores[top], kind="stable")]
+    
+    def search(self, query_vector, limit: int = 10, query_filter: qm.Filter = None,
+               with_payload=True, score_threshold: float = None,
+               oversampling: float = None, rescore: bool = True, exact: bool = False,
+               vector_name: str = None) -> List[qm.ScoredPoint]:
+        """Top `limit` by cosine similarity (vectors are normalized, so dot product)
+        
+        Exact over the float vectors unless the index is quantized: then the
+        codes are scanned for limit * oversampling candidates, which `rescore`
+        reorders by their float vectors. `exact` ignores the codes.
+        `vector_name` "mrl" searches the Matryoshka vectors instead.
+        """
+        q = np.asarray(query_vector, dtype=np.float32)
+        if vector_name == MRL_VECTOR and self.mrl is None:
+            raise ValueError(f"Not existing vector name error: {MRL_VECTOR} (open the index with mrl_dim)")
+        if vector_name not in (None, "", FULL_VECTOR, MRL_VECTOR):
+            raise ValueError(f"Not existing vector name error: {vector_name}")
+        dim = self.mrl_dim if vector_name == MRL_VECTOR else self.dim
+        if q.shape[0] != dim:
+            raise ValueError(f"Vector dimension error: expected dim: {dim}, got {q.shape[0]}")
+        
+        rows = self.filter_rows(query_filter)
+        if vector_name == MRL_VECTOR:
+            scores = self._dot(self.mrl if rows is None else self.mrl[rows], q)
+            top = self._top(scores, limit)
+            scores = scores[top]
+        elif self.codes is None or exact:
+            scores = self._scores(q, rows)
+            top = self._top(scores, limit)
+            scores = scores[top]
+        else:
+            approx = self._quantized_scores(q, rows)
+            top = self._top(approx, int(np.ceil(limit * max(oversampling or 1.0, 1.0))))
+            if rescore:
+                row_ids = top if rows is None else rows[top]
+                scores = self._dot(self.matrix[np.sort(row_ids)], q)[np.argsort(np.argsort(row_ids))]
+                order = np.argsort(-scores, kind="stable")[:limit]
+                top, scores = top[order], scores[order]
+            else:
+                top, scores = top[:limit], approx[top[:limit]]
+        
+        hits = []
+        for i, score in zip(top, scores):
+            score = float(score)
+            if score_threshold is not None and score < score_threshold:
+                break
+            row = int(rows[i]) if rows is not None else int(i)
+            payload = self.payloads[row]
+            if isinstance(with_payload, list):
+                payload = {k: v for k, v in payload.items() if k in with_payload}
+            elif not with_payload:
+                payload = None
+            hits.append(qm.ScoredPoint(id=row, version=0, score=score, payload=payload))
+        return hits
+
+
+# ---------- Qdrant-compatible clients ----------
+
+class LocalSearchClient:
+    """Drop-in for the QdrantClient calls used by retrieve_courses()"""
+    
+    def __init__(self, index: LocalVectorIndex, collection: str = "courses"):
+        self.index = index
+        self.collection = collection
+    
+    def _check(self, collection_name: str):
+        if collection_name != self.collection:
+            raise ValueError(f"Not found: Collection `{collection_name}` doesn't exist!")
+    
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name == self.collection
+    
+    def search(self, collection_name: str, query_vector, query_filter: qm.Filter = None,
+               limit: int = 10, with_payload=True, score_threshold: float = None,
+               search_params: qm.SearchParams = None, **kwargs):
+        self._check(collection_name)
+        self.index.refresh_if_changed()
+        quantization = search_params.quantization if search_params is not None else None
+        if quantization is None:
+            quantization = qm.QuantizationSearchParams()
+        vector_name = None
+        if isinstance(query_vector, qm.NamedVector):
+            vector_name, query_vector = query_vector.name, query_vector.vector
+        return self.index.search(query_vector, limit=limit, query_filter=query_filter,
+                                 with_payload=with_payload, score_threshold=score_threshold,
+                                 oversampling=quantization.oversampling,
+                                 rescore=quantization.rescore is not False,
+                                 exact=bool(quantization.ignore), vector_name=vector_name)
+    
+    def retrieve(self, collection_name: str, ids: List[int], with_payload=True, **kwargs) -> List[qm.Record]:
+        """Points by id (row index), like QdrantClient.retrieve(); unknown ids are skipped"""
+        self._check(collection_name)
+        self.index.refresh_if_changed()
+        n = len(self.index.payloads)
+        return [qm.Record(id=i, payload=self.index.payloads[i] if with_payload else None)
+                for i in ids if isinstance(i, int) and 0 <= i < n]
+    
+    def search_batch(self, collection_name: str, requests: List[qm.SearchRequest], **kwargs):
+        """One result list per qm.SearchRequest, like QdrantClient.search_batch()"""
+        return [LocalSearchClient.search(self, collection_name, request.vector, request.filter, request.limit,
+                                         request.with_payload, request.score_threshold, request.params)
+                for request in requests]
+    
+    def close(self):
+        pass
+
+
+class AsyncLocalSearchClient(LocalSearchClient):
+    """Drop-in for the AsyncQdrantClient calls used by the API server"""
+    
+    async def collection_exists(self, collection_name: str) -> bool:
+        return LocalSearchClient.collection_exists(self, collection_name)
+    
+    async def search(self, collection_name: str, query_vector, query_filter: qm.Filter = None,
+                     limit: int = 10, with_payload=True, score_threshold: float = None,
+                     search_params: qm.SearchParams = None, **kwargs):
+        # ~1 ms of BLAS for this corpus: cheaper inline than a thread hop
+        return LocalSearchClient.search(self, collection_name, query_vector, query_filter,
+                                        limit, with_payload, score_threshold, search_params)
+    
+    async def search_batch(self, collection_name: str, requests: List[qm.SearchRequest], **kwargs):
+        return LocalSearchClient.search_batch(self, collection_name, requests)
+    
+    async def retrieve(self, collection_name: str, ids: List[int], with_payload=True, **kwargs) -> List[qm.Record]:
+        return LocalSearchClient.retrieve(self, collection_name, ids, with_payload)
+    
+    async def close(self):
+        pass
+
+
+# ---------- CLI ----------
+
+def main():
+    parser = argparse.ArgumentParser(description='Exact local vector search over embeddings.npy')
+    parser.add_argument('--kb_dir', default=str(DEFAULT_KB_DIR), help='Folder with embeddings.npy + payloads.jsonl')
+    parser.add_argument('--write_f16', action='store_true', help=f'Write a float16 copy ({F16_FILE}) and exit')
+    parser.add_argument('--write_mrl', type=int, default=0, help=f'Write {mrl_file(256)}-style truncated vectors and exit')
+    parser.add_argument('--mrl_dim', type=int, default=0, help='Load truncated vectors of this size (named vector "mrl")')
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float16'])
+    parser.add_argument('--quantization', default='none', choices=list(QUANTIZATIONS),
+                        help='Search int8/binary codes, rescoring the candidates with the float vectors')
+    parser.add_argument('--oversampling', type=float, default=2.0, help='Candidates = k * oversampling (quantized)')
+    parser.add_argument('--q', default=None, help='Query string (needs the embedding model)')
+    parser.add_argument('--course_code', default=None, help='Filter by course code')
+    parser.add_argument('--embed_dir', default=str(DEFAULT_EMBED_DIR), help='Embedding model directory')
+    parser.add_argument('--k', type=int, default=8, help='Number of results')
+    args = parser.parse_args()
+    
+    if args.write_f16:
+        matrix = np.load(Path(args.kb_dir) / "embeddings.npy", mmap_mode="r")
+        out = Path(args.kb_dir) / F16_FILE
+        np.save(out, matrix.astype(np.float16))
+        print(f"✅ Wrote {matrix.shape[0]} x {matrix.shape[1]} float16 → {out}")
+        return 0
+    if args.write_mrl:
+        matrix = np.load(Path(args.kb_dir) / "embeddings.npy", mmap_mode="r")
+        out = Path(args.kb_dir) / mrl_file(args.write_mrl)
+        np.save(out, truncate_embeddings(matrix, args.write_mrl))
+        print(f"✅ Wrote {matrix.shape[0]} x {args.write_mrl} truncated vectors → {out}")
+        return 0
+    
+    index = LocalVectorIndex(args.kb_dir, dtype=args.dtype, quantization=args.quantization, mrl_dim=args.mrl_dim)
+    print(f"📂 {len(index)} x {index.dim} {index.matrix.dtype} vectors (memory-mapped), "
+          f"{index.search_bytes / 2**20:.1f} MiB scanned per query ({args.quantization})")
+    if args.q is None:
+        return 0
+    
+    from sentence_transformers import SentenceTransformer
+    from query_hybrid_rag import build_course_filter
+    
+    encoder = SentenceTransformer(args.embed_dir)
+    qv = encoder.encode([args.q], prompt_name="query", normalize_embeddings=True)[0]
+    started = time.perf_counter()
+    hits = index.search(qv, limit=args.k, query_filter=build_course_filter(args.course_code),
+                        oversampling=args.oversampling)
+    print(f"{len(hits)} hits in {(time.perf_counter() - started) * 1000:.2f} ms")
+    for i, hit in enumerate(hits, 1):
+        print(f"{i}. {hit.score:.4f}  {hit.payload.get('course_code')}  {hit.payload.get('chunk_label')}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
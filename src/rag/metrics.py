@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics for the chat pipeline
+Per-stage latency histograms (embed, search, context, generate, total), context
+size, and Ollama's own timing/token fields, exported by the API server at
+/metrics. server_timing_header() renders the same per-request timings as a
+`Server-Timing` header so they show up in the browser's network panel.
+"""
+from typing import Callable, Dict, Optional
+
+from prometheus_client import Counter, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Latency buckets (seconds): sub-ms cache hits up to multi-minute generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 20, 30, 60, 120, 180)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+CHAR_BUCKETS = (250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 16000)
+
+STAGE_SECONDS = Histogram(
+    "handbook_stage_seconds", "Time spent in each RAG pipeline stage",
+    ["endpoint", "stage"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "handbook_request_seconds", "End-to-end request time",
+    ["endpoint", "outcome"], buckets=LATENCY_BUCKETS
+)
+CONTEXT_CHARS = Histogram(
+    "handbook_context_chars", "Size of the context passed to the LLM (characters)",
+    ["endpoint"], buckets=CHAR_BUCKETS
+)
+CONTEXT_TOKENS = Histogram(
+    "handbook_context_tokens", "Context packed into the prompt (model tokens, see context_packer)",
+    ["endpoint"], buckets=TOKEN_BUCKETS
+)
+OLLAMA_TTFT_SECONDS = Histogram(
+    "handbook_ollama_ttft_seconds", "Time from request arrival to the first generated token",
+    ["endpoint"], buckets=LATENCY_BUCKETS
+)
+OLLAMA_DURATION_SECONDS = Histogram(
+    "handbook_ollama_duration_seconds", "Ollama-reported durations (load, prompt_eval, eval, total)",
+    ["phase"], buckets=LATENCY_BUCKETS
+)
+OLLAMA_TOKENS = Histogram(
+    "handbook_ollama_tokens", "Ollama-reported token counts",
+    ["kind"], buckets=TOKEN_BUCKETS
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "handbook_admission_wait_seconds", "Time admitted requests waited for a generation slot",
+    ["route"], buckets=LATENCY_BUCKETS
+)
+DEGRADED_STAGES = Counter(
+    "handbook_degraded_stages_total", "Pipeline stages that fell back to a degraded result",
+    ["stage"]
+)
+
+# Ollama duration fields are nanoseconds
+_OLLAMA_DURATIONS = {
+    "load_duration": "load",
+    "prompt_eval_duration": "prompt_eval",
+    "eval_duration": "eval",
+    "total_duration": "total",
+}
+_OLLAMA_COUNTS = {
+    "prompt_eval_count": "prompt",
+    "eval_count": "completion",
+}
+
+
+def observe_stage(endpoint: str, stage: str, ms: float):
+    STAGE_SECONDS.labels(endpoint=endpoint, stage=stage).observe(ms / 1000)
+
+
+def observe_run(endpoint: str, run, total_ms: float, outcome: str = "ok"):
+    """Record everything a finished RagRun (see async_pipeline) measured"""
+    for stage, ms in run.timings.items():
+        observe_stage(endpoint, stage, ms)
+    observe_stage(endpoint, "total", total_ms)
+    REQUEST_SECONDS.labels(endpoint=endpoint, outcome=outcome).observe(total_ms / 1000)
+    if run.context is not None:
+        CONTEXT_CHARS.labels(endpoint=endpoint).observe(len(run.context))
+    if run.context_info.get("tokens"):
+        CONTEXT_TOKENS.labels(endpoint=endpoint).observe(run.context_info["tokens"])
+    for stage in run.degraded:
+        DEGRADED_STAGES.labels(stage=stage).inc()
+    observe_ollama_stats(run.ollama_stats)
+
+
+def observe_request(endpoint: str, total_ms: float, outcome: str):
+    """Record a request that didn't go through the pipeline (cache hit, error, ...)"""
+    REQUEST_SECONDS.labels(endpoint=endpoint, outcome=outcome).observe(total_ms / 1000)
+
+
+def observe_ttft(endpoint: str, ms: float):
+    OLLAMA_TTFT_SECONDS.labels(endpoint=endpoint).observe(ms / 1000)
+
+
+def observe_admission_wait(route: str, seconds: float):
+    ADMISSION_WAIT_SECONDS.labels(route=route).observe(seconds)
+
+
+def observe_ollama_stats(stats: Optional[Dict]):
+    """Record Ollama's final-response timing/token fields"""
+    if not stats:
+        return
+    for field, phase in _OLLAMA_DURATIONS.items():
+        if stats.get(field) is not None:
+            OLLAMA_DURATION_SECONDS.labels(phase=phase).observe(stats[field] / 1e9)
+    for field, kind in _OLLAMA_COUNTS.items():
+        if stats.get(field) is not None:
+            OLLAMA_TOKENS.labels(kind=kind).observe(stats[field])
+
+
+def server_timing_header(timings: Dict[str, float], total_ms: float = None) -> str:
+    """`Server-Timing` value, e.g. 'embed;dur=12.3, search;dur=8.1, total;dur=950.0'"""
+    parts = [f"{stage};dur={ms:.1f}" for stage, ms in timings.items()]
+    if total_ms is not None:
+        parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+class StatsCollector:
+    """
+    Exposes a component's plain `stats` dict (QueryEncoder, AnswerCache, ...)
+    as Prometheus metrics at scrape time, without touching its hot path.
+    Integer counters become `<prefix>_<key>_total`; keys in `gauges` become gauges.
+    """
+    
+    def __init__(self, prefix: str, getter: Callable[[], Optional[Dict]], gauges=()):
+        self.prefix = prefix
+        self.getter = getter
+        self.gauges = set(gauges)
+    
+    def collect(self):
+        stats = self.getter() or {}
+        for key, value in stats.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            name = f"{self.prefix}_{key}"
+            if key in self.gauges:
+                yield GaugeMetricFamily(name, f"{self.prefix} {key}", value=value)
+            else:
+                yield CounterMetricFamily(name, f"{self.prefix} {key}", value=value)
+
+
+def register_stats(prefix: str, getter: Callable[[], Optional[Dict]], gauges=()):
+    REGISTRY.register(StatsCollector(prefix, getter, gauges))
+
+
+def render_latest():
+    """(body, content type) for the /metrics endpoint"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
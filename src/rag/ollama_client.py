@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+"""
+Generation client for Ollama
+Ollama unloads a model after `keep_alive` (5 minutes by default) without
+requests, and the next user then waits seconds for qwen2.5:7b to load again.
+OllamaClient keeps the model resident and the connections open:
+- one pooled keep-alive httpx.AsyncClient per Ollama server
+- every request carries `keep_alive` and the configured options (num_ctx,
+  num_predict); a different num_ctx than the loaded one also forces a reload,
+  so warm-up and keep-warm send the same num_ctx as real generations
+- warm_up() generates one token at startup, so the first user doesn't pay the load
+- an optional keep-warm task pings the model (/api/generate without a prompt,
+  which only loads it) whenever nothing was generated for `keep_warm_s`
+- Ollama's `load_duration` of every response is tracked in `stats`; one over
+  `load_threshold_ms` is counted as a model load
+
+OllamaPool spreads generations over several Ollama servers with the same
+interface as OllamaClient (the API server always goes through a pool):
+- least-outstanding-requests balancing (ties round-robin)
+- passive health checks: `max_fails` consecutive errors eject a backend for
+  `eject_s`; after that one more failure ejects it again
+- active health checks: /api/tags every `health_interval_s`; a backend that
+  doesn't answer or lacks the model is ejected, one that answers is reinstated
+- a failed request is retried once on another backend (streams only if
+  nothing was sent yet)
+- optional hedging of non-streaming generations: if no answer arrived after
+  the `hedge_quantile` of recent latencies, the same request goes to a second
+  backend and the first answer wins (the other is cancelled)
+
+shared_session() is the pooled requests.Session for the synchronous helpers
+in query_hybrid_rag.py.
+
+Usage:
+    python ollama_client.py --model qwen2.5:7b --keep_alive 30m --q "Say hi"
+    python ollama_client.py --hosts 127.0.0.1:11434,127.0.0.1:11435 --q "Say hi"
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import httpx
+import requests
+
+DEFAULT_KEEP_ALIVE = "30m"   # Ollama's own default is 5m
+LOAD_THRESHOLD_MS = 250.0    # load_duration above this means the model was (re)loaded
+
+# Timing/token fields reported by Ollama in the final response chunk
+OLLAMA_STAT_FIELDS = (
+    "total_duration", "load_duration",
+    "prompt_eval_count", "prompt_eval_duration",
+    "eval_count", "eval_duration",
+)
+
+_session: Optional[requests.Session] = None
+
+
+def response_stats(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Timing/token fields of a final Ollama response (durations in nanoseconds)"""
+    return {key: data[key] for key in OLLAMA_STAT_FIELDS if key in data}
+
+
+def parse_endpoints(spec: str, default_port: int = 11434) -> List[Tuple[str, int]]:
+    """'gpu1:11434,gpu2' -> [('gpu1', 11434), ('gpu2', 11434)]"""
+    endpoints = []
+    for part in (spec or "").split(","):
+        host, _, port = part.strip().rpartition(":") if ":" in part else (part.strip(), "", "")
+        if host:
+            endpoints.append((host, int(port) if port else default_port))
+    return endpoints
+
+
+def shared_session(pool_size: int = 4) -> requests.Session:
+    """Process-wide requests.Session for synchronous Ollama calls (connection reuse)"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+class OllamaClient:
+    """Pooled async client for one Ollama server and model, with model residency management"""
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 11434, model: str = "qwen2.5:7b",
+                 keep_alive: str = DEFAULT_KEEP_ALIVE, options: Dict[str, Any] = None,
+                 pool_size: int = 16, timeout: float = 180.0, connect_timeout: float = 10.0,
+                 keep_warm_s: float = 0.0, load_threshold_ms: float = LOAD_THRESHOLD_MS):
+        self.host = host
+        self.port = port
+        self.model = model
+        self.keep_alive = keep_alive
+        self.options = dict(options or {})
+        self.keep_warm_s = keep_warm_s
+        self.load_threshold_ms = load_threshold_ms
+        self.http = httpx.AsyncClient(
+            base_url=f"http://{host}:{port}",
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout)
+        )
+        self.last_used = time.monotonic()
+        self._keep_warm_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "requests": 0, "streams": 0, "errors": 0,
+            "warmups": 0, "keep_warm_pings": 0,
+            "model_loads": 0, "load_seconds": 0.0, "last_load_ms": 0.0,
+        }
+    
+    @property
+    def name(self) -> str:
+        return f"{self.host}:{self.port}"
+    
+    def payload(self, messages: List[Dict[str, str]], stream: bool, **options) -> Dict[str, Any]:
+        """/api/chat body with keep_alive and the configured options (`options` override them)"""
+        body = {"model": self.model, "stream": stream, "messages": messages, "keep_alive": self.keep_alive}
+        merged = {**self.options, **options}
+        if merged:
+            body["options"] = merged
+        return body
+    
+    def observe(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Record the load_duration of a final response; returns its timing/token fields"""
+        self.last_used = time.monotonic()
+        stats = response_stats(data)
+        load_ms = stats.get("load_duration", 0) / 1e6
+        if load_ms >= self.load_threshold_ms:
+            self.stats["model_loads"] += 1
+            self.stats["load_seconds"] += load_ms / 1000
+            self.stats["last_load_ms"] = load_ms
+            print(f"🐢 Ollama {self.name} loaded {self.model} ({load_ms:.0f} ms)")
+        return stats
+    
+    # ---------- Generation ----------
+    
+    async def chat(self, messages: List[Dict[str, str]], **options) -> Dict[str, Any]:
+        """Non-streaming /api/chat; returns the whole response (raises on errors)"""
+        self.stats["requests"] += 1
+        try:
+            r = await self.http.post("/api/chat", json=self.payload(messages, False, **options))
+            r.raise_for_status()
+            data = r.json()
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        self.observe(data)
+        return data
+    
+    async def stream_chat(self, messages: List[Dict[str, str]], **options) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming /api/chat as chunk dicts
+        
+        Yields `{"content": "<text>", "done": False}` for every chunk Ollama
+        produces, then one final `{"content": ..., "done": True, "stats": {...}}`
+        with Ollama's timing/token fields (OLLAMA_STAT_FIELDS, durations in
+        nanoseconds). Errors are raised to the caller.
+        """
+        self.stats["streams"] += 1
+        try:
+            async with self.http.stream("POST", "/api/chat", json=self.payload(messages, True, **options)) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise RuntimeError(f"Ollama error: {data['error']}")
+                    content = data.get("message", {}).get("content", "")
+                    if data.get("done"):
+                        yield {"content": content, "done": True, "stats": self.observe(data)}
+                        return
+                    yield {"content": content, "done": False}
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+    
+    # ---------- Model residency ----------
+    
+    async def ping(self) -> Dict[str, Any]:
+        """Load the model (or extend its keep_alive) without generating anything"""
+        body = {"model": self.model, "keep_alive": self.keep_alive}
+        if "num_ctx" in self.options:
+            body["options"] = {"num_ctx": self.options["num_ctx"]}
+        r = await self.http.post("/api/generate", json=body)
+        r.raise_for_status()
+        self.stats["keep_warm_pings"] += 1
+        return self.observe(r.json())
+    
+    async def warm_up(self) -> float:
+        """Generate one token so the model is loaded before the first user; returns load ms"""
+        started = time.perf_counter()
+        data = await self.chat([{"role": "user", "content": "Hi"}], num_predict=1)
+        self.stats["warmups"] += 1
+        load_ms = data.get("load_duration", 0) / 1e6
+        print(f"🔥 Ollama {self.name}: {self.model} warm "
+              f"({(time.perf_counter() - started) * 1000:.0f} ms, load {load_ms:.0f} ms, keep_alive {self.keep_alive})")
+        return load_ms
+    
+    def start_keep_warm(self):
+        """Ping the model whenever it has been idle for keep_warm_s (no-op if keep_warm_s is 0)"""
+        if self.keep_warm_s > 0 and self._keep_warm_task is None:
+            self._keep_warm_task = asyncio.create_task(self._keep_warm_loop())
+    
+    async def _keep_warm_loop(self):
+        while True:
+            idle = time.monotonic() - self.last_used
+            await asyncio.sleep(max(self.keep_warm_s - idle, 1.0))
+            if time.monotonic() - self.last_used < self.keep_warm_s:
+                continue
+            try:
+                await self.ping()
+            except Exception as e:
+                self.last_used = time.monotonic()  # don't retry in a tight loop
+                print(f"⚠️  Keep-warm ping to Ollama {self.name} failed: {e}")
+    
+    # ---------- Server info ----------
+    
+    async def tags(self) -> List[str]:
+        """Models the server has pulled (raises if it doesn't answer)"""
+        r = await self.http.get("/api/tags", timeout=5)
+        r.raise_for_status()
+        return [m.get("name") for m in r.json().get("models", [])]
+    
+    async def num_ctx(self, default: int = 2048) -> int:
+        """
+        Context window Ollama actually runs the model with: the Modelfile's
+        num_ctx parameter if set, else Ollama's default (not the model's trained
+        maximum, which /api/show reports as <arch>.context_length).
+        """
+        r = await self.http.post("/api/show", json={"name": self.model}, timeout=10)
+        r.raise_for_status()
+        for line in (r.json().get("parameters") or "").splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[0] == "num_ctx":
+                return int(parts[1])
+        return default
+    
+    async def close(self):
+        if self._keep_warm_task is not None:
+            self._keep_warm_task.cancel()
+            self._keep_warm_task = None
+        await self.http.aclose()
+
+
+# ---------- Pool ----------
+
+class PoolBackend:
+    """One OllamaClient plus the pool's bookkeeping for it"""
+    
+    def __init__(self, client: OllamaClient):
+        self.client = client
+        self.outstanding = 0
+        self.failures = 0           # consecutive
+        self.ejected_until = 0.0    # monotonic; 0 = never ejected
+        self.ejected_by = None      # "errors" (passive) or "health" (active check)
+        self.last_error: Optional[str] = None
+        self.stats = {"requests": 0, "errors": 0, "ejections": 0}
+    
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+
+class OllamaPool:
+    """Least-outstanding balancing, health checks and hedging over several Ollama servers"""
+    
+    def __init__(self, clients: List[OllamaClient], max_fails: int = 3, eject_s: float = 30.0,
+                 health_interval_s: float = 10.0, hedge: bool = False, hedge_quantile: float = 0.95,
+                 hedge_min_ms: float = 500.0, hedge_min_samples: int = 20):
+        if not clients:
+            raise ValueError("OllamaPool needs at least one client")
+        self.backends = [PoolBackend(client) for client in clients]
+        self.model = clients[0].model
+        self.max_fails = max_fails
+        self.eject_s = eject_s
+        self.health_interval_s = health_interval_s
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_ms = hedge_min_ms
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies: "deque[float]" = deque(maxlen=200)  # ms of recent non-streaming generations
+        self._rr = 0
+        self._health_task: Optional[asyncio.Task] = None
+        self.counters = {"failovers": 0, "hedges": 0, "hedge_wins": 0, "ejections": 0}
+    
+    # ---------- Balancing / health ----------
+    
+    def pick(self, exclude=()) -> Optional[PoolBackend]:
+        """Healthy backend with the fewest requests in flight (all ejected: any backend)"""
+        candidates = [b for b in self.backends if b not in exclude]
+        healthy = [b for b in candidates if b.healthy]
+        candidates = healthy or candidates
+        if not candidates:
+            return None
+        self._rr += 1
+        order = {id(b): (i - self._rr) % len(self.backends) for i, b in enumerate(self.backends)}
+        return min(candidates, key=lambda b: (b.outstanding, order[id(b)]))
+    
+    def _eject(self, backend: PoolBackend, reason: str, source: str = "errors"):
+        was_healthy = backend.healthy
+        backend.ejected_until = time.monotonic() + self.eject_s
+        backend.ejected_by = source
+        # Back in rotation after eject_s, but one more failure ejects it again
+        backend.failures = self.max_fails - 1
+        if was_healthy:
+            backend.stats["ejections"] += 1
+            self.counters["ejections"] += 1
+            print(f"🚫 Ollama {backend.client.name} ejected for {self.eject_s:g}s: {reason}")
+    
+    def _reinstate(self, backend: PoolBackend):
+        if not backend.healthy:
+            print(f"✅ Ollama {backend.client.name} back in rotation")
+        backend.ejected_until = 0.0
+        backend.ejected_by = None
+        backend.failures = 0
+        backend.last_error = None
+    
+    def _failed(self, backend: PoolBackend, error: Exception):
+        backend.stats["errors"] += 1
+        backend.failures += 1
+        backend.last_error = str(error) or type(error).__name__
+        if backend.failures >= self.max_fails:
+            self._eject(backend, backend.last_error)
+    
+    async def check_health(self) -> int:
+        """Active check of every backend (/api/tags + model present); returns the healthy count"""
+        results = await asyncio.gather(*(b.client.tags() for b in self.backends), return_exceptions=True)
+        for backend, result in zip(self.backends, results):
+            if isinstance(result, Exception):
+                backend.last_error = str(result) or type(result).__name__
+                self._eject(backend, f"health check: {backend.last_error}", "health")
+            elif self.model not in result and f"{self.model}:latest" not in result:
+                backend.last_error = f"model {self.model} not pulled"
+                self._eject(backend, backend.last_error, "health")
+            elif not backend.healthy and backend.ejected_by == "health":
+                # An ejection for failed generations runs its course: /api/tags
+                # answering doesn't mean generations work again
+                self._reinstate(backend)
+        return sum(b.healthy for b in self.backends)
+    
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval_s)
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"⚠️  Ollama health check failed: {e}")
+    
+    # ---------- Generation ----------
+    
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None (hedging off / too few samples / one backend)"""
+        if not self.hedge or len(self.latencies) < self.hedge_min_samples:
+            return None
+        if sum(b.healthy for b in self.backends) < 2:
+            return None
+        return max(float(np.quantile(self.latencies, self.hedge_quantile)), self.hedge_min_ms) / 1000
+    
+    async def _chat_on(self, backend: PoolBackend, messages, options) -> Dict[str, Any]:
+        backend.outstanding += 1
+        backend.stats["requests"] += 1
+        started = time.perf_counter()
+        try:
+            data = await backend.client.chat(messages, **options)
+        except Exception as e:
+            self._failed(backend, e)
+            raise
+        finally:
+            backend.outstanding -= 1
+        backend.failures = 0
+        self.latencies.append((time.perf_counter() - started) * 1000)
+        return data
+    
+    async def chat(self, messages: List[Dict[str, str]], **options) -> Dict[str, Any]:
+        """OllamaClient.chat() on the least busy backend, hedged and failed over"""
+        first = self.pick()
+        tasks = {asyncio.create_task(self._chat_on(first, messages, options)): first}
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(set(tasks), timeout=delay)
+                second = None if done else self.pick(exclude=(first,))
+                if second is not None:
+                    self.counters["hedges"] += 1
+                    tasks[asyncio.create_task(self._chat_on(second, messages, options))] = second
+            
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if tasks[task] is not first:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        backend = self.pick(exclude=tuple(tasks.values()))
+        if backend is None:
+            raise error
+        self.counters["failovers"] += 1
+        print(f"⚠️  Ollama {first.client.name} failed ({error}); retrying on {backend.client.name}")
+        return await self._chat_on(backend, messages, options)
+    
+    async def stream_chat(self, messages: List[Dict[str, str]], **options) -> AsyncIterator[Dict[str, Any]]:
+        """OllamaClient.stream_chat() on the least busy backend (failover before the first chunk)"""
+        tried = []
+        while True:
+            backend = self.pick(exclude=tried)
+            tried.append(backend)
+            backend.outstanding += 1
+            backend.stats["requests"] += 1
+            sent = False
+            try:
+                async for chunk in backend.client.stream_chat(messages, **options):
+                    sent = True
+                    yield chunk
+                backend.failures = 0
+                return
+            except Exception as e:
+                self._failed(backend, e)
+                if sent or self.pick(exclude=tried) is None:
+                    raise
+                self.counters["failovers"] += 1
+                print(f"⚠️  Ollama {backend.client.name} failed ({e}); streaming from another backend")
+            finally:
+                backend.outstanding -= 1
+    
+    # ---------- Model residency / server info ----------
+    
+    async def tags(self) -> List[str]:
+        """Models served by the pool; raises if no backend is healthy"""
+        if not await self.check_health():
+            errors = "; ".join(f"{b.client.name}: {b.last_error}" for b in self.backends)
+            raise RuntimeError(f"No healthy Ollama backend ({errors})")
+        return [self.model]
+    
+    async def num_ctx(self, default: int = 2048) -> int:
+        return await self.pick().client.num_ctx(default)
+    
+    async def warm_up(self) -> float:
+        """Load the model on every backend; returns the longest load (ms)"""
+        results = await asyncio.gather(*(b.client.warm_up() for b in self.backends), return_exceptions=True)
+        loads = [r for r in results if not isinstance(r, Exception)]
+        for backend, result in zip(self.backends, results):
+            if isinstance(result, Exception):
+                print(f"⚠️  Warm-up on Ollama {backend.client.name} failed: {result}")
+        if not loads:
+            raise RuntimeError("Warm-up failed on every Ollama backend")
+        return max(loads)
+    
+    def start_keep_warm(self):
+        """Keep-warm pings on every backend plus the periodic health check"""
+        for backend in self.backends:
+            backend.client.start_keep_warm()
+        if self.health_interval_s > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+    
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Client counters summed over backends, plus pool counters and gauges"""
+        totals: Dict[str, Any] = {}
+        for backend in self.backends:
+            for key, value in backend.client.stats.items():
+                totals[key] = max(totals.get(key, 0), value) if key == "last_load_ms" else totals.get(key, 0) + value
+        totals.update(self.counters)
+        totals["backends"] = len(self.backends)
+        totals["healthy_backends"] = sum(b.healthy for b in self.backends)
+        totals["outstanding"] = sum(b.outstanding for b in self.backends)
+        return totals
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-backend state for the API's /api/chatbot/ollama/ endpoint"""
+        delay = self.hedge_delay()
+        return {
+            "model": self.model,
+            "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+            "counters": dict(self.counters),
+            "backends": [
+                {
+                    "endpoint": b.client.name,
+                    "healthy": b.healthy,
+                    "outstanding": b.outstanding,
+                    "consecutive_failures": b.failures,
+                    "ejected_for_s": round(max(b.ejected_until - time.monotonic(), 0.0), 1),
+                    "last_error": b.last_error,
+                    **b.stats,
+                    "model_loads": b.client.stats["model_loads"],
+                }
+                for b in self.backends
+            ],
+        }
+    
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(b.client.close() for b in self.backends))
+
+
+# ---------- CLI ----------
+
+async def _main(args):
+    options = {"num_ctx": args.num_ctx} if args.num_ctx else None
+    endpoints = parse_endpoints(args.hosts) if args.hosts else [(args.host, args.port)]
+    client = OllamaPool([OllamaClient(host, port, args.model, keep_alive=args.keep_alive, options=options)
+                         for host, port in endpoints])
+    try:
+        await client.tags()
+        print(f"Healthy backends: {client.stats['healthy_backends']}/{len(endpoints)}")
+        await client.warm_up()
+        if args.q:
+            started = time.perf_counter()
+            data = await client.chat([{"role": "user", "content": args.q}])
+            print(f"\n{data['message']['content']}\n")
+            print(f"⏱️  {(time.perf_counter() - started) * 1000:.0f} ms, "
+                  f"load {data.get('load_duration', 0) / 1e6:.0f} ms (warm model: ~0)")
+        print(f"Stats: {client.stats}")
+        print(json.dumps(client.snapshot(), indent=2))
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm up an Ollama model and check its load time')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--hosts', default=None, help='Several servers, e.g. 127.0.0.1:11434,127.0.0.1:11435')
+    parser.add_argument('--model', default='qwen2.5:7b')
+    parser.add_argument('--keep_alive', default=DEFAULT_KEEP_ALIVE, help='How long Ollama keeps the model loaded')
+    parser.add_argument('--num_ctx', type=int, default=0, help='Context window to load the model with (0 = model default)')
+    parser.add_argument('--q', default=None, help='Question to ask after the warm-up')
+    args = parser.parse_args()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
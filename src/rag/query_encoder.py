@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Query embedding service for the API server
+Concurrent chat requests each need a single query vector. Encoding them one at a
+time wastes most of the matmul throughput, so QueryEncoder:
+- collects queries that arrive within a short window (or until max_batch)
+- encodes them with ONE batched encoder.encode() call in a worker thread
+- hands each caller its own vector
+An LRU of recent normalized queries sits in front, so repeated questions
+skip encoding entirely. The normalized form is only the cache key: the model
+sees the query as typed (whitespace collapsed), so course codes and acronyms
+like "C10302" or "BIT" keep their case.
+"""
+import asyncio
+import re
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import List, Dict, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def clean_query(query: str) -> str:
+    """Text that gets embedded: the query with whitespace collapsed"""
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form used as cache key"""
+    return clean_query(query).casefold()
+
+
+class QueryEncoder:
+    """Micro-batching, LRU-cached wrapper around a SentenceTransformer"""
+    
+    def __init__(self, encoder, executor: Executor = None, window_ms: float = 3.0,
+                 max_batch: int = 16, cache_size: int = 2048):
+        self.encoder = encoder
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []  # (key, text, future)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._flush_handle = None
+        self._tasks = set()
+        self.stats = {"cache_hits": 0, "cache_misses": 0, "batches": 0, "batched_queries": 0}
+    
+    # ---------- Cache ----------
+    
+    def _cache_get(self, key: str):
+        vec = self._cache.get(key)
+        if vec is not None:
+            self._cache.move_to_end(key)
+        return vec
+    
+    def _cache_put(self, key: str, vec: List[float]):
+        self._cache[key] = vec
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    # ---------- Encoding ----------
+    
+    def _encode_now(self, texts: List[str]) -> List[List[float]]:
+        vecs = self.encoder.encode(texts, batch_size=len(texts), prompt_name="query",
+                                   normalize_embeddings=True)
+        return [v.tolist() for v in vecs]
+    
+    async def encode(self, query: str) -> List[float]:
+        """Normalized query vector for `query` (cached, batched with concurrent callers)"""
+        key = normalize_query(query)
+        vec = self._cache_get(key)
+        if vec is not None:
+            self.stats["cache_hits"] += 1
+            return vec
+        self.stats["cache_misses"] += 1
+        
+        # Same question already waiting for a batch - share its result
+        fut = self._inflight.get(key)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            self._inflight[key] = fut
+            self._pending.append((key, clean_query(query), fut))
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(fut)
+    
+    async def encode_many(self, queries: List[str]) -> List[List[float]]:
+        """Vectors for many queries at once (cache first, then one batched encode)"""
+        keys = [normalize_query(q) for q in queries]
+        texts = {}
+        for key, query in zip(keys, queries):
+            texts.setdefault(key, clean_query(query))
+        found = {}
+        for key in keys:
+            vec = self._cache_get(key)
+            if vec is not None:
+                found[key] = vec
+        missing = [key for key in texts if key not in found]
+        self.stats["cache_hits"] += len(keys) - len(missing)
+        self.stats["cache_misses"] += len(missing)
+        
+        if missing:
+            loop = asyncio.get_running_loop()
+            vecs = await loop.run_in_executor(self.executor, self._encode_now, [texts[key] for key in missing])
+            self.stats["batches"] += 1
+            self.stats["batched_queries"] += len(missing)
+            for key, vec in zip(missing, vecs):
+                self._cache_put(key, vec)
+                found[key] = vec
+        return [found[key] for key in keys]
+    
+    def _flush(self):
+        """Start encoding everything collected so far as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            # Keep a reference until done so the task isn't garbage collected
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run_batch(self, batch: List[Tuple[str, str, asyncio.Future]]):
+        keys = [key for key, _, _ in batch]
+        loop = asyncio.get_running_loop()
+        try:
+            vecs = await loop.run_in_executor(self.executor, self._encode_now, [text for _, text, _ in batch])
+        except Exception as e:
+            for key, _, fut in batch:
+                self._inflight.pop(key, None)
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        
+        self.stats["batches"] += 1
+        self.stats["batched_queries"] += len(keys)
+        for (key, _, fut), vec in zip(batch, vecs):
+            self._cache_put(key, vec)
+            self._inflight.pop(key, None)
+            if not fut.done():
+                fut.set_result(vec)
@@ -5,42 +5,54 @@ Simplified version for course information retrieval
 """
 import argparse
 import json
+import math
 import os
+import time
 from pathlib import Path
+import numpy as np
 import requests
 from typing import List, Dict, Any
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qm
 from sentence_transformers import SentenceTransformer
 
+from context_packer import ContextPacker, CHARS_PER_TOKEN
+from ollama_client import DEFAULT_KEEP_ALIVE, shared_session
+from collection_schema import FULL_VECTOR, MRL_VECTOR, search_params
+
 # Get project root directory
 SCRIPT_DIR = Path(__file__).parent.resolve()
 HANDBOOK_ROOT = Path(os.environ.get('HANDBOOK_ROOT', SCRIPT_DIR.parent.parent))
 DEFAULT_EMBED_DIR = HANDBOOK_ROOT / "models" / "hf" / "qwen3-embedding-0.6b"
+DEFAULT_KB_DIR = HANDBOOK_ROOT / "data" / "processed" / "courses"
 
 # ---------- Course retrieval function ----------
 
-def retrieve_courses(q: str, embed_dir: str, collection: str = "courses",
-                     course_code: str = None, course_name: str = None,
-                     host="localhost", port=6333, limit=30):
-    """Retrieve course information from Qdrant"""
-    
-    # Initialize embedding model
-    enc = SentenceTransformer(embed_dir)
-    qv = enc.encode([q], prompt_name="query", normalize_embeddings=True)[0].tolist()
-    
-    # Initialize Qdrant client
-    cli = QdrantClient(host=host, port=port)
+def split_course_codes(course_code: str = None) -> List[str]:
+    """'C10302' -> ['C10302']; 'C04372,C04418' (an ambiguous alias, see course_aliases.py) -> both"""
+    return [code.strip().upper() for code in (course_code or "").split(",") if code.strip()]
+
+
+def build_course_filter(course_code: str = None, course_name: str = None):
+    """Qdrant filter restricting results to a course code and/or name (None if neither)
     
-    # Build filter if course_code or course_name is specified
-    flt = None
+    `course_code` may list several comma-separated codes (matched with MatchAny).
+    """
     conditions = []
     
-    if course_code:
+    codes = split_course_codes(course_code)
+    if len(codes) == 1:
         conditions.append(
             qm.FieldCondition(
                 key="course_code",
-                match=qm.MatchValue(value=course_code.upper())
+                match=qm.MatchValue(value=codes[0])
+            )
+        )
+    elif codes:
+        conditions.append(
+            qm.FieldCondition(
+                key="course_code",
+                match=qm.MatchAny(any=codes)
             )
         )
     
@@ -53,63 +65,132 @@ def retrieve_courses(q: str, embed_dir: str, collection: str = "courses",
             )
         )
     
-    if conditions:
-        flt = qm.Filter(must=conditions)
-    
-    hits = cli.search(
-        collection_name=collection,
-        query_vector=qv,
-        query_filter=flt,
+    return qm.Filter(must=conditions) if conditions else None
+
+
+def mrl_query_vector(qv, mrl_dim: int) -> qm.NamedVector:
+    """First-pass query: the first `mrl_dim` dimensions, re-normalized (Matryoshka)"""
+    small = np.asarray(qv[:mrl_dim], dtype=np.float32)
+    small = small / (np.linalg.norm(small) or 1.0)
+    return qm.NamedVector(name=MRL_VECTOR, vector=small.tolist())
+
+
+def rescore_request(qv, candidates: List, limit: int) -> Dict[str, Any]:
+    """Second pass: the full vector scored against the first-pass candidates only"""
+    return dict(
+        query_vector=qm.NamedVector(name=FULL_VECTOR, vector=list(map(float, qv))),
+        query_filter=qm.Filter(must=[qm.HasIdCondition(has_id=[hit.id for hit in candidates])]),
         limit=limit,
         with_payload=True
     )
+
+
+def mrl_search(cli: QdrantClient, collection: str, qv, query_filter, limit: int,
+               mrl_dim: int, oversampling: float = 4.0, params: qm.SearchParams = None):
+    """Two-stage dense search on a collection built with upsert --mrl_dim
     
-    return hits
+    The ANN pass runs on the truncated vector for limit * oversampling
+    candidates; those are rescored with the full 1024-d vector.
+    """
+    candidates = cli.search(
+        collection_name=collection,
+        query_vector=mrl_query_vector(qv, mrl_dim),
+        query_filter=query_filter,
+        limit=int(math.ceil(limit * oversampling)),
+        with_payload=False,
+        search_params=params
+    )
+    if not candidates:
+        return []
+    return cli.search(collection_name=collection, **rescore_request(qv, candidates, limit))
 
-# ---------- Context building ----------
 
-def build_course_context(hits: List[Dict], max_context_length: int = 4000) -> str:
-    """Build context from course search results"""
+def retrieve_courses(q: str, embed_dir: str = None, collection: str = "courses",
+                     course_code: str = None, course_name: str = None,
+                     host="localhost", port=6333, limit=30,
+                     encoder: SentenceTransformer = None,
+                     client: QdrantClient = None,
+                     sparse_index=None, fusion_k: int = 60,
+                     timings: Dict[str, float] = None,
+                     oversampling: float = None, rescore: bool = True,
+                     mrl_dim: int = 0, mrl_oversampling: float = 4.0):
+    """Retrieve course information from Qdrant
     
-    context_parts = []
-    current_length = 0
+    Pass a preloaded `encoder` and `client` (as the API server does) to reuse
+    them across queries; otherwise they are created from `embed_dir`/`host`/`port`.
     
-    for hit in hits:
-        payload = hit.payload or {}
-        text = payload.get("text", "")
+    With a `sparse_index` (sparse_index.BM25Index) this is a hybrid search: the
+    dense and BM25 results are fused with reciprocal-rank fusion. Per-leg
+    latencies (ms) are written to `timings` if given.
+    
+    On a quantized collection (upsert_to_qdrant_from_files.py --quantization)
+    `oversampling` fetches limit * oversampling candidates by the quantized
+    vectors, and `rescore` reorders them by the original float32 vectors.
+    
+    With `mrl_dim` (collection built with upsert --mrl_dim) the dense leg is
+    two-stage, see mrl_search().
+    """
+    timings = timings if timings is not None else {}
+    
+    # Reuse the shared embedding model if given, otherwise load it
+    enc = encoder if encoder is not None else SentenceTransformer(embed_dir)
+    started = time.perf_counter()
+    qv = enc.encode([q], prompt_name="query", normalize_embeddings=True)[0].tolist()
+    timings["embed"] = (time.perf_counter() - started) * 1000
+    
+    # Reuse the shared Qdrant client if given, otherwise connect
+    cli = client if client is not None else QdrantClient(host=host, port=port)
+    
+    # Build filter if course_code or course_name is specified
+    flt = build_course_filter(course_code, course_name)
+    
+    started = time.perf_counter()
+    if mrl_dim:
+        hits = mrl_search(cli, collection, qv, flt, limit, mrl_dim, mrl_oversampling,
+                          search_params(oversampling, rescore))
+    else:
+        hits = cli.search(
+            collection_name=collection,
+            query_vector=qv,
+            query_filter=flt,
+            limit=limit,
+            with_payload=True,
+            search_params=search_params(oversampling, rescore)
+        )
+    timings["search"] = (time.perf_counter() - started) * 1000
+    
+    if sparse_index is not None:
+        from sparse_index import rrf_fuse
         
-        if current_length + len(text) < max_context_length:
-            # Add course information
-            course_code = payload.get("course_code", "")
-            course_name = payload.get("course_name", "")
-            chunk_label = payload.get("chunk_label", "")
-            source_url = payload.get("source_url", "")
-            
-            cite_parts = []
-            if course_code:
-                cite_parts.append(f"Course Code: {course_code}")
-            if course_name:
-                cite_parts.append(f"({course_name})")
-            if chunk_label:
-                cite_parts.append(f"- {chunk_label}")
-            
-            cite = " | ".join(cite_parts)
-            if source_url:
-                cite += f"\nSource: {source_url}"
-            
-            context_parts.append(f"[{cite}]\n{text}")
-            current_length += len(text)
-    
-    return "\n\n".join(context_parts)
+        started = time.perf_counter()
+        sparse_hits = sparse_index.search(q, limit=limit, course_code=course_code, course_name=course_name)
+        timings["sparse"] = (time.perf_counter() - started) * 1000
+        hits = rrf_fuse([hits, sparse_hits], k=fusion_k, limit=limit)
+    
+    return hits
+
+# ---------- Context building ----------
+
+def build_course_context(hits: List[Dict], max_context_length: int = 4000, max_chunks: int = 8) -> str:
+    """Build context from course search results
+    
+    `max_context_length` is in characters for backward compatibility; the
+    packing itself is done in tokens by context_packer.ContextPacker (headers
+    counted, overlapping lines removed, best chunk truncated rather than skipped).
+    """
+    packer = ContextPacker(budget_tokens=int(max_context_length / CHARS_PER_TOKEN), max_chunks=max_chunks)
+    context, _ = packer.pack(hits)
+    return context
 
 # ---------- Response generation ----------
 
-def answer_with_ollama(query: str, context: str,
-                       host="127.0.0.1", port=11434, 
-                       model="qwen2.5:7b", concise: bool = True) -> str:
-    """Generate answer using Ollama"""
+def build_ollama_messages(query: str, context: str, concise: bool = True,
+                          conversation: str = "") -> List[Dict[str, str]]:
+    """Build the system/user chat messages sent to Ollama
     
-    url = f"http://{host}:{port}/api/chat"
+    `conversation` (earlier turns, see session_store.SessionStore.conversation)
+    goes before the question so follow-ups like "what about part-time?" resolve.
+    """
     
     if concise:
         system_msg = "You are a helpful assistant for UTS course information. Answer questions about courses using only the provided context. Be brief and direct. Cite sources as [Course Code: XXX]. If the information is not in the context, say you don't know."
@@ -117,24 +198,47 @@ def answer_with_ollama(query: str, context: str,
     else:
         system_msg = "You are a helpful assistant for UTS course information. Answer questions about courses using only the provided context. Provide comprehensive answers. Cite sources as [Course Code: XXX]. If the information is not in the context, say you don't know."
         prompt = f"Question: {query}\n\nContext:\n{context}\n\nAnswer:"
+    if conversation:
+        prompt = f"Conversation so far:\n{conversation}\n\n{prompt}"
+    
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def answer_with_ollama(query: str, context: str,
+                       host="127.0.0.1", port=11434, 
+                       model="qwen2.5:7b", concise: bool = True,
+                       session: requests.Session = None,
+                       keep_alive: str = DEFAULT_KEEP_ALIVE, options: Dict[str, Any] = None) -> str:
+    """Generate answer using Ollama
+    
+    Calls reuse one HTTP connection (`session`, default ollama_client.shared_session())
+    and ask Ollama to keep the model loaded for `keep_alive` afterwards.
+    """
+    
+    url = f"http://{host}:{port}/api/chat"
     
     payload = {
         "model": model,
         "stream": False,
-        "messages": [
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": prompt}
-        ]
+        "messages": build_ollama_messages(query, context, concise),
+        "keep_alive": keep_alive
     }
+    if options:
+        payload["options"] = options
     
     try:
-        r = requests.post(url, json=payload, timeout=180)
+        http = session if session is not None else shared_session()
+        r = http.post(url, json=payload, timeout=180)
         r.raise_for_status()
         data = r.json()
         return data["message"]["content"]
     except Exception as e:
         return f"Error generating response: {e}"
 
+
 # ---------- Main query function ----------
 
 def query_courses(query: str, embed_dir: str, collection: str = "courses",
@@ -142,7 +246,10 @@ def query_courses(query: str, embed_dir: str, collection: str = "courses",
                  k: int = 30, topn: int = 8, generate: bool = True, 
                  concise: bool = True, host="localhost", port=6333,
                  ollama_host="127.0.0.1", ollama_port=11434, 
-                 ollama_model="qwen2.5:7b"):
+                 ollama_model="qwen2.5:7b", encoder=None, qdrant_client=None,
+                 ollama_session=None, sparse_index=None,
+                 oversampling: float = None, rescore: bool = True,
+                 mrl_dim: int = 0, mrl_oversampling: float = 4.0):
     """Main course RAG query function"""
     
     print(f"Query: {query}")
@@ -152,12 +259,18 @@ def query_courses(query: str, embed_dir: str, collection: str = "courses",
         print(f"Filtering by course name: {course_name}")
     
     # Retrieve documents
+    timings = {}
     hits = retrieve_courses(
         query, embed_dir, collection,
         course_code=course_code,
         course_name=course_name,
-        host=host, port=port, limit=k
+        host=host, port=port, limit=k,
+        encoder=encoder, client=qdrant_client,
+        sparse_index=sparse_index, timings=timings,
+        oversampling=oversampling, rescore=rescore,
+        mrl_dim=mrl_dim, mrl_oversampling=mrl_oversampling
     )
+    print("Retrieval (ms): " + ", ".join(f"{leg}={ms:.1f}" for leg, ms in timings.items()))
     
     if not hits:
         return "No relevant course information found."
@@ -180,14 +293,15 @@ def query_courses(query: str, embed_dir: str, collection: str = "courses",
     
     # Build context and generate response
     print(f"\n=== Generated Response ===")
-    context = build_course_context(hits, max_context_length=4000)
+    context = build_course_context(hits, max_context_length=4000, max_chunks=topn)
     response = answer_with_ollama(
         query, 
         context,
         host=ollama_host,
         port=ollama_port,
         model=ollama_model,
-        concise=concise
+        concise=concise,
+        session=ollama_session
     )
     
     return response
@@ -212,12 +326,42 @@ def main():
     parser.add_argument('--ollama_host', default='127.0.0.1')
     parser.add_argument('--ollama_port', type=int, default=11434)
     parser.add_argument('--ollama_model', default='qwen2.5:7b')
+    parser.add_argument('--kb_dir', default=str(DEFAULT_KB_DIR),
+                       help='KB directory with sparse_index.npz (hybrid search)')
+    parser.add_argument('--dense_only', action='store_true', help='Skip the BM25 leg')
+    parser.add_argument('--backend', default='qdrant', choices=['qdrant', 'local'],
+                       help='Dense search in Qdrant, or in-process over kb_dir/embeddings.npy')
+    parser.add_argument('--oversampling', type=float, default=None,
+                       help='Quantized collections: candidates = k * oversampling (e.g. 2.0)')
+    parser.add_argument('--no_rescore', action='store_true',
+                       help='Quantized collections: keep the quantized scores (no float32 rescoring)')
+    parser.add_argument('--quantization', default='none', choices=['none', 'int8', 'binary'],
+                       help='Quantize the vectors of --backend local (like the Qdrant option)')
+    parser.add_argument('--mrl_dim', type=int, default=0, choices=[0, 128, 256],
+                       help='Two-stage search: first pass on the truncated Matryoshka vector')
+    parser.add_argument('--mrl_oversampling', type=float, default=4.0,
+                       help='First-pass candidates = k * mrl_oversampling, rescored with the full vector')
     
     args = parser.parse_args()
     
     # Determine concise mode
     concise = args.concise and not args.comprehensive
     
+    sparse_index = None
+    if not args.dense_only:
+        from sparse_index import BM25Index, INDEX_FILE
+        if (Path(args.kb_dir) / INDEX_FILE).exists():
+            sparse_index = BM25Index.load(args.kb_dir)
+        else:
+            print(f"ℹ️  No {INDEX_FILE} in {args.kb_dir}, using dense search only")
+    
+    qdrant_client = None
+    if args.backend == 'local':
+        from local_search import LocalVectorIndex, LocalSearchClient
+        index = LocalVectorIndex(args.kb_dir, payloads=sparse_index.payloads if sparse_index else None,
+                                 quantization=args.quantization, mrl_dim=args.mrl_dim)
+        qdrant_client = LocalSearchClient(index, args.collection)
+    
     try:
         response = query_courses(
             query=args.q,
@@ -233,7 +377,13 @@ def main():
             port=args.qdrant_port,
             ollama_host=args.ollama_host,
             ollama_port=args.ollama_port,
-            ollama_model=args.ollama_model
+            ollama_model=args.ollama_model,
+            qdrant_client=qdrant_client,
+            sparse_index=sparse_index,
+            oversampling=args.oversampling,
+            rescore=not args.no_rescore,
+            mrl_dim=args.mrl_dim,
+            mrl_oversampling=args.mrl_oversampling
         )
         print(response)
     except Exception as e:
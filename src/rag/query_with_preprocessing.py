@@ -9,6 +9,7 @@ from pathlib import Path
 from typing import List, Dict
 from filtered_retrieval import query_with_filtering, check_result_quality
 from query_hybrid_rag import build_course_context, answer_with_ollama
+from fact_answers import FactAnswerer
 
 # Get project root directory
 SCRIPT_DIR = Path(__file__).parent.resolve()
@@ -29,16 +30,33 @@ def query_with_full_pipeline(
     host="localhost",
     port=6333,
     ollama_host="127.0.0.1",
-    ollama_port=11434
+    ollama_port=11434,
+    encoder=None,
+    qdrant_client=None,
+    ollama_session=None,
+    facts: FactAnswerer = None
 ):
     """
     Complete RAG pipeline for course information retrieval and generation.
+    
+    `encoder`, `qdrant_client` and `ollama_session` are optional shared handles
+    (see api_server.RagResources); when omitted they are created per call.
+    With `facts`, field lookups (credit points, CRICOS code, ...) are answered
+    from the course JSON before any retrieval.
     """
     
     print("=" * 70)
     print("UTS HANDBOOK RAG PIPELINE")
     print("=" * 70)
     
+    # Step 0: Fact fast path
+    if facts is not None:
+        fact = facts.answer(query, course_code)
+        if fact is not None:
+            print(f"\n⚡ Answered from course data: {fact}")
+            print(fact.text)
+            return fact.text
+    
     # Step 1: Retrieve with filtering
     print(f"\n[1/3] Retrieving course documents...")
     
@@ -51,7 +69,9 @@ def query_with_full_pipeline(
         show_details=False,  # We'll show details ourselves
         topn=topn,
         host=host,
-        port=port
+        port=port,
+        encoder=encoder,
+        qdrant_client=qdrant_client
     )
     
     # Step 2: Quality checks
@@ -83,7 +103,7 @@ def query_with_full_pipeline(
     # Step 3: Generate response (if requested)
     if generate:
         print(f"\n[4/4] Generating response...")
-        context = build_course_context(hits, max_context_length=4000)
+        context = build_course_context(hits, max_context_length=4000, max_chunks=topn)
         
         response = answer_with_ollama(
             query=query,
@@ -91,7 +111,8 @@ def query_with_full_pipeline(
             host=ollama_host,
             port=ollama_port,
             model=model,
-            concise=concise
+            concise=concise,
+            session=ollama_session
         )
         
         print(f"\n{'='*70}")
@@ -123,12 +144,21 @@ def main():
     parser.add_argument('--qdrant_port', type=int, default=6333)
     parser.add_argument('--ollama_host', default='127.0.0.1')
     parser.add_argument('--ollama_port', type=int, default=11434)
+    parser.add_argument('--no_fast_path', action='store_true',
+                       help='Always retrieve and generate, even for field lookups like credit points')
     
     args = parser.parse_args()
     
     # Determine concise mode
     concise = args.concise and not args.comprehensive
     
+    facts = None
+    if not args.no_fast_path:
+        from course_aliases import CourseAliasIndex
+        from course_catalog import CourseCatalog
+        records = CourseCatalog().load().records
+        facts = FactAnswerer().build(records, CourseAliasIndex().build(records))
+    
     try:
         response = query_with_full_pipeline(
             query=args.q,
@@ -143,7 +173,8 @@ def main():
             host=args.qdrant_host,
             port=args.qdrant_port,
             ollama_host=args.ollama_host,
-            ollama_port=args.ollama_port
+            ollama_port=args.ollama_port,
+            facts=facts
         )
         
     except Exception as e:
@@ -6,7 +6,8 @@ Save KB files:
 - embeds texts with SentenceTransformers (e.g., Qwen3-Embedding)
 - writes row-aligned:
     embeddings.npy   (float32, normalized)
-    payloads.jsonl   (cleaned rows in same order)
+    embeddings.<d>d.npy  (first d dims re-normalized, Matryoshka first-pass vectors; --mrl_dims)
+    payloads.jsonl   (cleaned rows in same order, meta.n_tokens = token count of the text)
 - writes manifest.json (stats) for convenience
 """
 
@@ -97,6 +98,10 @@ from tqdm import tqdm
 from sentence_transformers import SentenceTransformer
 from datetime import datetime
 
+from sparse_index import BM25Index
+from context_packer import count_chunk_tokens
+from local_search import mrl_file, truncate_embeddings
+
 JUNK_INTENT_BLANK = re.compile(r'^\s*this page has been left intentionally blank\.?\s*$', re.I)
 JUNK_PAGE_FOOTER  = re.compile(r'^\s*page\s*\w*\s*\d+\s*(of|/)\s*\w*\s*\d+\s*$', re.I)
 
@@ -133,6 +138,8 @@ def main():
     ap.add_argument("--out_dir", required=True, help="Folder to write embeddings.npy + payloads.jsonl")
     ap.add_argument("--batch", type=int, default=32)
     ap.add_argument("--device", default=None, help="cuda|cpu (auto if omitted)")
+    ap.add_argument("--mrl_dims", default="128,256",
+                    help="Truncated Matryoshka sizes to also write (comma-separated, empty = none)")
     args = ap.parse_args()
 
     os.makedirs(args.out_dir, exist_ok=True)
@@ -179,30 +186,48 @@ def main():
     # enforce float32 (good for FAISS/Qdrant)
     vecs = vecs.astype("float32", copy=False)
 
+    # token counts for the context packer's budget (Qwen tokenizer, same vocab as the chat model)
+    for r, n in zip(rows, count_chunk_tokens(texts, getattr(model, "tokenizer", None))):
+        r["meta"]["n_tokens"] = n
+
     # 4) write outputs (row-aligned)
     emb_path = os.path.join(args.out_dir, "embeddings.npy")
     pay_path = os.path.join(args.out_dir, "payloads.jsonl")
     man_path = os.path.join(args.out_dir, "manifest.json")
 
     np.save(emb_path, vecs)
+    mrl_paths = []
+    for dim in sorted({int(d) for d in args.mrl_dims.split(",") if d.strip()}):
+        if dim >= vecs.shape[1]:
+            continue
+        mrl_paths.append(os.path.join(args.out_dir, mrl_file(dim)))
+        np.save(mrl_paths[-1], truncate_embeddings(vecs, dim))
     with open(pay_path, "w", encoding="utf-8") as w:
         for r in rows:
             w.write(json.dumps(r, ensure_ascii=False) + "\n")
 
+    # BM25 keyword index over the same rows (hybrid retrieval, see sparse_index.py)
+    sparse_path = BM25Index.build(texts).save(args.out_dir)
+
     # 5) manifest (handy for audits)
     manifest = {
         "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
         "n_points": int(vecs.shape[0]),
         "dim": int(vecs.shape[1]),
         "embed_model": args.embed_model_dir,
-        "source_jsonl": os.path.abspath(args.jsonl)
+        "source_jsonl": os.path.abspath(args.jsonl),
+        "sparse_index": os.path.basename(sparse_path),
+        "mrl_files": [os.path.basename(p) for p in mrl_paths]
     }
     with open(man_path, "w", encoding="utf-8") as mf:
         json.dump(manifest, mf, indent=2)
 
     print("Saved:")
     print(" -", emb_path)
+    for p in mrl_paths:
+        print(" -", p)
     print(" -", pay_path)
+    print(" -", sparse_path)
     print(" -", man_path)
 
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Server-side conversation sessions for the chat endpoints
+Clients used to resend the whole history with every message; the server only
+regex-scanned it for a course code. A Session keeps what follow-up questions
+need, keyed by a random session id the server hands out:
+- the resolved course (code / name), so "what about part-time?" stays filtered
+- the last retrieval: hit ids, scores and which of them went into the context
+- the last `max_recent` turns verbatim (clipped to `turn_tokens` each) and a
+  rolling summary of older turns, one line per turn, oldest lines dropped once
+  it exceeds `summary_tokens` - so the conversation block of the prompt stays
+  bounded however long the conversation gets
+
+Storage is pluggable (make_backend): "memory" (LRU + TTL, per process),
+"sqlite:<path>" (shared by all workers on one host) or "package.module:Class"
+for a SessionBackend subclass; one missing a method fails at startup, when
+make_backend() instantiates it.
+"""
+import importlib
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from context_packer import estimate_tokens
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def clip_tokens(text: str, max_tokens: int, count_tokens: Callable[[str], int] = estimate_tokens) -> str:
+    """`text` cut to about `max_tokens` at a word boundary"""
+    text = " ".join((text or "").split())
+    if count_tokens(text) <= max_tokens:
+        return text
+    cut = text[:int(len(text) * max_tokens / max(count_tokens(text), 1))]
+    if " " in cut:
+        cut = cut[:cut.rfind(" ")]
+    return cut.rstrip(" ,;:") + " ..."
+
+
+def first_sentence(text: str) -> str:
+    return _SENTENCE_END.split(" ".join((text or "").split()), 1)[0]
+
+
+# ---------- Session ----------
+
+class Session:
+    """One conversation: resolved course, last retrieval, recent turns and a rolling summary"""
+    
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.course_code: Optional[str] = None
+        self.course_name: Optional[str] = None
+        self.summary: List[str] = []             # one line per folded turn, oldest first
+        self.turns: List[Dict[str, str]] = []    # recent {"user", "assistant"}
+        self.n_turns = 0
+        self.last_retrieval: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "course_code": self.course_code, "course_name": self.course_name,
+            "summary": list(self.summary), "turns": [dict(t) for t in self.turns], "n_turns": self.n_turns,
+            "last_retrieval": self.last_retrieval,
+            "created_at": self.created_at, "updated_at": self.updated_at,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Session":
+        session = cls(data["id"])
+        for key, value in data.items():
+            if key != "id":
+                setattr(session, key, value)
+        return session
+
+
+# ---------- Backends ----------
+
+class SessionBackend(ABC):
+    """Storage interface: serialized sessions by id, expiring `ttl` seconds after the last put"""
+    
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The stored dict, or None if unknown or expired"""
+    
+    @abstractmethod
+    def put(self, session_id: str, data: Dict[str, Any], ttl: float):
+        """Store (or replace) a session"""
+    
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """Remove a session; True if it existed"""
+    
+    def __len__(self) -> int:
+        """Live sessions (only reported in the stats; 0 if the backend can't count)"""
+        return 0
+
+
+class MemorySessionBackend(SessionBackend):
+    """In-process LRU with TTL (sessions are lost on restart and not shared between workers)"""
+    
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (expires, data)
+    
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if time.monotonic() > entry[0]:
+            del self._entries[session_id]
+            return None
+        self._entries.move_to_end(session_id)
+        return entry[1]
+    
+    def put(self, session_id: str, data: Dict[str, Any], ttl: float):
+        self._entries[session_id] = (time.monotonic() + ttl, data)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+    
+    def delete(self, session_id: str) -> bool:
+        return self._entries.pop(session_id, None) is not None
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteSessionBackend(SessionBackend):
+    """SQLite file, shared by every worker process on the host (rows are small JSON documents)"""
+    
+    def __init__(self, path: str, purge_interval: float = 60.0):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT, expires REAL)")
+        self._db.commit()
+    
+    def _purge(self, now: float):
+        if now - self._last_purge >= self.purge_interval:
+            self._last_purge = now
+            self._db.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+    
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT data, expires FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+    
+    def put(self, session_id: str, data: Dict[str, Any], ttl: float):
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._db.execute("INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)",
+                             (session_id, json.dumps(data, ensure_ascii=False), now + ttl))
+            self._db.commit()
+    
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+            self._db.commit()
+        return deleted > 0
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions WHERE expires >= ?", (time.time(),)).fetchone()[0]
+
+
+def make_backend(spec: str = "memory", max_sessions: int = 10000) -> SessionBackend:
+    """'memory', 'sqlite:/var/lib/handbook/sessions.db' or 'package.module:ClassName' (no arguments)"""
+    spec = (spec or "memory").strip()
+    if spec == "memory":
+        return MemorySessionBackend(max_sessions)
+    if spec.startswith("sqlite:"):
+        path = spec[len("sqlite:"):]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return SqliteSessionBackend(path)
+    module, _, name = spec.partition(":")
+    if not name:
+        raise ValueError(f"Unknown session backend '{spec}' (memory, sqlite:<path> or module:Class)")
+    backend = getattr(importlib.import_module(module), name)()  # TypeError if an abstract method is missing
+    if not isinstance(backend, SessionBackend):
+        raise TypeError(f"Session backend '{spec}' is not a SessionBackend")
+    return backend
+
+
+# ---------- Store ----------
+
+class SessionStore:
+    """Creates, loads and updates Sessions on a SessionBackend"""
+    
+    def __init__(self, backend: SessionBackend = None, ttl_seconds: float = 3600,
+                 max_recent: int = 2, turn_tokens: int = 80, summary_tokens: int = 150,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        self.backend = backend if backend is not None else MemorySessionBackend()
+        self.ttl = ttl_seconds
+        self.max_recent = max_recent
+        self.turn_tokens = turn_tokens
+        self.summary_tokens = summary_tokens
+        self.count_tokens = count_tokens
+        self.stats = {"created": 0, "resumed": 0, "unknown": 0, "turns": 0, "summarized": 0, "deleted": 0}
+    
+    def get(self, session_id: Optional[str]) -> Optional[Session]:
+        if not session_id or not _SESSION_ID.match(session_id):
+            return None
+        data = self.backend.get(session_id)
+        return Session.from_dict(data) if data is not None else None
+    
+    def open(self, session_id: Optional[str] = None) -> Session:
+        """The session `session_id`, or a new one if it is missing, unknown or expired"""
+        session = self.get(session_id)
+        if session is not None:
+            self.stats["resumed"] += 1
+            return session
+        if session_id:
+            self.stats["unknown"] += 1
+        self.stats["created"] += 1
+        return Session(secrets.token_urlsafe(18))
+    
+    def save(self, session: Session):
+        session.updated_at = time.time()
+        self.backend.put(session.id, session.to_dict(), self.ttl)
+    
+    def delete(self, session_id: str) -> bool:
+        deleted = bool(session_id) and self.backend.delete(session_id)
+        if deleted:
+            self.stats["deleted"] += 1
+        return deleted
+    
+    # ---------- Conversation ----------
+    
+    def add_turn(self, session: Session, question: str, answer: str):
+        """Append a turn; turns beyond max_recent are folded into the summary"""
+        session.turns.append({
+            "user": clip_tokens(question, self.turn_tokens, self.count_tokens),
+            "assistant": clip_tokens(answer, self.turn_tokens, self.count_tokens),
+        })
+        session.n_turns += 1
+        self.stats["turns"] += 1
+        while len(session.turns) > self.max_recent:
+            old = session.turns.pop(0)
+            line = f"- Asked: {clip_tokens(old['user'], 40, self.count_tokens)} " \
+                   f"Answer: {clip_tokens(first_sentence(old['assistant']), 40, self.count_tokens)}"
+            session.summary.append(line)
+            self.stats["summarized"] += 1
+        while len(session.summary) > 1 and self.count_tokens("\n".join(session.summary)) > self.summary_tokens:
+            session.summary.pop(0)
+    
+    def conversation(self, session: Optional[Session]) -> str:
+        """Prompt block for earlier turns ("" for a new session)"""
+        if session is None or not (session.summary or session.turns):
+            return ""
+        parts = []
+        if session.summary:
+            parts.append("Earlier in this conversation:\n" + "\n".join(session.summary))
+        for turn in session.turns:
+            parts.append(f"User: {turn['user']}\nAssistant: {turn['assistant']}")
+        return "\n\n".join(parts)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats, active=len(self.backend))
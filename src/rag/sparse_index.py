@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Sparse (BM25) keyword index for hybrid retrieval
+Dense embeddings are good at paraphrases but routinely miss exact tokens such as
+CRICOS codes ("012345G"), UAC codes or subject numbers. save_kb_files.py builds
+this inverted index next to embeddings.npy (same row order, so row index ==
+Qdrant point id) and retrieval fuses both result lists with reciprocal-rank
+fusion (rrf_fuse).
+
+Files written to the KB directory:
+    sparse_index.npz   vocab, postings (CSR: indptr / doc ids / BM25 weights)
+
+Usage:
+    python sparse_index.py --kb_dir data/processed/courses            # (re)build
+    python sparse_index.py --kb_dir data/processed/courses --q "CRICOS 012345G"
+"""
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from qdrant_client.http import models as qm
+
+from kb_version import ManifestWatcher
+
+# Get project root directory
+SCRIPT_DIR = Path(__file__).parent.resolve()
+HANDBOOK_ROOT = Path(os.environ.get('HANDBOOK_ROOT', SCRIPT_DIR.parent.parent))
+DEFAULT_KB_DIR = HANDBOOK_ROOT / "data" / "processed" / "courses"
+INDEX_FILE = "sparse_index.npz"
+
+# Codes like C10302 / 012345G / 31251 survive as single lowercase tokens
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or "
+    "the their there this to what when where which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric tokens without stopwords"""
+    return [t for t in _TOKEN.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+# ---------- Index ----------
+
+class BM25Index:
+    """
+    In-memory inverted index with precomputed BM25 weights per (term, doc), so
+    a query is just a sum of posting weights. Rows line up with payloads.jsonl.
+    """
+    
+    def __init__(self, vocab: List[str], indptr: np.ndarray, doc_ids: np.ndarray,
+                 weights: np.ndarray, n_docs: int):
+        self.vocab = vocab
+        self.term_ids = {t: i for i, t in enumerate(vocab)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = n_docs
+        
+        # Set by attach_payloads(): needed to return hits and apply course filters
+        self.payloads: List[Dict] = []
+        self._codes: Optional[np.ndarray] = None
+        self._name_tokens: List[set] = []
+        self._mask_cache: Dict[Tuple, np.ndarray] = {}
+        
+        self.kb_dir: Optional[Path] = None
+        self.kb_version: Optional[ManifestWatcher] = None
+    
+    @classmethod
+    def build(cls, texts: List[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Index `texts` (row i = document i)"""
+        doc_tfs = [Counter(tokenize(t)) for t in texts]
+        doc_len = np.array([sum(tf.values()) for tf in doc_tfs], dtype=np.float32)
+        avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+        
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc, tf in enumerate(doc_tfs):
+            for term, count in tf.items():
+                postings.setdefault(term, []).append((doc, count))
+        
+        n_docs = len(texts)
+        vocab = sorted(postings)
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        doc_ids, weights = [], []
+        for i, term in enumerate(vocab):
+            plist = postings[term]
+            idf = np.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            docs = np.array([d for d, _ in plist], dtype=np.int32)
+            tf = np.array([c for _, c in plist], dtype=np.float32)
+            norm = k1 * (1 - b + b * doc_len[docs] / (avgdl or 1.0))
+            doc_ids.append(docs)
+            weights.append((idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+            indptr[i + 1] = indptr[i] + len(plist)
+        
+        return cls(
+            vocab, indptr,
+            np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype=np.int32),
+            np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+            n_docs
+        )
+    
+    def save(self, kb_dir: str) -> Path:
+        path = Path(kb_dir) / INDEX_FILE
+        np.savez(path, vocab=np.array(self.vocab), indptr=self.indptr,
+                 doc_ids=self.doc_ids, weights=self.weights, n_docs=np.array(self.n_docs))
+        return path
+    
+    @classmethod
+    def load(cls, kb_dir: str, check_interval: float = 10.0) -> "BM25Index":
+        """Load the index and payloads from a KB directory (save_kb_files.py output)"""
+        kb_dir = Path(kb_dir)
+        with np.load(kb_dir / INDEX_FILE) as data:
+            index = cls(data["vocab"].tolist(), data["indptr"], data["doc_ids"],
+                        data["weights"], int(data["n_docs"]))
+        index.attach_payloads(load_payloads(kb_dir / "payloads.jsonl"))
+        index.kb_dir = kb_dir
+        index.kb_version = ManifestWatcher(str(kb_dir / "manifest.json"), check_interval)
+        return index
+    
+    def refresh_if_changed(self) -> "BM25Index":
+        """Reloaded copy if the knowledge base was rebuilt since loading (else self)"""
+        if self.kb_version is not None and self.kb_version.changed():
+            print(f"🔄 Knowledge base version changed ({self.kb_version.version}), reloading sparse index")
+            fresh = BM25Index.load(str(self.kb_dir), self.kb_version.check_interval)
+            fresh.kb_version = self.kb_version
+            return fresh
+        return self
+    
+    def attach_payloads(self, payloads: List[Dict]):
+        if len(payloads) != self.n_docs:
+            raise ValueError(f"payloads.jsonl has {len(payloads)} rows, sparse index has {self.n_docs}")
+        self.payloads = payloads
+        self._codes = np.array([(p.get("course_code") or "").upper() for p in payloads])
+        self._name_tokens = [set(tokenize(p.get("course_name") or "")) for p in payloads]
+        self._mask_cache = {}
+    
+    # ---------- Search ----------
+    
+    def _filter_mask(self, course_code: str = None, course_name: str = None) -> Optional[np.ndarray]:
+        """Same restriction as query_hybrid_rag.build_course_filter(), on local payloads
+        (`course_code` may list several comma-separated codes)"""
+        if not course_code and not course_name:
+            return None
+        key = (course_code, course_name)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = np.ones(self.n_docs, dtype=bool)
+            codes = [c.strip().upper() for c in course_code.split(",") if c.strip()] if course_code else []
+            if codes:
+                mask &= np.isin(self._codes, codes)
+            if course_name:
+                # Like Qdrant's MatchText: every query token appears in the name
+                wanted = set(tokenize(course_name))
+                mask &= np.array([wanted <= names for names in self._name_tokens], dtype=bool)
+            if len(self._mask_cache) >= 1024:
+                self._mask_cache.clear()
+            self._mask_cache[key] = mask
+        return mask
+    
+    def search(self, query: str, limit: int = 30, course_code: str = None,
+               course_name: str = None) -> List[qm.ScoredPoint]:
+        """BM25 top `limit` rows as ScoredPoints (id = row index, payload attached)"""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self.term_ids.get(term)
+            if i is not None:
+                lo, hi = self.indptr[i], self.indptr[i + 1]
+                scores[self.doc_ids[lo:hi]] += self.weights[lo:hi]
+        
+        mask = self._filter_mask(course_code, course_name)
+        if mask is not None:
+            scores[~mask] = 0.0
+        
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [
+            qm.ScoredPoint(id=int(row), version=0, score=float(scores[row]),
+                           payload=self.payloads[row] if self.payloads else None)
+            for row in candidates
+        ]
+
+
+def load_payloads(path) -> List[Dict]:
+    """payloads.jsonl rows in the same shape upsert_to_qdrant_from_files.py stores"""
+    payloads = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            r = json.loads(line)
+            payloads.append(r.get("meta", {}) | {"text": r.get("text", ""), "row_id": r.get("id")})
+    return payloads
+
+
+# ---------- Fusion ----------
+
+def rrf_fuse(legs: List[List[qm.ScoredPoint]], k: int = 60, limit: int = 30) -> List[qm.ScoredPoint]:
+    """
+    Reciprocal-rank fusion of several ranked hit lists (same point ids).
+    Scores are rescaled so a point ranked first by every leg scores 1.0, which
+    keeps check_result_quality()'s thresholds meaningful. Failed (None) and
+    empty legs don't count, so a query with no BM25 matches keeps its dense
+    scale. Payloads come from the first leg that returned the point.
+    """
+    legs = [leg for leg in legs if leg]
+    if not legs:
+        return []
+    scale = (k + 1) / len(legs)
+    fused: Dict = {}
+    for leg in legs:
+        for rank, hit in enumerate(leg, 1):
+            entry = fused.get(hit.id)
+            if entry is None:
+                fused[hit.id] = entry = [0.0, hit]
+            entry[0] += 1.0 / (k + rank)
+    
+    ranked = sorted(fused.values(), key=lambda e: e[0], reverse=True)[:limit]
+    return [qm.ScoredPoint(id=hit.id, version=hit.version, score=score * scale, payload=hit.payload)
+            for score, hit in ranked]
+
+
+# ---------- CLI ----------
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the BM25 sparse index of a KB directory')
+    parser.add_argument('--kb_dir', default=str(DEFAULT_KB_DIR), help='Folder with payloads.jsonl (+ embeddings.npy)')
+    parser.add_argument('--q', default=None, help='Query the existing index instead of building it')
+    parser.add_argument('--course_code', default=None, help='Filter by course code')
+    parser.add_argument('--k', type=int, default=10, help='Number of results to show')
+    args = parser.parse_args()
+    
+    if args.q is None:
+        payloads = load_payloads(Path(args.kb_dir) / "payloads.jsonl")
+        started = time.perf_counter()
+        index = BM25Index.build([p.get("text", "") for p in payloads])
+        path = index.save(args.kb_dir)
+        print(f"✅ Indexed {index.n_docs} chunks, {len(index.vocab)} terms in "
+              f"{time.perf_counter() - started:.1f}s → {path}")
+        return 0
+    
+    index = BM25Index.load(args.kb_dir)
+    started = time.perf_counter()
+    hits = index.search(args.q, limit=args.k, course_code=args.course_code)
+    print(f"{len(hits)} hits in {(time.perf_counter() - started) * 1000:.2f} ms")
+    for i, hit in enumerate(hits, 1):
+        print(f"{i}. {hit.score:.3f}  {hit.payload.get('course_code')}  {hit.payload.get('chunk_label')}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
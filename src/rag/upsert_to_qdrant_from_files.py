@@ -49,9 +49,15 @@
 
 #!/usr/bin/env python3
 import argparse, json, numpy as np
+from pathlib import Path
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qm
 
+from collection_schema import (
+    FULL_VECTOR, MRL_DIMS, MRL_VECTOR, QUANTIZATIONS, create_collection, migrate
+)
+from local_search import mrl_file, truncate_embeddings
+
 def load_payloads(path):
     ids, payloads = [], []
     with open(path, "r", encoding="utf-8") as f:
@@ -86,7 +92,12 @@ if __name__ == "__main__":
     ap.add_argument("--port", type=int, default=6333)
     ap.add_argument("--batch", type=int, default=64)
     ap.add_argument("--no_recreate", action="store_true",
-                    help="Do not drop collection; create if missing, then upsert/overwrite by ID.")
+                    help="Do not drop collection; create if missing (else migrate its schema), then upsert/overwrite by ID.")
+    ap.add_argument("--quantization", default="none", choices=QUANTIZATIONS,
+                    help="Vector quantization of a new collection: int8 (4x less RAM) or binary (32x).")
+    ap.add_argument("--mrl_dim", type=int, default=0, choices=(0,) + MRL_DIMS,
+                    help="Add a truncated Matryoshka vector for the first search pass "
+                         "(embeddings.<dim>d.npy next to --emb, else truncated here).")
     ap.add_argument("--skip_version_check", action="store_true",
                     help="Skip qdrant-client/server compatibility check (useful if client > server).")
     args = ap.parse_args()
@@ -99,6 +110,12 @@ if __name__ == "__main__":
         raise SystemExit(f"Emb rows {vecs.shape[0]} != payload rows {len(ids)}")
     vecs = vecs.astype("float32", copy=False)  # ensure JSON-serializable + consistent
     dim = int(vecs.shape[1])
+    mrl_vecs = None
+    if args.mrl_dim:
+        mrl_path = Path(args.emb).parent / mrl_file(args.mrl_dim)
+        mrl_vecs = np.load(mrl_path) if mrl_path.exists() else truncate_embeddings(vecs, args.mrl_dim)
+        if mrl_vecs.shape != (len(ids), args.mrl_dim):
+            raise SystemExit(f"{mrl_path.name} has shape {mrl_vecs.shape}, expected {(len(ids), args.mrl_dim)}")
 
     # --- client ---
     client_kwargs = dict(host=args.host, port=args.port)
@@ -106,20 +123,16 @@ if __name__ == "__main__":
         client_kwargs["check_compatibility"] = False  # qdrant-client >= 1.11
     cli = QdrantClient(**client_kwargs)
 
-    # --- create / recreate collection (COSINE for normalized embeddings) ---
+    # --- create / recreate collection (settings + payload indexes from collection_schema.py) ---
     if args.no_recreate:
         if not cli.collection_exists(args.collection):
-            cli.create_collection(
-                collection_name=args.collection,
-                vectors_config=qm.VectorParams(size=dim, distance=qm.Distance.COSINE),
-                hnsw_config=qm.HnswConfigDiff(m=32, ef_construct=256),
-            )
+            create_collection(cli, args.collection, dim, quantization=args.quantization, mrl_dim=args.mrl_dim)
+        else:
+            for action in migrate(cli, args.collection):
+                print(f"🔧 {action}")
     else:
-        cli.recreate_collection(
-            collection_name=args.collection,
-            vectors_config=qm.VectorParams(size=dim, distance=qm.Distance.COSINE),
-            hnsw_config=qm.HnswConfigDiff(m=32, ef_construct=256),
-        )
+        create_collection(cli, args.collection, dim, recreate=True, quantization=args.quantization,
+                          mrl_dim=args.mrl_dim)
 
     # --- upsert in batches ---
     B = args.batch
@@ -128,12 +141,16 @@ if __name__ == "__main__":
             collection_name=args.collection,
             points=qm.Batch(
                 ids=ids[i:i+B],                     # UUID strings
-                vectors=vecs[i:i+B].tolist(),
+                vectors=vecs[i:i+B].tolist() if mrl_vecs is None else {
+                    FULL_VECTOR: vecs[i:i+B].tolist(),
+                    MRL_VECTOR: mrl_vecs[i:i+B].astype("float32").tolist(),
+                },
                 payloads=payloads[i:i+B],
             )
         )
 
-    print(f"Upserted {len(ids)} points → '{args.collection}' (dim={dim}).")
+    print(f"Upserted {len(ids)} points → '{args.collection}' (dim={dim}"
+          + (f", {MRL_VECTOR}={args.mrl_dim}" if args.mrl_dim else "") + ").")
 
 
 
@@ -0,0 +1,96 @@
+"""Fact fast path (src/rag/fact_answers.py): answers field lookups, declines everything else"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "rag"))
+
+from fact_answers import FactAnswerer  # noqa: E402
+
+RECORDS = {
+    "C10235": [{"filename": "C10235.json", "name": "Bachelor of Accounting", "data": {
+        "credit_points": "150", "duration_fulltime": "3 Year(s)", "duration_parttime": "6 Year(s)",
+        "duration_sessions": "6", "cricos_code": "012345G", "uac_codes": ["601010 (Autumn)"],
+        "location": ["City campus"], "course_fee": "None", "course_intake": "Feb/Jul",
+        "metadata": {"source_url": "https://coursehandbook.uts.edu.au/course/2025/C10235"},
+    }}],
+    "C10026": [{"filename": "C10026.json", "name": "Bachelor of Business", "data": {
+        "credit_points": "144", "duration_fulltime": "3 Year(s)", "duration_parttime": "0 Year(s)",
+        "cricos_code": "None", "uac_codes": [], "location": ["City campus"], "course_fee": "23,220",
+        "course_intake": "Feb/Jul", "metadata": {},
+    }}],
+}
+
+
+@pytest.fixture
+def answerer():
+    return FactAnswerer().build(RECORDS)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("How many credit points is C10235?", "It is 150 credit points."),
+    ("How long is the course C10235?", "The course takes 3 years full-time and 6 years part-time"),
+    ("How long does C10235 take part-time?", "The course takes 6 years part-time."),
+    ("What is the CRICOS code of C10235?", "The CRICOS code is 012345G."),
+    ("What are the UAC codes for C10235?", "The UAC code is 601010."),
+    ("Which campus is C10026 taught at?", "It is offered at City campus."),
+    ("What are the fees for C10026?", "The course fee is A$23,220 per session."),
+    ("When does C10026 start?", "It has intakes in February and July."),
+])
+def test_answers_field_lookups(answerer, query, expected):
+    fact = answerer.answer(query)
+    assert fact is not None
+    assert expected in fact.text
+    assert fact.text.startswith(f"{RECORDS[fact.course_code][0]['name']} ({fact.course_code}): ")
+    assert f"[Course Code: {fact.course_code}]" in fact.text
+
+
+def test_course_from_caller(answerer):
+    fact = answerer.answer("How many credit points is it?", course_code="c10026")
+    assert fact is not None and fact.course_code == "C10026"
+
+
+@pytest.mark.parametrize("query", [
+    # Another subject noun: the field would describe the course, not what was asked about
+    "How long are the lectures in C10235?",
+    "How long is each lecture in C10235?",
+    "Can you tell me the duration of each subject in C10026?",
+    "what cps do I need for the major in C10235",
+    "How many credit points is each elective in C10235?",
+    "How much does accommodation cost near C10235?",
+    # More than one clause or intent
+    "Where can I work after C10026, and when does it start?",
+    "How many credit points is C10235 and how long is it?",
+    "How long is C10235? What are the fees?",
+    # Keyword without the question being about that field
+    "I have a lot of work, how long will C10235 feel like?",
+    "Does C10235 cover costing?",
+    "Who teaches C10235?",
+    # Open-ended phrasing
+    "Why does C10235 take 3 years?",
+    "Can I get credit for prior study in C10235?",
+    "How do I apply through UAC for C10235?",
+])
+def test_declines_non_lookups(answerer, query):
+    assert answerer.answer(query) is None
+
+
+@pytest.mark.parametrize("query", [
+    "What are the fees for C10235?",           # "None" in the JSON
+    "What is the CRICOS code of C10026?",
+    "How long does C10026 take part-time?",    # "0 Year(s)"
+    "How many credit points is C99999?",       # unknown course
+    "How many credit points is C10235 or C10026?",
+])
+def test_falls_through_without_a_value(answerer, query):
+    assert answerer.answer(query) is None
+
+
+def test_stats(answerer):
+    answerer.answer("How many credit points is C10235?")
+    answerer.answer("How long is each lecture in C10235?")
+    answerer.answer("Tell me about C10235")
+    snapshot = answerer.snapshot()
+    assert (snapshot["answered"], snapshot["declined"], snapshot["no_intent"]) == (1, 1, 1)
+    assert snapshot["answer_rate"] == round(1 / 3, 4)